@@ -1,12 +1,33 @@
-import datetime
+import atexit
+import bisect
+import copy
+import functools
+import itertools
+import json
+import locale
 import logging
 import logging.config
+import logging.handlers
 import os
+import queue
+import re
+import shutil
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from collections.abc import Mapping
 from contextlib import contextmanager
 from contextvars import ContextVar
 from importlib.util import find_spec
 from logging import CRITICAL, DEBUG, ERROR, INFO, NOTSET, WARNING
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 import pythonjsonlogger
 import yaml
@@ -22,40 +43,73 @@ __all__ = [
     "get_correlation_id",
     "set_correlation_id",
     "correlation_id_context",
+    "generate_correlation_id",
     "add_file_handler",
+    "async_logging_stats",
+    "enable_handler_metrics",
+    "handler_metrics",
+    "handler_metrics_prometheus",
+    "optimize_record_attributes",
+    "read_flight_recorder",
+    "patch_requests",
+    "reload_config",
+    "watch_config",
+    "log_event",
+    "start_log_writer",
+    "run_log_writer",
     "null_logger",
 ]
 
 
-if find_spec("flask"):
-    from flask import g, request
-
 flask_requests_patch = False
-if find_spec("requests"):
-    # Patch requests to forward the correlation ID on every outbound call.
-    # Flask fallback (g.correlation_id) is used only when flask is installed and
-    # a request context is active; otherwise current_correlation_id is used directly.
-    import requests
-
-    def _request_patch(slf, *args, **kwargs):
-        headers = kwargs.pop("headers", {}) or {}
-        correlation_id = current_correlation_id.get()
-        if correlation_id is None and find_spec("flask"):
-            try:
-                from flask import g as _g
-                from flask import has_request_context as _hrc
+_requests_patch_pending = True
 
-                if _hrc() and hasattr(_g, "correlation_id"):
-                    correlation_id = _g.correlation_id
-            except Exception:
-                pass
-        if correlation_id:
-            headers["Correlation-ID"] = correlation_id
-        return slf.request_orig(*args, **kwargs, headers=headers)
 
-    requests.sessions.Session.request_orig = requests.sessions.Session.request
-    requests.sessions.Session.request = _request_patch
-    flask_requests_patch = True
+def _request_patch(slf, *args, **kwargs):
+    # Flask fallback (g.correlation_id) is used only when flask is imported and a
+    # request context is active; otherwise current_correlation_id is used directly.
+    headers = kwargs.pop("headers", {}) or {}
+    correlation_id = current_correlation_id.get()
+    if correlation_id is None:
+        correlation_id = _flask_correlation_id(None)
+    if correlation_id:
+        headers["Correlation-ID"] = correlation_id
+    return slf.request_orig(*args, **kwargs, headers=headers)
+
+
+def patch_requests() -> bool:
+    """Patches requests to forward the correlation ID on every outbound call.
+
+    This is done on import of reconplogger, unless the ``LOGGER_LAZY_IMPORTS``
+    environment variable is enabled. In lazy mode the patch is applied when
+    :func:`flask_app_logger_setup` runs, when a correlation ID is first set, or
+    when this function is called explicitly.
+
+    Returns:
+        Whether requests is patched, i.e. False if requests is not installed.
+    """
+    global flask_requests_patch, _requests_patch_pending
+    _requests_patch_pending = False
+    if not flask_requests_patch and find_spec("requests"):
+        import requests
+
+        requests.sessions.Session.request_orig = requests.sessions.Session.request
+        requests.sessions.Session.request = _request_patch
+        flask_requests_patch = True
+    return flask_requests_patch
+
+
+def _import_flask():
+    global g, request
+    from flask import g, request
+
+
+def __getattr__(name):
+    # In lazy mode the flask symbols are only imported when first accessed.
+    if name in {"g", "request"} and find_spec("flask"):
+        _import_flask()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 reconplogger_format = "%(asctime)s\t%(levelname)s -- %(filename)s:%(lineno)s -- %(message)s"
@@ -65,6 +119,7 @@ reconplogger_default_cfg = {
     "formatters": {
         "plain": {
             "format": reconplogger_format,
+            "class": "reconplogger.PlainFormatter",
         },
         "json": {
             "format": reconplogger_format.replace("asctime", "timestamp"),
@@ -124,6 +179,31 @@ ENV_NAME = "LOGGER_NAME"
 ENV_LEVEL = "LOGGER_LEVEL"
 ENV_ROOT_HANDLER = "LOGGER_ROOT_HANDLER"
 ENV_ROOT_LEVEL = "LOGGER_ROOT_LEVEL"
+ENV_ASYNC = "LOGGER_ASYNC"
+ENV_LAZY_IMPORTS = "LOGGER_LAZY_IMPORTS"
+ENV_SAMPLE_RATE = "LOGGER_SAMPLE_RATE"
+ENV_LOG_WRITER = "LOGGER_LOG_WRITER"
+ENV_WATCH_CFG = "LOGGER_WATCH_CFG"
+ENV_METRICS = "LOGGER_METRICS"
+ENV_SLIM_RECORDS = "LOGGER_SLIM_RECORDS"
+ENV_CACHE_CALLERS = "LOGGER_CACHE_CALLERS"
+
+async_logging_queue_size = 10000
+async_logging_backpressure = "drop_newest"
+async_logging_backpressure_level = "WARNING"
+
+_true_values = {"1", "true", "yes", "on"}
+_false_values = {"0", "false", "no", "off", ""}
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    """Returns the boolean value of an environment variable or the default if not set."""
+    if name not in os.environ:
+        return default
+    value = os.environ[name].strip().lower()
+    if value not in _true_values | _false_values:
+        raise ValueError(f'Invalid boolean value for {name}: "{os.environ[name]}".')
+    return value in _true_values
 
 
 def reset_configs():
@@ -133,6 +213,13 @@ def reset_configs():
     logging can be configured again from scratch.
     """
     global configs_loaded, _primary_logger
+    _stop_async_logging()
+    _stop_log_writer_client()
+    _stop_config_watcher()
+    _disable_handler_metrics()
+    _untrack_request_log_costs()
+    _disable_slim_records()
+    _disable_caller_caching()
     configs_loaded = set()
     _primary_logger = None
 
@@ -147,6 +234,16 @@ def load_config(cfg: Optional[Union[str, dict]] = None):
     Returns:
         The logging package object.
     """
+    cfg_dict = _parse_config(cfg)
+    cfg_hash = _config_hash(cfg_dict)
+    if cfg_hash not in configs_loaded:
+        _apply_config(cfg_dict)
+        configs_loaded.add(cfg_hash)
+
+    return logging
+
+
+def _parse_config(cfg: Optional[Union[str, dict]]) -> dict:
     if cfg is None:
         cfg_dict = reconplogger_default_cfg
     elif isinstance(cfg, dict):
@@ -158,13 +255,14 @@ def load_config(cfg: Optional[Union[str, dict]] = None):
     elif isinstance(cfg, str):
         try:
             if os.path.isfile(cfg):
-                with open(cfg, "r") as f:
-                    cfg_dict = yaml.safe_load(f.read())
+                stat = os.stat(cfg)
+                cfg_dict = _cached_parse(("file", cfg, stat.st_mtime_ns, stat.st_size), lambda: _read_file(cfg))
             elif cfg in os.environ:
-                cfg_dict = yaml.safe_load(os.environ[cfg])
+                value = os.environ[cfg]
+                cfg_dict = _cached_parse(("env", cfg, value), lambda: value)
             else:
                 try:
-                    cfg_dict = yaml.safe_load(cfg)
+                    cfg_dict = _cached_parse(("str", cfg), lambda: cfg)
                     if not isinstance(cfg_dict, dict):
                         raise ValueError
                 except Exception:
@@ -177,13 +275,356 @@ def load_config(cfg: Optional[Union[str, dict]] = None):
             )
 
     cfg_dict["disable_existing_loggers"] = False
+    return cfg_dict
 
-    cfg_hash = yaml.safe_dump(cfg_dict).__hash__()
-    if cfg_hash not in configs_loaded:
-        logging.config.dictConfig(cfg_dict)
-        configs_loaded.add(cfg_hash)
 
-    return logging
+def _read_file(path: str) -> str:
+    with open(path, "r") as f:
+        return f.read()
+
+
+config_parse_cache_size = 32
+_parsed_configs: dict = {}
+
+
+def _cached_parse(key: tuple, read):
+    """Parses a configuration, reusing the result of a previous parse with the same key.
+
+    The key identifies the content, i.e. file path with modification time and size, or
+    environment variable with its value. JSON is parsed without going through the YAML
+    parser. A copy is returned since callers modify it.
+    """
+    parsed = _parsed_configs.get(key)
+    if parsed is None:
+        text = read()
+        if text.lstrip().startswith("{"):
+            try:
+                parsed = json.loads(text)
+            except ValueError:
+                pass
+        if parsed is None:
+            parsed = yaml.safe_load(text)
+        if len(_parsed_configs) >= config_parse_cache_size:
+            _parsed_configs.clear()
+        _parsed_configs[key] = parsed
+    return _copy_config(parsed)
+
+
+def _copy_config(value):
+    if isinstance(value, dict):
+        return {key: _copy_config(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_config(item) for item in value]
+    return value
+
+
+def _freeze_config(value):
+    """Converts a configuration into an equivalent hashable structure independent of dict order."""
+    if isinstance(value, dict):
+        return frozenset((key, _freeze_config(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_config(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return ("unhashable", id(value))
+    return value
+
+
+def _config_hash(cfg_dict: dict) -> int:
+    return hash(_freeze_config(cfg_dict))
+
+
+# Last config applied with a full dictConfig pass or a reload, and the formatter and filter objects created for it
+_applied_config: Optional[dict] = None
+_applied_objects: dict = {"formatters": {}, "filters": {}}
+
+
+def _apply_config(cfg_dict: dict) -> None:
+    global _applied_config, _applied_objects
+    configurator = logging.config.dictConfigClass(cfg_dict)
+    configurator.configure()
+    _applied_config = copy.deepcopy(cfg_dict)
+    # dictConfig replaces in its converted config the formatter and filter configs by the created objects
+    _applied_objects = {
+        key: {name: configurator.config.get(key, {})[name] for name in cfg_dict.get(key, {})}
+        for key in ["formatters", "filters"]
+    }
+    if _handler_metrics_enabled:
+        _instrument_handlers()
+    if _request_log_cost_tracking:
+        _track_request_log_costs()
+    if _slim_records_enabled:
+        _apply_record_attributes()
+
+
+def reload_config(cfg: Optional[Union[str, dict]] = None) -> None:
+    """Applies a changed logging configuration touching only what differs from the applied one.
+
+    Instead of a full ``dictConfig`` pass, which closes and recreates every handler, the new
+    configuration is compared to the last applied one. Levels, and the formatters and filters
+    of handlers and loggers, are changed in place. Only formatters, filters and handlers whose
+    configuration changed are created again. The handlers replaced are swapped in all loggers
+    before being flushed and closed, so no records are lost. Handlers wrapped for async
+    logging or a log writer keep being wrapped. A configuration with a different version or
+    with ``incremental`` is applied with :func:`load_config`.
+
+    Args:
+        cfg: Same as for :func:`load_config`, by default the ``LOGGER_CFG`` environment variable.
+    """
+    global _applied_config, _applied_objects
+    cfg_dict = _parse_config(os.getenv(ENV_CFG) if cfg is None else cfg)
+    old = _applied_config
+    if old is None or old.get("version") != cfg_dict.get("version") or cfg_dict.get("incremental"):
+        load_config(cfg_dict)
+        return
+
+    cfg_dict = copy.deepcopy(cfg_dict)
+    configurator = logging.config.dictConfigClass(copy.deepcopy(cfg_dict))
+    config = configurator.config
+    objects: dict = {}
+    changed = set()
+    with logging._lock:  # type: ignore[attr-defined]
+        # Formatters and filters, reusing the objects of unchanged ones
+        for key, configure in [
+            ("formatters", configurator.configure_formatter),
+            ("filters", configurator.configure_filter),
+        ]:
+            objects[key] = {}
+            section = config.get(key, {})
+            for name, item_cfg in cfg_dict.get(key, {}).items():
+                if old.get(key, {}).get(name) == item_cfg and name in _applied_objects[key]:
+                    section[name] = _applied_objects[key][name]
+                else:
+                    section[name] = configure(section[name])
+                    changed.add((key, name))
+                objects[key][name] = section[name]
+
+        # Handlers, only levels are changed in place
+        handlers = {}
+        replaced = {}
+        old_handlers = old.get("handlers", {})
+        for name, handler_cfg in cfg_dict.get("handlers", {}).items():
+            handler = logging._handlers.get(name)  # type: ignore[attr-defined]
+            old_cfg = old_handlers.get(name)
+            if handler is not None and old_cfg is not None and _handler_key(old_cfg) == _handler_key(handler_cfg):
+                if old_cfg.get("level") != handler_cfg.get("level"):
+                    _set_handler_level(handler, logging._checkLevel(handler_cfg.get("level", NOTSET)))  # type: ignore[attr-defined]
+                if old_cfg.get("formatter") != handler_cfg.get("formatter") or (
+                    ("formatters", handler_cfg.get("formatter")) in changed
+                ):
+                    handler.setFormatter(objects["formatters"].get(handler_cfg.get("formatter")))
+                old_filters = [_applied_objects["filters"].get(f) for f in old_cfg.get("filters", [])]
+                new_filters = [objects["filters"][f] for f in handler_cfg.get("filters", [])]
+                if old_filters != new_filters:
+                    for old_filter in old_filters:
+                        handler.removeFilter(old_filter)
+                    for new_filter in new_filters:
+                        handler.addFilter(new_filter)
+            else:
+                try:
+                    new_handler = configurator.configure_handler(config["handlers"][name])
+                except Exception as ex:
+                    raise ValueError(f'Unable to configure handler "{name}"') from ex
+                if handler is not None:
+                    replaced[handler] = new_handler
+                handler = new_handler
+            handlers[name] = handler
+        for name in old_handlers:
+            if name not in handlers and logging._handlers.get(name) is not None:  # type: ignore[attr-defined]
+                replaced[logging._handlers.pop(name)] = None  # type: ignore[attr-defined]
+
+        # Loggers
+        for lg_obj in _all_loggers():
+            for handler in list(lg_obj.handlers):
+                base = _unwrap_handler(handler)
+                if base in replaced:
+                    _replace_handler(lg_obj, handler, replaced[base])
+        old_loggers = dict(old.get("loggers", {}), **({"": old["root"]} if "root" in old else {}))
+        new_loggers = dict(cfg_dict.get("loggers", {}), **({"": cfg_dict["root"]} if "root" in cfg_dict else {}))
+        for name, logger_cfg in new_loggers.items():
+            old_cfg = old_loggers.get(name, {})
+            lg_obj = logging.getLogger(name or None)
+            if old_cfg.get("level") != logger_cfg.get("level") and "level" in logger_cfg:
+                lg_obj.setLevel(logging._checkLevel(logger_cfg["level"]))  # type: ignore[attr-defined]
+            if name and old_cfg.get("propagate", True) != logger_cfg.get("propagate", True):
+                lg_obj.propagate = logger_cfg.get("propagate", True)
+            old_filters = [_applied_objects["filters"].get(f) for f in old_cfg.get("filters", [])]
+            new_filters = [objects["filters"][f] for f in logger_cfg.get("filters", [])]
+            if old_filters != new_filters:
+                for old_filter in old_filters:
+                    lg_obj.removeFilter(old_filter)
+                for new_filter in new_filters:
+                    lg_obj.addFilter(new_filter)
+            old_names = old_cfg.get("handlers", [])
+            new_names = logger_cfg.get("handlers", [])
+            if old_names != new_names:
+                removed = {handlers[h] for h in old_names if h not in new_names and h in handlers}
+                for handler in list(lg_obj.handlers):
+                    if _unwrap_handler(handler) in removed:
+                        lg_obj.removeHandler(handler)
+                present = {_unwrap_handler(h) for h in lg_obj.handlers}
+                for handler_name in new_names:
+                    if handlers[handler_name] not in present:
+                        lg_obj.addHandler(_wrap_handler(handlers[handler_name], handler_name))
+
+        for handler, async_handler in list(_async_handlers.items()):
+            if _unwrap_handler(handler) in replaced:  # e.g. a wrapper no longer in any logger
+                async_handler.listener.stop()
+                del _async_handlers[handler]
+        for handler in replaced:
+            handler.close()
+        for name, handler in handlers.items():
+            if handler.name != name:
+                handler.name = name  # registers it in logging._handlers
+
+        _applied_config = cfg_dict
+        _applied_objects = objects
+        configs_loaded.add(_config_hash(cfg_dict))
+        if _handler_metrics_enabled:
+            _instrument_handlers()
+
+    if _primary_logger is not None:
+        configure_root_logger()
+    if _request_log_cost_tracking:
+        _track_request_log_costs()
+    if _slim_records_enabled:
+        _apply_record_attributes()
+
+
+_config_reload_requested = threading.Event()
+_config_watcher: Optional[threading.Thread] = None
+_config_watcher_stop = threading.Event()
+
+
+def watch_config(interval: float = 2.0, sighup: bool = True) -> None:
+    """Calls :func:`reload_config` on SIGHUP and when the file named in ``LOGGER_CFG`` changes.
+
+    The file is checked for a changed modification time or size every ``interval`` seconds
+    by a daemon thread, which also does the reloads. The SIGHUP handler only wakes up this
+    thread, thus it is safe to be received while logging. The handler can only be installed
+    from the main thread. Stopped by :func:`reset_configs`.
+
+    Args:
+        interval: Seconds between checks of the configuration file.
+        sighup: Whether to reload on SIGHUP.
+    """
+    global _config_watcher
+    if sighup and hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda *_: _config_reload_requested.set())
+    if _config_watcher is None:
+        _config_watcher_stop.clear()
+        _config_watcher = threading.Thread(
+            target=_watch_config,
+            args=(interval, _config_file_stat(os.getenv(ENV_CFG))),
+            name="reconplogger-config-watcher",
+            daemon=True,
+        )
+        _config_watcher.start()
+
+
+def _config_file_stat(path: Optional[str]):
+    try:
+        stat = os.stat(path)  # type: ignore[arg-type]
+        return stat.st_mtime_ns, stat.st_size
+    except (OSError, TypeError):
+        return None
+
+
+def _watch_config(interval: float, stat) -> None:
+    while True:
+        requested = _config_reload_requested.wait(interval)
+        if _config_watcher_stop.is_set():
+            return
+        _config_reload_requested.clear()
+        current = _config_file_stat(os.getenv(ENV_CFG))
+        if requested or current != stat:
+            stat = current
+            try:
+                reload_config()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+
+def _stop_config_watcher() -> None:
+    global _config_watcher
+    if _config_watcher is not None:
+        _config_watcher_stop.set()
+        _config_reload_requested.set()
+        _config_watcher.join()
+        _config_reload_requested.clear()
+        _config_watcher = None
+
+
+def _handler_key(handler_cfg: dict) -> dict:
+    """The part of a handler config whose change requires creating the handler again."""
+    return {key: value for key, value in handler_cfg.items() if key not in {"level", "formatter", "filters"}}
+
+
+def _wrap_handler(handler: logging.Handler, name: str) -> logging.Handler:
+    """Wraps a configured handler like the others when a log writer or async logging is active."""
+    if _log_writer_client is not None and not isinstance(handler, _local_handlers):
+        handler = _LogWriterHandler(handler, name)
+    if _async_handlers and not isinstance(handler, _local_handlers):
+        handler = _queue_handler(handler)
+    return handler
+
+
+def _unwrap_handler(handler: logging.Handler) -> logging.Handler:
+    while isinstance(handler, (_AsyncQueueHandler, _LogWriterHandler)):
+        handler = handler.handler
+    return handler
+
+
+def _installed_handler(handler: logging.Handler, name: str) -> logging.Handler:
+    """Returns the wrapper around a configured handler already in some logger, or wraps it if there is none."""
+    for lg_obj in _all_loggers():
+        for installed in lg_obj.handlers:
+            if installed is not handler and _unwrap_handler(installed) is handler:
+                return installed
+    return _wrap_handler(handler, name)
+
+
+def _set_handler_level(handler: logging.Handler, level: int) -> None:
+    """Sets the level of a handler and of the async and log writer wrappers around it."""
+    handler.setLevel(level)
+    for lg_obj in _all_loggers():
+        for wrapper in lg_obj.handlers:
+            if wrapper is not handler and _unwrap_handler(wrapper) is handler:
+                while wrapper is not handler:
+                    wrapper.setLevel(level)
+                    wrapper = wrapper.handler
+
+
+def _replace_handler(logger: logging.Logger, handler: logging.Handler, new: Optional[logging.Handler]) -> None:
+    """Replaces in a logger a handler, or the one inside its wrappers, by a new one, or removes it if None."""
+    if new is None:
+        logger.removeHandler(handler)
+        if isinstance(handler, _AsyncQueueHandler) and handler.listener._thread is not None:
+            handler.listener.stop()
+            _async_handlers.pop(handler.handler, None)
+        return
+    if not isinstance(handler, (_AsyncQueueHandler, _LogWriterHandler)):
+        logger.handlers = [new if h is handler else h for h in logger.handlers]
+        return
+    wrapper = handler
+    wrapper.setLevel(new.level)
+    while isinstance(wrapper.handler, (_AsyncQueueHandler, _LogWriterHandler)):
+        wrapper = wrapper.handler
+        wrapper.setLevel(new.level)
+    if isinstance(wrapper, _AsyncQueueHandler):
+        # Drains the queue into the old handler, records logged meanwhile wait in the queue
+        wrapper.listener.stop()
+        _async_handlers[new] = _async_handlers.pop(wrapper.handler, wrapper)
+        wrapper.handler = new
+        queue_size, policy, level = _backpressure_config(new)
+        wrapper.queue.maxsize = queue_size
+        wrapper.set_backpressure(policy, level)
+        wrapper.listener.handlers = (new,)
+        wrapper.listener.start()
+    else:
+        wrapper.handler = new
 
 
 def replace_logger_handlers(
@@ -214,12 +655,435 @@ def replace_logger_handlers(
     logger.handlers = list(handlers)
 
 
+class BufferedFileHandler(logging.FileHandler):
+    """File handler that groups records into large writes instead of writing and flushing each one.
+
+    The buffered records are written when their size reaches ``buffer_size`` characters, every
+    ``flush_interval`` seconds, when a record with level ``flush_level`` or higher is emitted, and
+    when the handler is closed, including at interpreter shutdown. Being a ``FileHandler``, it is
+    kept by :func:`configure_root_logger` when stream handlers are removed.
+
+    Args:
+        filename: Path to the log file.
+        mode: Mode in which to open the file.
+        encoding: Encoding of the file.
+        delay: Whether to delay opening the file until the first write.
+        errors: How encoding errors are handled.
+        buffer_size: Number of characters buffered before they are written.
+        flush_interval: Seconds between periodic writes of the buffer, None to disable.
+        flush_level: Records with this level or higher are written immediately.
+    """
+
+    def __init__(
+        self,
+        filename,
+        mode: str = "a",
+        encoding: Optional[str] = None,
+        delay: bool = False,
+        errors: Optional[str] = None,
+        buffer_size: int = 65536,
+        flush_interval: Optional[float] = 1.0,
+        flush_level: Union[str, int] = "ERROR",
+    ):
+        if flush_level not in logging_levels:
+            raise ValueError('Invalid logging level: "' + str(flush_level) + '".')
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = logging_levels[flush_level]
+        self._buffer: list = []
+        self._buffered = 0
+        self._stop_flushing = threading.Event()
+        super().__init__(filename, mode, encoding, delay, errors)
+        if flush_interval:
+            # Only a weak reference, so that a handler dropped without close can be collected
+            threading.Thread(
+                target=self._flush_periodically,
+                args=(weakref.ref(self), self._stop_flushing, flush_interval),
+                daemon=True,
+            ).start()
+
+    @staticmethod
+    def _flush_periodically(handler_ref: weakref.ref, stop: threading.Event, interval: float):
+        while not stop.wait(interval):
+            handler = handler_ref()
+            if handler is None:
+                return
+            try:
+                handler.flush()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+            del handler
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            with self.lock:
+                self._buffer.append(msg)
+                self._buffered += len(msg)
+                if self._buffered >= self.buffer_size or record.levelno >= self.flush_level:
+                    self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if self._buffer:
+                data = "".join(self._buffer)
+                self._buffer.clear()
+                self._buffered = 0
+                if self.stream is None and (self.mode != "w" or not self._closed):
+                    self.stream = self._open()
+                if self.stream:
+                    self.stream.write(data)
+            super().flush()
+
+    def close(self):
+        self._stop_flushing.set()
+        with self.lock:
+            self.flush()
+            super().close()
+
+
+def _zstd_open(path: str):
+    if sys.version_info >= (3, 14):
+        from compression import zstd
+
+        return zstd.open(path, "wb")
+    import zstandard
+
+    return zstandard.open(path, "wb")
+
+
+def _gzip_open(path: str):
+    import gzip
+
+    return gzip.open(path, "wb")
+
+
+_compressors = {"gzip": (".gz", _gzip_open), "zstd": (".zst", _zstd_open)}
+_rotation_jobs: queue.Queue = queue.Queue()
+_rotation_worker: Optional[threading.Thread] = None
+
+
+def _run_rotation_jobs():
+    while True:
+        job = _rotation_jobs.get()
+        try:
+            job()
+        except Exception:
+            if logging.raiseExceptions:
+                traceback.print_exc(file=sys.stderr)
+        finally:
+            _rotation_jobs.task_done()
+
+
+def _submit_rotation_job(job):
+    """Runs a job in the background thread that compresses and removes rotated log files."""
+    global _rotation_worker
+    if _rotation_worker is None:
+        _rotation_worker = threading.Thread(target=_run_rotation_jobs, name="reconplogger-rotation", daemon=True)
+        _rotation_worker.start()
+        atexit.register(_rotation_jobs.join)
+    _rotation_jobs.put(job)
+
+
+class RotatingFileHandler(BufferedFileHandler):
+    """File handler that rotates by size and/or time and compresses rotated files in a background thread.
+
+    Rotated files get as suffix the time of rotation, e.g. ``app.log.20240131-235959``. Compression
+    and removal of old files are done by a background thread, so that emitting never waits for them.
+    By default records are written immediately, see :class:`BufferedFileHandler` for the buffering
+    arguments. Being a ``FileHandler``, it is kept by :func:`configure_root_logger` when stream
+    handlers are removed.
+
+    Args:
+        filename: Path to the log file.
+        max_bytes: Rotate when the file would exceed this many bytes, 0 to disable.
+        interval: Rotate when this many seconds passed since the file was started, None to disable.
+        backup_count: Number of rotated files to keep, 0 to keep all.
+        max_age: Remove rotated files older than this many seconds, None to keep all.
+        compress: Compression of rotated files, ``"gzip"``, ``"zstd"`` or None.
+        buffer_size: Number of characters buffered before they are written.
+        flush_interval: Seconds between periodic writes of the buffer, None to disable.
+        kwargs: Other arguments for :class:`BufferedFileHandler`.
+    """
+
+    def __init__(
+        self,
+        filename,
+        max_bytes: int = 0,
+        interval: Optional[float] = None,
+        backup_count: int = 0,
+        max_age: Optional[float] = None,
+        compress: Optional[str] = None,
+        buffer_size: int = 0,
+        flush_interval: Optional[float] = None,
+        **kwargs,
+    ):
+        if compress is not None and compress not in _compressors:
+            raise ValueError(f'Invalid compress: "{compress}". Expected one of {list(_compressors)}.')
+        if compress == "zstd" and sys.version_info < (3, 14) and not find_spec("zstandard"):
+            raise ImportError('compress="zstd" requires the zstandard package.')
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.max_age = max_age
+        self.compress = compress
+        super().__init__(filename, buffer_size=buffer_size, flush_interval=flush_interval, **kwargs)
+        self._size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        started = os.path.getmtime(self.baseFilename) if self._size else time.time()
+        self._rollover_at = started + interval if interval else None
+        self._rotated = ("", 0)
+        encoding = self.encoding
+        if encoding in {None, "locale"}:
+            encoding = locale.getpreferredencoding(False)
+        self._file_encoding = encoding
+        self._ascii_single_bytes = "a".encode(encoding) == b"a"
+
+    def _encoded_size(self, texts: list) -> int:
+        """Number of bytes that the given texts take in the file."""
+        if self._ascii_single_bytes:
+            return sum(
+                len(text) if text.isascii() else len(text.encode(self._file_encoding, "replace")) for text in texts
+            )
+        return sum(len(text.encode(self._file_encoding, "replace")) for text in texts)
+
+    def flush(self):
+        with self.lock:
+            if self._buffer:
+                size = self._encoded_size(self._buffer)
+                if self.shouldRollover(size):
+                    self.doRollover()
+                self._size += size
+            super().flush()
+
+    def shouldRollover(self, size: int) -> bool:
+        """Whether the file should be rotated before writing the given number of bytes."""
+        if self._size == 0:
+            return False
+        if self.max_bytes and self._size + size > self.max_bytes:
+            return True
+        return self._rollover_at is not None and time.time() >= self._rollover_at
+
+    def doRollover(self):
+        """Renames the current file and submits its compression and the cleanup of old files."""
+        with self.lock:
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            # Rotations within the same second get a number suffix: .1, .2, ...
+            timestamp = f"{self.baseFilename}.{time.strftime('%Y%m%d-%H%M%S')}"
+            num = self._rotated[1] + 1 if timestamp == self._rotated[0] else 0
+            rotated = f"{timestamp}.{num}" if num else timestamp
+            while any(os.path.exists(rotated + extension) for extension in ["", ".gz", ".zst"]):
+                num += 1
+                rotated = f"{timestamp}.{num}"
+            self._rotated = (timestamp, num)
+            os.rename(self.baseFilename, rotated)
+            self._size = 0
+            if self.interval:
+                self._rollover_at = time.time() + self.interval
+            if not self.delay:
+                self.stream = self._open()
+        _submit_rotation_job(lambda: self._process_rotated(rotated))
+
+    def _process_rotated(self, rotated: str):
+        if self.compress and os.path.exists(rotated):
+            extension, open_compressed = _compressors[self.compress]
+            with open(rotated, "rb") as source, open_compressed(rotated + extension) as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+        self._remove_old_files()
+
+    def rotated_files(self) -> list:
+        """Returns the paths of the rotated files, oldest first."""
+        dirname, basename = os.path.split(self.baseFilename)
+        prefix = basename + "."
+        rotated = []
+        for name in os.listdir(dirname):
+            suffix = name[len(prefix) :].split(".")
+            if name.startswith(prefix) and suffix[0][:1].isdigit():
+                num = int(suffix[1]) if len(suffix) > 1 and suffix[1].isdigit() else 0
+                rotated.append(((suffix[0], num), os.path.join(dirname, name)))
+        return [path for _, path in sorted(rotated)]
+
+    def _remove_old_files(self):
+        rotated = self.rotated_files()
+        remove = rotated[: -self.backup_count] if self.backup_count else []
+        if self.max_age is not None:
+            oldest = time.time() - self.max_age
+            remove += [path for path in rotated if path not in remove and os.path.getmtime(path) < oldest]
+        for path in remove:
+            os.remove(path)
+
+
+# Flight recorder files: a header with magic, version and data size, followed by a ring of frames.
+# Frames are a magic, payload length, sequence number and crc32 of the utf-8 payload.
+_recorder_header = struct.Struct(">4sII")
+_recorder_frame = struct.Struct(">2sIQI")
+_RECORDER_MAGIC = b"RLFR"
+_RECORDER_FRAME_MAGIC = b"\xf1\x7e"
+_recorders: weakref.WeakSet = weakref.WeakSet()
+
+
+class FlightRecorderHandler(logging.Handler):
+    """Handler that keeps the most recent formatted records in a memory-mapped ring file.
+
+    Records are copied into a shared memory mapping of a file of fixed size, thus there is
+    no system call per record and the content survives the process being killed, e.g. by
+    SIGKILL or the OOM killer, though not a crash of the machine. When the ring is full the
+    oldest records are overwritten. The records are read back in order with
+    :func:`read_flight_recorder`.
+
+    A ``{pid}`` in the filename is replaced by the process ID, so that each process,
+    including forked ones, writes its own file. Without it, forked processes write to the
+    path followed by ``.`` and their process ID, so that the parent's file is kept. If that
+    file can't be created, the recorder of the forked process is disabled. Records
+    longer than a quarter of the size are truncated. Its level is kept when
+    :func:`logger_setup` overrides the level of handlers, and it is not moved behind queues
+    by async logging, so that it can be left at DEBUG while other handlers log at higher
+    levels.
+
+    Args:
+        filename: Path of the ring file, optionally with a ``{pid}`` placeholder.
+        size: Size in bytes of the ring.
+        level: Logging level of the handler.
+    """
+
+    def __init__(self, filename: str, size: int = 4 * 1024 * 1024, level: Union[str, int] = NOTSET):
+        if level not in logging_levels:
+            raise ValueError('Invalid logging level: "' + str(level) + '".')
+        if size < 1024:
+            raise ValueError(f"Expected size to be at least 1024 bytes, got {size}.")
+        super().__init__(logging_levels[level])
+        self.filename = filename
+        self.size = size
+        self._mmap = None
+        self._open(os.path.abspath(filename.format(pid=os.getpid())))
+        _recorders.add(self)
+
+    def _open(self, path: str):
+        import mmap
+
+        self.path = path
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, _recorder_header.size + self.size)
+            self._mmap = mmap.mmap(fd, _recorder_header.size + self.size)
+        finally:
+            os.close(fd)
+        _recorder_header.pack_into(self._mmap, 0, _RECORDER_MAGIC, 1, self.size)
+        self._position = 0
+        self._sequence = 0
+
+    def emit(self, record):
+        mm = self._mmap
+        if mm is None:  # closed, or disabled in a forked process
+            return
+        try:
+            data = self.format(record).encode(errors="backslashreplace")[: self.size // 4]
+            frame_size = _recorder_frame.size + len(data)
+            offset = _recorder_header.size
+            position = self._position
+            if position + frame_size <= self.size:
+                _recorder_frame.pack_into(
+                    mm, offset + position, _RECORDER_FRAME_MAGIC, len(data), self._sequence, zlib.crc32(data)
+                )
+                start = offset + position + _recorder_frame.size
+                mm[start : start + len(data)] = data
+            else:
+                # The frame wraps around the end of the ring
+                frame = _recorder_frame.pack(_RECORDER_FRAME_MAGIC, len(data), self._sequence, zlib.crc32(data)) + data
+                split = self.size - position
+                mm[offset + position : offset + self.size] = frame[:split]
+                mm[offset : offset + frame_size - split] = frame[split:]
+            self._position = (position + frame_size) % self.size
+            self._sequence += 1
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        with self.lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+        _recorders.discard(self)
+        super().close()
+
+
+# Handlers that stay in the process instead of going behind async queues or to a log writer
+_local_handlers = (logging.NullHandler, FlightRecorderHandler)
+
+
+def _reopen_recorders_after_fork():
+    for recorder in list(_recorders):
+        if recorder._mmap is not None:
+            recorder._mmap.close()
+            recorder._mmap = None
+            if "{pid}" in recorder.filename:
+                path = os.path.abspath(recorder.filename.format(pid=os.getpid()))
+            else:  # never truncate the parent's file
+                path = f"{recorder.path}.{os.getpid()}"
+            try:
+                recorder._open(path)
+            except OSError:  # e.g. directory removed or disk full, the recorder stays disabled
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_recorders_after_fork)
+
+
+def read_flight_recorder(path: str) -> List[str]:
+    """Returns in order the records found in a file written by :class:`FlightRecorderHandler`.
+
+    The ring is scanned for frames, those partially overwritten are detected by their crc32
+    and skipped. It can also be run from the command line as
+    ``python -m reconplogger FILE``.
+
+    Args:
+        path: Path to the flight recorder file.
+
+    Raises:
+        ValueError: If the file is not a flight recorder file.
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    if len(content) < _recorder_header.size:
+        raise ValueError(f'"{path}" is not a flight recorder file.')
+    magic, _, size = _recorder_header.unpack_from(content)
+    if magic != _RECORDER_MAGIC or len(content) != _recorder_header.size + size:
+        raise ValueError(f'"{path}" is not a flight recorder file.')
+    ring = content[_recorder_header.size :]
+    doubled = ring + ring  # so that frames that wrap around the end can be read contiguously
+    frames = {}
+    position = doubled.find(_RECORDER_FRAME_MAGIC)
+    while 0 <= position < size:
+        _, length, sequence, crc = _recorder_frame.unpack_from(doubled, position)
+        start = position + _recorder_frame.size
+        data = doubled[start : start + length]
+        if length <= size // 4 and len(data) == length and zlib.crc32(data) == crc:
+            frames[sequence] = data.decode(errors="replace")
+            position = doubled.find(_RECORDER_FRAME_MAGIC, start + length)
+        else:
+            position = doubled.find(_RECORDER_FRAME_MAGIC, position + 1)
+    return [frames[sequence] for sequence in sorted(frames)]
+
+
 def add_file_handler(
     logger: logging.Logger,
     file_path: str,
     format: str = reconplogger_format,
     level: Optional[str] = "DEBUG",
-) -> logging.FileHandler:
+    buffered: bool = False,
+    max_bytes: int = 0,
+    interval: Optional[float] = None,
+    backup_count: int = 0,
+    max_age: Optional[float] = None,
+    compress: Optional[str] = None,
+) -> logging.Handler:
     """Adds a file handler to a given logger.
 
     Args:
@@ -227,20 +1091,840 @@ def add_file_handler(
         file_path: Path to log file for handler.
         format: Format for logging.
         level: Logging level for the handler.
+        buffered: Whether to use a :class:`BufferedFileHandler` which groups records into large writes.
+        max_bytes: Rotate when the file would exceed this many bytes, see :class:`RotatingFileHandler`.
+        interval: Rotate when this many seconds passed since the file was started.
+        backup_count: Number of rotated files to keep, 0 to keep all.
+        max_age: Remove rotated files older than this many seconds.
+        compress: Compression of rotated files, ``"gzip"``, ``"zstd"`` or None.
 
     Returns:
         The handler object which could be used for removeHandler.
     """
-    file_handler = logging.FileHandler(file_path)
-    file_handler.setFormatter(logging.Formatter(format))
+    spec = {
+        "file_path": file_path,
+        "buffered": buffered,
+        "max_bytes": max_bytes,
+        "interval": interval,
+        "backup_count": backup_count,
+        "max_age": max_age,
+        "compress": compress,
+    }
+    # With a log writer the file is opened locally only if the writer is lost
+    file_handler: logging.Handler = _file_handler(**spec, delay=_log_writer_client is not None)
+    file_handler.setFormatter(PlainFormatter(format))
     if level is not None:
         if level not in logging_levels:
             raise ValueError('Invalid logging level: "' + str(level) + '".')
         file_handler.setLevel(logging_levels[level])
+    if _handler_metrics_enabled:
+        _instrument_handler(file_handler, "file:" + os.path.abspath(file_path))
+    if _log_writer_client is not None:
+        file_handler = _LogWriterHandler(file_handler, "file:" + os.path.abspath(file_path), spec)
+    if _async_handlers:
+        file_handler = _queue_handler(file_handler)
+    if _request_log_cost_tracking:
+        _track_request_log_cost(file_handler)
     logger.addHandler(file_handler)
+    if _slim_records_enabled:
+        _apply_record_attributes()
     return file_handler
 
 
+def _file_handler(
+    file_path: str,
+    buffered: bool,
+    max_bytes: int,
+    interval: Optional[float],
+    backup_count: int,
+    max_age: Optional[float],
+    compress: Optional[str],
+    delay: bool = False,
+) -> logging.FileHandler:
+    if max_bytes or interval:
+        buffering = {"buffer_size": 65536, "flush_interval": 1.0} if buffered else {}
+        return RotatingFileHandler(
+            file_path,
+            max_bytes=max_bytes,
+            interval=interval,
+            backup_count=backup_count,
+            max_age=max_age,
+            compress=compress,
+            delay=delay,
+            **buffering,
+        )
+    elif buffered:
+        return BufferedFileHandler(file_path, delay=delay)
+    return logging.FileHandler(file_path, delay=delay)
+
+
+class _AsyncQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Block instead of failing when the bounded queue is full at shutdown.
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+_backpressure_policies = {"block", "drop_newest", "drop_oldest", "drop_below_level"}
+
+
+class _AsyncQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that hands records over to a listener thread which runs the wrapped handler.
+
+    The queue is bounded and ``policy`` decides what happens when it is full:
+
+    - ``drop_newest``: the record is dropped.
+    - ``drop_oldest``: the oldest queued record is dropped to make room.
+    - ``drop_below_level``: records below ``level`` are dropped. The others take the place
+      of the oldest queued record below ``level``, or if there is none, those of ERROR or
+      higher wait for room and the rest are dropped.
+    - ``block``: the logging thread waits for room.
+
+    The number of dropped records is kept in ``dropped`` and of waits for room in ``blocked``.
+    """
+
+    def __init__(
+        self,
+        handler: logging.Handler,
+        queue_size: int,
+        policy: str = "drop_newest",
+        level: Union[str, int] = WARNING,
+    ):
+        super().__init__(queue.Queue(queue_size))
+        self.handler = handler
+        self.dropped = 0
+        self.blocked = 0
+        self.set_backpressure(policy, level)
+        self.setLevel(handler.level)
+        self.listener = _AsyncQueueListener(self.queue, handler)
+
+    def set_backpressure(self, policy: str, level: Union[str, int]):
+        if policy not in _backpressure_policies:
+            raise ValueError(
+                f'Invalid backpressure policy "{policy}", expected one of {sorted(_backpressure_policies)}.'
+            )
+        if level not in logging_levels:
+            raise ValueError('Invalid logging level: "' + str(level) + '".')
+        self.policy = policy
+        self.policy_level = logging_levels[level]
+
+    def prepare(self, record):
+        # Merge the arguments in the calling thread since they could be mutated afterwards.
+        # Formatting, including exc_info, is left to the formatter of the wrapped handler.
+        if record.args:
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+        elif isinstance(record.msg, _EventMessage):
+            record.msg.fields()  # evaluate the lazy fields in the calling thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        policy = self.policy
+        if policy == "drop_oldest":
+            if self._replace_oldest(record):
+                return
+        elif policy == "drop_below_level":
+            if record.levelno >= self.policy_level and self._replace_oldest(record, self.policy_level):
+                return
+            if record.levelno >= ERROR:
+                policy = "block"
+        if policy == "block":
+            self.blocked += 1
+            self.queue.put(record)
+        else:
+            self.dropped += 1
+
+    def _replace_oldest(self, record, below: Optional[int] = None) -> bool:
+        """Replaces the oldest queued record, or the oldest with level lower than below, by the given one."""
+        with self.queue.mutex:
+            records = self.queue.queue  # type: ignore[attr-defined]
+            for index, queued in enumerate(records):
+                if queued is not None and (below is None or queued.levelno < below):
+                    del records[index]
+                    records.append(record)
+                    self.queue.not_empty.notify()
+                    self.dropped += 1
+                    return True
+        return False
+
+    def flush(self):
+        if self.listener._thread is not None:
+            self.queue.join()
+        self.handler.flush()
+
+    def close(self):
+        self.listener.stop()
+        self.handler.close()
+        super().close()
+
+
+_async_handlers: dict = {}
+
+
+def _queue_handler(handler: logging.Handler) -> _AsyncQueueHandler:
+    """Returns the queue handler for a given handler, creating and starting it if needed.
+
+    The size of the queue and the backpressure policy are taken from the ``queue_size``,
+    ``backpressure`` and ``backpressure_level`` attributes of the handler, which can be
+    set with the ``.`` key of its config, and if not set from the module defaults.
+    """
+    async_handler = _async_handlers.get(handler)
+    if async_handler is None:
+        async_handler = _AsyncQueueHandler(handler, *_backpressure_config(handler))
+        async_handler.listener.start()
+        _async_handlers[handler] = async_handler
+    return async_handler
+
+
+def _backpressure_config(handler: logging.Handler) -> tuple:
+    return (
+        getattr(handler, "queue_size", async_logging_queue_size),
+        getattr(handler, "backpressure", async_logging_backpressure),
+        getattr(handler, "backpressure_level", async_logging_backpressure_level),
+    )
+
+
+def async_logging_stats() -> dict:
+    """Returns by handler name the backpressure policy, queue state and counters of async logging.
+
+    For each handler behind a queue there are ``policy``, ``queue_size``, the number of
+    records currently ``queued``, the number of records ``dropped`` and the number of
+    times a logging thread waited for room (``blocked``). Handlers without name, e.g. added
+    with :func:`add_file_handler`, are named ``file:<path>`` or by their class.
+    """
+    stats = {}
+    for handler, async_handler in list(_async_handlers.items()):
+        name = handler.name or (
+            "file:" + handler.baseFilename if isinstance(handler, logging.FileHandler) else type(handler).__name__
+        )
+        stats[name] = {
+            "policy": async_handler.policy,
+            "queue_size": async_handler.queue.maxsize,
+            "queued": async_handler.queue.qsize(),
+            "dropped": async_handler.dropped,
+            "blocked": async_handler.blocked,
+        }
+    return stats
+
+
+def _all_loggers() -> list:
+    loggers = [lg for lg in logging.Logger.manager.loggerDict.values() if isinstance(lg, logging.Logger)]
+    return [logging.getLogger()] + loggers
+
+
+def _start_async_logging() -> None:
+    """Puts the configured handlers of all loggers behind bounded queues served by listener threads."""
+    configured = set(logging._handlers.values())  # type: ignore[attr-defined]
+    for lg_obj in _all_loggers():
+        lg_obj.handlers = [
+            _queue_handler(handler)
+            if (handler in configured and not isinstance(handler, _local_handlers))
+            or isinstance(handler, _LogWriterHandler)
+            else handler
+            for handler in lg_obj.handlers
+        ]
+
+
+def _stop_async_logging() -> None:
+    """Flushes the queues, stops the listener threads and restores the original handlers."""
+    if not _async_handlers:
+        return
+    originals = {async_handler: handler for handler, async_handler in _async_handlers.items()}
+    for async_handler in originals:
+        async_handler.listener.stop()
+    for lg_obj in _all_loggers():
+        lg_obj.handlers = [originals.get(handler, handler) for handler in lg_obj.handlers]
+    _async_handlers.clear()
+
+
+# Upper bounds in nanoseconds of the buckets of the stage latency histograms of handler metrics
+handler_metrics_buckets = (1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000, 10000000, 100000000)
+_metrics_stages = ("filter", "format", "emit")
+_handler_metrics: dict = {}
+_handler_metrics_enabled = False
+
+
+class _HandlerMetrics:
+    """Record counts by level, errors and latency histograms of the stages of a handler.
+
+    All the counters are updated, and read by :meth:`snapshot`, while holding the lock of
+    the metrics, thus snapshots are consistent.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.records: dict = {}
+        self.filtered = 0
+        self.errors = 0
+        self.counts = {stage: [0] * (len(handler_metrics_buckets) + 1) for stage in _metrics_stages}
+        self.sums = dict.fromkeys(_metrics_stages, 0)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            snapshot = {"records": dict(self.records), "filtered": self.filtered, "errors": self.errors}
+            for stage in _metrics_stages:
+                cumulative = list(itertools.accumulate(self.counts[stage]))
+                snapshot[stage] = {
+                    "count": cumulative[-1],
+                    "sum_ns": self.sums[stage],
+                    "buckets": dict(zip(handler_metrics_buckets + (float("inf"),), cumulative)),
+                }
+        return snapshot
+
+
+def _instrument_handler(handler: logging.Handler, name: Optional[str] = None) -> None:
+    """Replaces on the handler instance its filter, format, emit and handleError methods by timed ones."""
+    if handler in _handler_metrics or isinstance(handler, logging.NullHandler):
+        return
+    metrics = _HandlerMetrics(name or handler.name or type(handler).__name__)
+    clock = time.perf_counter_ns
+    bucket = functools.partial(bisect.bisect_left, handler_metrics_buckets)
+    records, counts, sums = metrics.records, metrics.counts, metrics.sums
+    filter_counts, format_counts, emit_counts = counts["filter"], counts["format"], counts["emit"]
+    filter_, format_, emit, handle_error = handler.filter, handler.format, handler.emit, handler.handleError
+
+    def timed_filter(record):
+        if not handler.filters:
+            return True
+        start = clock()
+        result = filter_(record)
+        elapsed = clock() - start
+        with metrics.lock:
+            filter_counts[bucket(elapsed)] += 1
+            sums["filter"] += elapsed
+            if not result:
+                metrics.filtered += 1
+        return result
+
+    def timed_format(record):
+        start = clock()
+        text = format_(record)
+        elapsed = clock() - start
+        with metrics.lock:
+            format_counts[bucket(elapsed)] += 1
+            sums["format"] += elapsed
+        return text
+
+    def timed_emit(record):
+        start = clock()
+        emit(record)
+        elapsed = clock() - start
+        with metrics.lock:
+            emit_counts[bucket(elapsed)] += 1
+            sums["emit"] += elapsed
+            records[record.levelname] = records.get(record.levelname, 0) + 1
+
+    def counted_handle_error(record):
+        with metrics.lock:
+            metrics.errors += 1
+        handle_error(record)
+
+    handler.filter = timed_filter  # type: ignore[method-assign]
+    handler.format = timed_format  # type: ignore[method-assign]
+    handler.emit = timed_emit  # type: ignore[method-assign]
+    handler.handleError = counted_handle_error  # type: ignore[method-assign]
+    _handler_metrics[handler] = metrics
+
+
+def _instrument_handlers() -> None:
+    """Instruments the named handlers, i.e. those configured with :func:`load_config`."""
+    for handler in list(logging._handlers.values()):  # type: ignore[attr-defined]
+        _instrument_handler(_unwrap_handler(handler))
+
+
+def enable_handler_metrics() -> None:
+    """Starts collecting metrics of the handlers, see :func:`handler_metrics`.
+
+    Instruments the handlers configured with :func:`load_config`, including those
+    installed on the root by :func:`configure_root_logger`, and the ones added later by
+    :func:`load_config`, :func:`reload_config` and :func:`add_file_handler`. Until enabled
+    handlers are not touched, thus there is no overhead. Enabled by :func:`logger_setup`
+    when the ``LOGGER_METRICS`` environment variable is set, and disabled by
+    :func:`reset_configs`.
+    """
+    global _handler_metrics_enabled
+    _handler_metrics_enabled = True
+    _instrument_handlers()
+
+
+def _disable_handler_metrics() -> None:
+    global _handler_metrics_enabled
+    _handler_metrics_enabled = False
+    for handler in _handler_metrics:
+        for method in ["filter", "format", "emit", "handleError"]:
+            handler.__dict__.pop(method, None)
+    _handler_metrics.clear()
+
+
+def handler_metrics() -> dict:
+    """Returns a snapshot of the metrics of the instrumented handlers, by handler name.
+
+    For each handler there are the counts of emitted records by level name (``records``),
+    of records rejected by its filters (``filtered``), of errors while emitting
+    (``errors``) and of records dropped because its async queue was full (``dropped``).
+    For each of the ``filter``, ``format`` and ``emit`` stages there is a latency histogram
+    as a dict with ``count``, ``sum_ns`` and cumulative counts in ``buckets`` by upper bound
+    in nanoseconds. The emit stage includes the format stage, and the filter stage is only
+    timed for handlers that have filters. Handlers are named as in the
+    configuration, files added by :func:`add_file_handler` as ``file:<path>``. Closed
+    handlers, e.g. replaced by a reload, are no longer reported.
+    """
+    snapshot: dict = {}
+    for handler, metrics in list(_handler_metrics.items()):
+        if getattr(handler, "_closed", False):
+            _handler_metrics.pop(handler, None)
+            continue
+        name = metrics.name
+        while name in snapshot:
+            name += "'"
+        async_handler = _async_handlers.get(handler)
+        snapshot[name] = {
+            "class": type(handler).__name__,
+            **metrics.snapshot(),
+            "dropped": 0 if async_handler is None else async_handler.dropped,
+        }
+    return snapshot
+
+
+def _prometheus_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def handler_metrics_prometheus() -> str:
+    """Returns the snapshot of :func:`handler_metrics` in the Prometheus text exposition format."""
+    snapshot = handler_metrics()
+    lines = []
+    counters = [
+        ("records", "Records emitted by the handler."),
+        ("filtered", "Records rejected by the filters of the handler."),
+        ("errors", "Errors while emitting records."),
+        ("dropped", "Records dropped because the async queue of the handler was full."),
+    ]
+    for key, help_text in counters:
+        lines += [
+            f"# HELP reconplogger_handler_{key}_total {help_text}",
+            f"# TYPE reconplogger_handler_{key}_total counter",
+        ]
+        for name, metrics in snapshot.items():
+            label = f'handler="{_prometheus_label(name)}"'
+            if key == "records":
+                for level, count in metrics["records"].items():
+                    lines.append(f'reconplogger_handler_records_total{{{label},level="{level}"}} {count}')
+            else:
+                lines.append(f"reconplogger_handler_{key}_total{{{label}}} {metrics[key]}")
+    lines += [
+        "# HELP reconplogger_handler_stage_seconds Time spent by handlers in each stage, emit includes format.",
+        "# TYPE reconplogger_handler_stage_seconds histogram",
+    ]
+    for name, metrics in snapshot.items():
+        for stage in _metrics_stages:
+            label = f'handler="{_prometheus_label(name)}",stage="{stage}"'
+            for bound, count in metrics[stage]["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound / 1e9)
+                lines.append(f'reconplogger_handler_stage_seconds_bucket{{{label},le="{le}"}} {count}')
+            lines.append(f"reconplogger_handler_stage_seconds_sum{{{label}}} {metrics[stage]['sum_ns'] / 1e9!r}")
+            lines.append(f"reconplogger_handler_stage_seconds_count{{{label}}} {metrics[stage]['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# Frames sent to the log writer: kind, level, name length, text length, then name and text
+_writer_frame = struct.Struct(">BHHI")
+_WRITER_RECORD = 0
+_WRITER_REGISTER = 1
+
+
+def _pack_writer_frame(kind: int, levelno: int, name: str, text: str) -> bytes:
+    name_bytes = name.encode()
+    text_bytes = text.encode(errors="backslashreplace")
+    return _writer_frame.pack(kind, levelno, len(name_bytes), len(text_bytes)) + name_bytes + text_bytes
+
+
+class _LogWriterClient:
+    """Connection of a process to the log writer, shared by all its writer handlers.
+
+    When the writer can't be reached, sending fails and connecting is retried after a
+    delay that doubles up to ``retry_max`` seconds. On every new connection the file
+    handlers registered by this process are announced again, thus a restarted writer
+    recreates them.
+    """
+
+    retry_start = 1.0
+    retry_max = 30.0
+    send_timeout = 1.0
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.registered: list = []
+        self.reset()
+
+    def reset(self):
+        """Drops the connection, e.g. in a forked child so that it does not share the parent's one."""
+        self.lock = threading.Lock()
+        self.sock: Optional[socket.socket] = None
+        self.retry_time = 0.0
+        self.retry_delay = self.retry_start
+
+    def _connect(self) -> bool:
+        if time.monotonic() < self.retry_time:
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.send_timeout)
+            sock.connect(self.socket_path)
+            if self.registered:
+                sock.sendall(b"".join(self.registered))
+        except OSError:
+            sock.close()
+            self.retry_time = time.monotonic() + self.retry_delay
+            self.retry_delay = min(2 * self.retry_delay, self.retry_max)
+            return False
+        self.sock = sock
+        self.retry_delay = self.retry_start
+        return True
+
+    def send(self, frame: bytes) -> bool:
+        """Sends a frame to the writer and returns whether it succeeded."""
+        with self.lock:
+            if self.sock is None and not self._connect():
+                return False
+            try:
+                self.sock.sendall(frame)  # type: ignore[union-attr]
+                return True
+            except OSError:
+                # A partially sent frame is discarded by the writer when the connection closes
+                self.close()
+                self.retry_time = time.monotonic() + self.retry_delay
+                return False
+
+    def register(self, frame: bytes):
+        with self.lock:
+            self.registered.append(frame)
+        self.send(frame)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+_log_writer_client: Optional[_LogWriterClient] = None
+
+
+class _LogWriterHandler(logging.Handler):
+    """Handler that formats records locally and ships the text to the log writer.
+
+    The wrapped handler provides the filters and formatter, and emits the records itself
+    when the writer can't be reached.
+    """
+
+    def __init__(self, handler: logging.Handler, writer_name: str, spec: Optional[dict] = None):
+        super().__init__(handler.level)
+        self.handler = handler
+        self.writer_name = writer_name
+        if spec is not None:
+            _log_writer_client.register(  # type: ignore[union-attr]
+                _pack_writer_frame(_WRITER_REGISTER, 0, writer_name, json.dumps(spec))
+            )
+
+    def emit(self, record):
+        try:
+            if not self.handler.filter(record):
+                return
+            frame = _pack_writer_frame(_WRITER_RECORD, record.levelno, self.writer_name, self.handler.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        client = _log_writer_client
+        if client is None or not client.send(frame):
+            self.handler.handle(record)
+
+    def flush(self):
+        self.handler.flush()
+
+    def close(self):
+        self.handler.close()
+        super().close()
+
+
+def _start_log_writer_client(socket_path: str) -> None:
+    """Routes the configured handlers of all loggers through the log writer listening at socket_path."""
+    global _log_writer_client
+    if _log_writer_client is not None:
+        return
+    _log_writer_client = _LogWriterClient(socket_path)
+    names = {handler: name for name, handler in logging._handlers.items()}  # type: ignore[attr-defined]
+    writer_handlers: dict = {}
+    for lg_obj in _all_loggers():
+        handlers = []
+        for handler in lg_obj.handlers:
+            if handler in names and not isinstance(handler, _local_handlers):
+                if handler not in writer_handlers:
+                    writer_handlers[handler] = _LogWriterHandler(handler, names[handler])
+                handler = writer_handlers[handler]
+            handlers.append(handler)
+        lg_obj.handlers = handlers
+
+
+def _stop_log_writer_client() -> None:
+    """Closes the connection to the log writer and restores the original handlers."""
+    global _log_writer_client
+    if _log_writer_client is None:
+        return
+    _log_writer_client.close()
+    _log_writer_client = None
+    for lg_obj in _all_loggers():
+        lg_obj.handlers = [getattr(h, "handler", h) if isinstance(h, _LogWriterHandler) else h for h in lg_obj.handlers]
+
+
+def _reset_log_writer_client_after_fork():
+    if _log_writer_client is not None:
+        _log_writer_client.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_log_writer_client_after_fork)
+
+
+class _PreformattedFormatter(logging.Formatter):
+    def format(self, record):
+        return record.msg
+
+
+def run_log_writer(socket_path: str, config: Optional[Union[str, dict]] = None) -> None:
+    """Runs a log writer that emits through its handlers the records shipped by other processes.
+
+    The writer loads the logging configuration, which should be the same as the one of the
+    processes that connect to it, and listens on a unix socket at ``socket_path``. Records
+    arrive already formatted and are emitted by the handler of the same name, or by file
+    handlers announced by :func:`add_file_handler`. It serves until terminated with SIGTERM,
+    after which the handlers are flushed and closed. Normally started with
+    :func:`start_log_writer`.
+
+    Args:
+        socket_path: Path of the unix socket where to listen.
+        config: Configuration string or path to configuration file or configuration file via environment variable.
+    """
+    import socketserver
+
+    _stop_log_writer_client()
+    load_config(os.getenv(ENV_CFG, config))
+    handlers = {}
+    for name, handler in list(logging._handlers.items()):  # type: ignore[attr-defined]
+        if not isinstance(handler, _local_handlers):
+            handler.setFormatter(_PreformattedFormatter())
+            handler.filters = []
+            handlers[name] = handler
+    handlers_lock = threading.Lock()
+
+    stopping = threading.Event()
+
+    def register(name: str, spec: str):
+        with handlers_lock:
+            if name not in handlers:
+                handlers[name] = _file_handler(**json.loads(spec))
+                handlers[name].setFormatter(_PreformattedFormatter())
+
+    def emit(batches: dict):
+        # The records received together for a handler are emitted as a single write
+        for name, (levelno, texts) in batches.items():
+            handler = handlers.get(name)
+            if handler is not None:
+                text = "\n".join(texts)
+                levelname = logging.getLevelName(levelno)
+                handler.handle(logging.makeLogRecord({"msg": text, "levelno": levelno, "levelname": levelname}))
+
+    class RequestHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            # Connections of live processes stay open, so once stopping they are served until idle
+            self.request.settimeout(0.2)
+            data = b""
+            while True:
+                try:
+                    chunk = self.request.recv(262144)
+                except socket.timeout:
+                    if stopping.is_set():
+                        return
+                    continue
+                if not chunk:
+                    return
+                data += chunk
+                offset = 0
+                batches: dict = {}
+                while len(data) - offset >= _writer_frame.size:
+                    kind, levelno, name_length, text_length = _writer_frame.unpack_from(data, offset)
+                    start = offset + _writer_frame.size
+                    end = start + name_length + text_length
+                    if len(data) < end:
+                        break
+                    name = data[start : start + name_length].decode()
+                    text = data[start + name_length : end].decode()
+                    offset = end
+                    if kind == _WRITER_REGISTER:
+                        register(name, text)
+                        continue
+                    batch = batches.get(name)
+                    if batch is None:
+                        batches[name] = [levelno, [text]]
+                    else:
+                        batch[0] = max(batch[0], levelno)
+                        batch[1].append(text)
+                data = data[offset:]
+                emit(batches)
+
+    def stop(*_):
+        stopping.set()
+        threading.Thread(target=server.shutdown).start()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()  # waits for the connections to be drained
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        for handler in set(handlers.values()):
+            handler.close()
+
+
+def start_log_writer(socket_path: str, config: Optional[Union[str, dict]] = None, timeout: float = 10.0):
+    """Starts :func:`run_log_writer` in a child process and waits until it accepts connections.
+
+    Meant to be called in the parent process before forking workers, e.g. in the
+    ``on_starting`` hook of gunicorn. The workers then use the writer by giving
+    ``log_writer=socket_path`` to :func:`logger_setup` or by setting the
+    ``LOGGER_LOG_WRITER`` environment variable.
+
+    Args:
+        socket_path: Path of the unix socket where the writer listens.
+        config: Configuration string or path to configuration file or configuration file via environment variable.
+        timeout: Seconds to wait for the writer to be ready.
+
+    Returns:
+        The ``multiprocessing.Process`` of the writer, which can be stopped with ``terminate()``.
+
+    Raises:
+        RuntimeError: If the writer does not become ready within the timeout.
+    """
+    import multiprocessing
+
+    process = multiprocessing.Process(
+        target=run_log_writer, args=(socket_path, config), name="reconplogger-writer", daemon=True
+    )
+    process.start()
+    deadline = time.monotonic() + timeout
+    while process.is_alive() and time.monotonic() < deadline:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_path)
+                return process
+            except OSError:
+                time.sleep(0.01)
+    process.terminate()
+    raise RuntimeError(f'Log writer did not start listening on "{socket_path}".')
+
+
+caller_cache_size = 10000
+_caller_cache: dict = {}
+_internal_codes: dict = {}
+_logging_srcfile = os.path.normcase(logging.addLevelName.__code__.co_filename)
+_stacklevel_skips_internal = sys.version_info >= (3, 11)
+
+
+def _is_internal_code(code) -> bool:
+    """Whether code belongs to the logging module or importlib internals, cached by code object."""
+    internal = _internal_codes.get(code)
+    if internal is None:
+        filename = os.path.normcase(code.co_filename)
+        internal = filename == _logging_srcfile or (
+            _stacklevel_skips_internal and "importlib" in filename and "_bootstrap" in filename
+        )
+        if len(_internal_codes) >= caller_cache_size:
+            _internal_codes.clear()
+        _internal_codes[code] = internal
+    return internal
+
+
+class CallerCachingLogger(logging.Logger):
+    """Logger that caches by call site the file name, line number and function name of records.
+
+    The stack is still walked up to the calling frame, but whether a frame is internal to
+    logging is cached by code object, and the caller information by code object and
+    instruction offset. Thus repeated calls from the same site skip the path normalisation
+    and the line number lookup. The frame counting of ``stacklevel`` follows that of the
+    running python version. Records with ``stack_info`` are handled by the base class.
+    Installed by :func:`logger_setup` when the ``LOGGER_CACHE_CALLERS`` environment variable
+    is set, or can be with ``logging.setLoggerClass``.
+    """
+
+    def findCaller(self, stack_info=False, stacklevel=1):
+        if stack_info:
+            return super().findCaller(stack_info, stacklevel + 1)  # + 1 for this frame
+        internal_codes = _internal_codes
+        if _stacklevel_skips_internal:
+            frame = sys._getframe(0)
+            while stacklevel > 0:
+                next_frame = frame.f_back
+                if next_frame is None:
+                    break
+                frame = next_frame
+                internal = internal_codes.get(frame.f_code)
+                if internal is None:
+                    internal = _is_internal_code(frame.f_code)
+                if not internal:
+                    stacklevel -= 1
+        else:  # before python 3.11 all frames count, from the one calling the logging method
+            frame = start = sys._getframe(3)  # this, _log, the logging method, its caller
+            while frame is not None and stacklevel > 1:
+                frame = frame.f_back
+                stacklevel -= 1
+            if frame is None:
+                frame = start
+            while True:
+                internal = internal_codes.get(frame.f_code)
+                if internal is None:
+                    internal = _is_internal_code(frame.f_code)
+                if not internal:
+                    break
+                frame = frame.f_back
+                if frame is None:
+                    return "(unknown file)", 0, "(unknown function)", None
+        code = frame.f_code
+        key = (code, frame.f_lasti)
+        caller = _caller_cache.get(key)
+        if caller is None:
+            caller = (code.co_filename, frame.f_lineno, code.co_name, None)
+            if len(_caller_cache) >= caller_cache_size:
+                _caller_cache.clear()
+            _caller_cache[key] = caller
+        return caller
+
+
+def _set_logger_class(logger_class: type) -> None:
+    """Sets the class of new loggers and changes that of the existing plain ones."""
+    logging.setLoggerClass(logger_class)
+    for lg_obj in _all_loggers()[1:]:
+        if type(lg_obj) in {logging.Logger, CallerCachingLogger}:
+            lg_obj.__class__ = logger_class
+
+
+def _disable_caller_caching() -> None:
+    if logging.getLoggerClass() is CallerCachingLogger:
+        _set_logger_class(logging.Logger)
+
+
 def get_logger(logger_name: str) -> logging.Logger:
     """Returns an already existing logger.
 
@@ -262,6 +1946,9 @@ def logger_setup(
     logger_name: str = "plain_logger",
     config: Optional[str] = None,
     level: Optional[str] = None,
+    async_logging: bool = False,
+    sample_rate: Optional[float] = None,
+    log_writer: Optional[str] = None,
 ) -> logging.Logger:
     """Sets up logging configuration and returns the logger.
 
@@ -273,10 +1960,40 @@ def logger_setup(
     On subsequent calls the same primary logger is returned without reconfiguring the root.
     To force a fresh configuration pass, call :func:`reset_configs` first.
 
+    With ``async_logging`` (or the ``LOGGER_ASYNC`` environment variable) the configured
+    handlers are moved behind bounded queues, so that the logging threads never block on
+    stdout or disk. The records are emitted by background listener threads and when a
+    queue is full records are dropped. The queues are flushed on :func:`reset_configs`
+    and at interpreter shutdown.
+
+    With ``sample_rate`` (or the ``LOGGER_SAMPLE_RATE`` environment variable) a
+    :class:`CorrelationIdSamplingFilter` is added to the logger, so that below WARNING
+    level only the records of that fraction of correlation IDs are kept.
+
+    With ``log_writer`` (or the ``LOGGER_LOG_WRITER`` environment variable) set to the
+    socket path of a writer started with :func:`start_log_writer`, the records are
+    formatted in this process and shipped to the writer, which owns the real handlers.
+    If the writer can't be reached the records are emitted locally.
+
+    With the ``LOGGER_WATCH_CFG`` environment variable enabled, the configuration is
+    reloaded with :func:`reload_config` on SIGHUP and when the ``LOGGER_CFG`` file changes.
+
+    With the ``LOGGER_METRICS`` environment variable enabled, metrics of the handlers are
+    collected, see :func:`enable_handler_metrics`.
+
+    With the ``LOGGER_SLIM_RECORDS`` environment variable enabled, record attributes not
+    used by any formatter are not computed, see :func:`optimize_record_attributes`.
+
+    With the ``LOGGER_CACHE_CALLERS`` environment variable enabled, loggers are made
+    :class:`CallerCachingLogger` instances, which cache the caller information by call site.
+
     Args:
         logger_name:  Name of the logger that needs to be used.
         config: Configuration string or path to configuration file or configuration file via environment variable.
         level: Optional logging level that overrides one in config.
+        async_logging: Whether to emit records from background threads through bounded queues.
+        sample_rate: Optional fraction of correlation IDs for which records below WARNING are kept.
+        log_writer: Optional socket path of a log writer to which records are shipped.
 
     Returns:
         The logger object.
@@ -292,6 +2009,9 @@ def logger_setup(
             )
         return _primary_logger
 
+    if _env_flag(ENV_CACHE_CALLERS, False):
+        _set_logger_class(CallerCachingLogger)
+
     # Configure logging
     load_config(os.getenv(ENV_CFG, config))
 
@@ -313,50 +2033,84 @@ def logger_setup(
     # Apply log level overrides to the named logger's handlers
     if effective_level is not None:
         for handler in logger.handlers:
-            if not isinstance(handler, logging.FileHandler):
+            if not isinstance(handler, (logging.FileHandler, FlightRecorderHandler)):
                 handler.setLevel(effective_level)
 
+    if _env_flag(ENV_WATCH_CFG, False):
+        watch_config()
+
+    if _env_flag(ENV_METRICS, False):
+        enable_handler_metrics()
+
+    log_writer = os.getenv(ENV_LOG_WRITER, log_writer)
+    if log_writer:
+        _start_log_writer_client(log_writer)
+
+    if _env_flag(ENV_ASYNC, async_logging):
+        _start_async_logging()
+
     # Add correlation id filter
     logger.addFilter(_CorrelationIdLoggingFilter())
 
+    if ENV_SAMPLE_RATE in os.environ:
+        try:
+            sample_rate = float(os.environ[ENV_SAMPLE_RATE])
+        except ValueError:
+            raise ValueError(f'Invalid sample rate: "{os.environ[ENV_SAMPLE_RATE]}".')
+    if sample_rate is not None:
+        logger.addFilter(CorrelationIdSamplingFilter(rate=sample_rate))
+
+    _add_event_method(logger)
     logger._reconplogger_setup = True
     _primary_logger = logger
+
+    if _env_flag(ENV_SLIM_RECORDS, False):
+        optimize_record_attributes()
+
     return logger
 
 
 def configure_root_logger() -> None:
-    """Installs a named handler on the root logger and removes stream handlers from named loggers.
+    """Installs named handlers on the root logger and removes stream handlers from named loggers.
 
-    After this call every log record in the process flows through the single
-    root handler, regardless of which named logger emitted it.  All named
+    After this call every log record in the process flows through the root
+    handlers, regardless of which named logger emitted it. ``LOGGER_ROOT_HANDLER``
+    can be a comma-separated list of handler names, in which case
+    ``LOGGER_ROOT_LEVEL`` applies to the first one.  All named
     loggers (except those with only ``NullHandler`` instances) have their
     ``StreamHandler`` instances removed and ``propagate`` set to ``True`` so
     records bubble up to the root while keeping non-stream handlers such as
     file handlers attached.
     """
-    handler_name = os.getenv(ENV_ROOT_HANDLER)
-    if not handler_name:
+    handler_names = os.getenv(ENV_ROOT_HANDLER)
+    if not handler_names:
         return
 
-    # Retrieve the already-configured handler by name
+    # Retrieve the already-configured handlers by name
     assert logging.root.manager.loggerDict  # just to verify config is loaded
-    handler_obj = logging._handlers.get(handler_name)  # type: ignore[attr-defined]
-    if handler_obj is None:
-        raise ValueError(
-            f'Handler "{handler_name}" not found in the logging configuration. '
-            "Ensure the handler is defined in the config before setting LOGGER_ROOT_HANDLER."
-        )
+    handlers = []
+    installed = []
+    for handler_name in handler_names.split(","):
+        handler_obj = logging._handlers.get(handler_name.strip())  # type: ignore[attr-defined]
+        if handler_obj is None:
+            raise ValueError(
+                f'Handler "{handler_name.strip()}" not found in the logging configuration. '
+                "Ensure the handler is defined in the config before setting LOGGER_ROOT_HANDLER."
+            )
+        handlers.append(handler_obj)
+        installed.append(_installed_handler(handler_obj, handler_name.strip()))
 
     root = logging.getLogger()
-    root.handlers = [handler_obj]
+    root.handlers = installed
     root_level_name = os.getenv(ENV_ROOT_LEVEL)
-    level = handler_obj.level
+    level = handlers[0].level
     if root_level_name:
         if root_level_name not in logging_levels:
             raise ValueError('Invalid logging level: "' + str(root_level_name) + '".')
         level = logging_levels[root_level_name]
-    handler_obj.setLevel(level)
-    root.setLevel(level)
+    _set_handler_level(handlers[0], level)
+    # The root level lets through what any handler wants, e.g. a DEBUG flight recorder
+    root.setLevel(min([level] + [h.level or logging.DEBUG for h in handlers[1:]]))
 
     logging.captureWarnings(True)
 
@@ -369,7 +2123,8 @@ def configure_root_logger() -> None:
             lg_obj.handlers = [
                 handler
                 for handler in lg_obj.handlers
-                if not isinstance(handler, logging.StreamHandler) or isinstance(handler, logging.FileHandler)
+                if not isinstance(_unwrap_handler(handler), logging.StreamHandler)
+                or isinstance(_unwrap_handler(handler), logging.FileHandler)
             ]
             lg_obj.propagate = True
 
@@ -382,14 +2137,32 @@ def flask_app_logger_setup(
     logger_name: str = "plain_logger",
     config: Optional[str] = None,
     level: Optional[str] = None,
+    async_logging: bool = False,
+    sample_rate: Optional[float] = None,
+    log_writer: Optional[str] = None,
+    request_log_buffering: Union[bool, "RequestLogBuffering"] = False,
+    generate_correlation_ids: bool = False,
 ) -> logging.Logger:
     """Sets up logging configuration, configures flask to use it, and returns the logger.
 
+    With ``request_log_buffering``, either True or a :class:`RequestLogBuffering` instance, the
+    records of each request below WARNING level are held and only emitted if the request
+    fails. The request completed log is always emitted.
+
+    The request completed log includes as extra fields the duration of the request
+    (``duration_ms``), the number of records emitted during it (``log_records``) and the
+    time spent in handlers emitting them (``log_time_ms``).
+
     Args:
         flask_app (flask.app.Flask): The flask app object.
         logger_name:  Name of the logger that needs to be used.
         config: Configuration string or path to configuration file or configuration file via environment variable.
         level: Optional logging level that overrides one in config.
+        async_logging: Whether to emit records from background threads through bounded queues.
+        sample_rate: Optional fraction of correlation IDs for which records below WARNING are kept.
+        log_writer: Optional socket path of a log writer to which records are shipped.
+        request_log_buffering: Whether to buffer the records of requests and emit them only on failure.
+        generate_correlation_ids: Whether to generate a correlation ID for requests without the header.
 
     Returns:
         The logger object.
@@ -399,13 +2172,26 @@ def flask_app_logger_setup(
         logger_name=logger_name,
         config=config,
         level=level,
+        async_logging=async_logging,
+        sample_rate=sample_rate,
+        log_writer=log_writer,
     )
 
+    _import_flask()
+    patch_requests()
+
+    if request_log_buffering is True:
+        request_log_buffering = RequestLogBuffering()
+    buffering = request_log_buffering or None
+
     # Apply WSGI middleware to manage correlation ID at the transport layer
-    flask_app.wsgi_app = CorrelationIdWsgiMiddleware(flask_app.wsgi_app)
+    flask_app.wsgi_app = CorrelationIdWsgiMiddleware(
+        flask_app.wsgi_app, buffering=buffering, generate_ids=generate_correlation_ids
+    )
 
     # Setup flask logger
     replace_logger_handlers(flask_app.logger, logger)
+    _add_event_method(flask_app.logger)
     flask_app.logger.setLevel(logger.level)
 
     # Add flask before and after request functions to augment the logs
@@ -423,14 +2209,31 @@ def flask_app_logger_setup(
                 f"{request.remote_addr} {request.method} {request.path} "
                 f"{request.environ.get('SERVER_PROTOCOL')} {response.status_code}"
             )
-            flask_app.logger.info(message)
+            # The request completed log is not held by the request log buffering
+            if buffering is not None and response.status_code >= 500:
+                buffering.flush()
+            cost = _request_log_cost.get()
+            token = _request_log_buffer.set(None)
+            try:
+                flask_app.logger.info(message, extra=None if cost is None else cost.fields())
+            finally:
+                _request_log_buffer.reset(token)
 
         return response
 
     flask_app.after_request_funcs.setdefault(None, []).append(_flask_logging_after_request)
 
-    # Add correlation id filter
+    # Add correlation id filter, and the sampling and buffering filters if any
     flask_app.logger.addFilter(_CorrelationIdLoggingFilter())
+    for sampling_filter in logger.filters:
+        if isinstance(sampling_filter, CorrelationIdSamplingFilter):
+            flask_app.logger.addFilter(sampling_filter)
+    if buffering is not None:
+        logger.addFilter(buffering)
+        flask_app.logger.addFilter(buffering)
+
+    # Attribute to each request the time spent in handlers for the request completed log
+    _track_request_log_costs()
 
     # Setup werkzeug logger at least at WARNING level in case its server is used
     # since it also logs at INFO level after each request creating redundancy
@@ -441,42 +2244,127 @@ def flask_app_logger_setup(
 
     werkzeug._internal._logger = werkzeug_logger
 
+    if _slim_records_enabled:
+        _apply_record_attributes()
+
     return logger
 
 
-if find_spec("flask"):
+class CorrelationIdWsgiMiddleware:
+    """WSGI middleware that manages the correlation ID for Flask applications.
 
-    class CorrelationIdWsgiMiddleware:
-        """WSGI middleware that manages the correlation ID for Flask applications.
+    Wraps the Flask WSGI app to:
+    - Extract the ``Correlation-ID`` header from the incoming request (or leave it as ``None``).
+    - Store it in :data:`current_correlation_id` for the duration of the request.
+    - Inject the ``Correlation-ID`` into the response headers when one is present.
 
-        Wraps the Flask WSGI app to:
-        - Extract the ``Correlation-ID`` header from the incoming request (or leave it as ``None``).
-        - Store it in :data:`current_correlation_id` for the duration of the request.
-        - Inject the ``Correlation-ID`` into the response headers when one is present.
+    With ``generate_ids``, requests without the header get an ID from
+    :func:`generate_correlation_id`, which is also included in the response headers.
 
-        Applied automatically by :func:`flask_app_logger_setup`.  Can also be applied
-        manually::
+    Applied automatically by :func:`flask_app_logger_setup`.  Can also be applied
+    manually::
 
-            from reconplogger import CorrelationIdWsgiMiddleware
-            app.wsgi_app = CorrelationIdWsgiMiddleware(app.wsgi_app)
-        """
+        from reconplogger import CorrelationIdWsgiMiddleware
+        app.wsgi_app = CorrelationIdWsgiMiddleware(app.wsgi_app)
 
-        def __init__(self, wsgi_app):
-            self._app = wsgi_app
+    Given a :class:`RequestLogBuffering`, the records of each request are buffered and only
+    emitted if the response is a 5xx, the app raises an exception, or a record of the flush
+    level is logged.
 
-        def __call__(self, environ, start_response):
-            correlation_id = environ.get("HTTP_CORRELATION_ID")
-            token = current_correlation_id.set(correlation_id)
+    When :func:`flask_app_logger_setup` has been called, the start time of each request is
+    kept, together with the number of records handled and the time spent in handlers during
+    it, for its request completed log.
+    """
 
-            def _start_response(status, headers, exc_info=None):
-                if correlation_id:
-                    headers = list(headers) + [("Correlation-ID", correlation_id)]
-                return start_response(status, headers, exc_info)
+    def __init__(self, wsgi_app, buffering: Optional["RequestLogBuffering"] = None, generate_ids: bool = False):
+        self._app = wsgi_app
+        self._buffering = buffering
+        self._generate_ids = generate_ids
+
+    def __call__(self, environ, start_response):
+        correlation_id = environ.get("HTTP_CORRELATION_ID")
+        if not correlation_id and self._generate_ids:
+            correlation_id = generate_correlation_id()
+        if _requests_patch_pending:
+            patch_requests()
+        token = current_correlation_id.set(correlation_id)
+        cost_token = _request_log_cost.set(_RequestLogCost()) if _request_log_cost_tracking else None
+        buffering = self._buffering
+        buffer_token = buffering.start() if buffering is not None else None
+
+        def _start_response(status, headers, exc_info=None):
+            if buffering is not None and status[:1] == "5":
+                buffering.flush()
+            if correlation_id:
+                headers = list(headers) + [("Correlation-ID", correlation_id)]
+            return start_response(status, headers, exc_info)
 
-            try:
-                return self._app(environ, _start_response)
-            finally:
-                current_correlation_id.reset(token)
+        try:
+            return self._app(environ, _start_response)
+        except BaseException:
+            if buffering is not None:
+                buffering.flush()
+            raise
+        finally:
+            if buffering is not None:
+                buffering.end(buffer_token)
+            if cost_token is not None:
+                _request_log_cost.reset(cost_token)
+            current_correlation_id.reset(token)
+
+
+class CorrelationIdAsgiMiddleware:
+    """ASGI middleware that manages the correlation ID for async applications.
+
+    The ASGI counterpart of :class:`CorrelationIdWsgiMiddleware`, e.g. for apps served with uvicorn:
+    - Extract the ``Correlation-ID`` header from the incoming request (or leave it as ``None``).
+    - Store it in :data:`current_correlation_id` for the duration of the request task.
+    - Inject the ``Correlation-ID`` into the ``http.response.start`` headers when one is present.
+
+    With ``generate_ids``, requests without the header get an ID from
+    :func:`generate_correlation_id`, which is also included in the response headers.
+
+    Bodies are passed through untouched. Apply it by wrapping the ASGI app::
+
+        from reconplogger import CorrelationIdAsgiMiddleware
+        app = CorrelationIdAsgiMiddleware(app)
+    """
+
+    def __init__(self, asgi_app, generate_ids: bool = False):
+        self._app = asgi_app
+        self._generate_ids = generate_ids
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in {"http", "websocket"}:
+            return await self._app(scope, receive, send)
+        if _requests_patch_pending:
+            patch_requests()
+
+        header = None
+        for name, value in scope.get("headers", ()):
+            if name == b"correlation-id" and value:
+                header = (name, value)
+                break
+        if header is None:
+            if not self._generate_ids:
+                token = current_correlation_id.set(None)
+                try:
+                    return await self._app(scope, receive, send)
+                finally:
+                    current_correlation_id.reset(token)
+            header = (b"correlation-id", generate_correlation_id().encode("latin-1"))
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                # A new list, the app's headers may be reused by other responses
+                message = {**message, "headers": [*message.get("headers", ()), header]}
+            await send(message)
+
+        token = current_correlation_id.set(header[1].decode("latin-1"))
+        try:
+            return await self._app(scope, receive, _send)
+        finally:
+            current_correlation_id.reset(token)
 
 
 def get_correlation_id() -> str:
@@ -491,6 +2379,7 @@ def get_correlation_id() -> str:
         return correlation_id
     if find_spec("flask") is None:
         raise RuntimeError("get_correlation_id used outside correlation_id_context.")
+    from flask import g
 
     try:
         has_correlation_id = hasattr(g, "correlation_id")
@@ -510,6 +2399,8 @@ def set_correlation_id(correlation_id: str):
     """
     from flask import g
 
+    if _requests_patch_pending:
+        patch_requests()
     try:
         hasattr(g, "correlation_id")
     except RuntimeError:
@@ -519,6 +2410,30 @@ def set_correlation_id(correlation_id: str):
 
 current_correlation_id: ContextVar[Optional[str]] = ContextVar("current_correlation_id", default=None)
 
+_correlation_id_prefix = os.urandom(8).hex()
+_correlation_id_counter = itertools.count(1)
+
+
+def generate_correlation_id() -> str:
+    """Returns a new correlation ID, unique across processes and threads.
+
+    IDs are a random prefix, drawn once per process and again after a fork, followed by the
+    value of a counter, e.g. ``"5f0c9a3e1b7d2c48-000000000001"``. Taking the next value of
+    an ``itertools.count`` is atomic, so no lock is needed, which makes generating an ID
+    several times faster than ``str(uuid.uuid4())``.
+    """
+    return f"{_correlation_id_prefix}-{next(_correlation_id_counter):012x}"
+
+
+def _reset_correlation_ids_after_fork():
+    global _correlation_id_prefix, _correlation_id_counter
+    _correlation_id_prefix = os.urandom(8).hex()
+    _correlation_id_counter = itertools.count(1)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_correlation_ids_after_fork)
+
 
 @contextmanager
 def correlation_id_context(correlation_id: Optional[str]):
@@ -530,6 +2445,8 @@ def correlation_id_context(correlation_id: Optional[str]):
     Args:
         correlation_id: The correlation id to set in the context.
     """
+    if _requests_patch_pending:
+        patch_requests()
     token = current_correlation_id.set(correlation_id)
     try:
         yield
@@ -537,24 +2454,379 @@ def correlation_id_context(correlation_id: Optional[str]):
         current_correlation_id.reset(token)
 
 
-class _CorrelationIdLoggingFilter(logging.Filter):
+class CorrelationIdSamplingFilter(logging.Filter):
+    """Filter that keeps all records of a deterministic fraction of the correlation IDs.
+
+    The keep or drop decision is made from a crc32 hash of the correlation ID, thus it is
+    the same in all processes and services that handle the same request. Records with
+    level ``always_level`` or higher and records without correlation ID always pass. The
+    decisions are cached, so that each record costs a single lookup. The number of
+    dropped records is counted in ``dropped``.
+
+    Args:
+        rate: Fraction of correlation IDs for which records are kept, between 0 and 1.
+        always_level: Records with this level or higher always pass.
+        cache_size: Maximum number of cached decisions.
+    """
+
+    def __init__(self, rate: float = 1.0, always_level: Union[str, int] = "WARNING", cache_size: int = 10000):
+        super().__init__()
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError(f"Expected sample rate to be between 0 and 1, got {rate}.")
+        if always_level not in logging_levels:
+            raise ValueError('Invalid logging level: "' + str(always_level) + '".')
+        self.rate = rate
+        self.always_level = logging_levels[always_level]
+        self.cache_size = cache_size
+        self.dropped = 0
+        self._threshold = int(rate * 2**32)
+        self._decisions: dict = {}
+        self._lock = threading.Lock()
+
     def filter(self, record):
-        correlation_id = current_correlation_id.get()
-        if correlation_id is not None:
-            record.correlation_id = correlation_id
-        elif find_spec("flask"):
-            try:
-                from flask import g as _g
-                from flask import has_request_context as _hrc
+        if record.levelno >= self.always_level:
+            return True
+        correlation_id = getattr(record, "correlation_id", None)
+        if correlation_id is None:
+            correlation_id = current_correlation_id.get() or _flask_correlation_id(None)
+            if correlation_id is None:
+                return True
+        keep = self._decisions.get(correlation_id)
+        if keep is None:
+            if len(self._decisions) >= self.cache_size:
+                self._decisions.clear()
+            keep = zlib.crc32(str(correlation_id).encode()) < self._threshold
+            self._decisions[correlation_id] = keep
+        if not keep:
+            with self._lock:  # filters run in many threads
+                self.dropped += 1
+        return keep
+
+
+class RateLimitFilter(logging.Filter):
+    """Filter that rate limits records per call site with a token bucket.
+
+    Each call site, i.e. ``pathname`` and ``lineno`` of the record or its message template
+    when ``key="template"``, gets a bucket of ``burst`` tokens refilled at ``rate`` tokens per
+    second. Records are dropped while the bucket of their site is empty. The next record of
+    the site that passes gets the number of records suppressed in between in its
+    ``suppressed`` attribute, and appended to its message, or for events of
+    :func:`log_event` as a ``suppressed`` field. While a site keeps being suppressed, a record
+    is let through every ``summary_interval`` seconds to report it.
+
+    The buckets are kept for at most ``max_sites`` call sites, evicting the least recently
+    used. The filter can be shared by threads and configured in :func:`load_config` dicts
+    using the ``()`` key, e.g. ``{"()": "reconplogger.RateLimitFilter", "rate": 5}``.
 
-                if _hrc() and hasattr(_g, "correlation_id"):
-                    record.correlation_id = _g.correlation_id
-            except Exception:
-                pass
+    Args:
+        rate: Tokens added per second to the bucket of each call site.
+        burst: Size of the buckets, i.e. records allowed in a burst. Defaults to max(1, rate).
+        key: Either ``"call_site"`` or ``"template"``.
+        summary_interval: Seconds between records reporting a site that is being suppressed.
+        max_sites: Maximum number of call sites tracked.
+    """
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: Optional[float] = None,
+        key: str = "call_site",
+        summary_interval: float = 60.0,
+        max_sites: int = 1000,
+    ):
+        super().__init__()
+        if rate <= 0:
+            raise ValueError(f"Expected rate to be positive, got {rate}.")
+        if key not in {"call_site", "template"}:
+            raise ValueError(f'Expected key to be "call_site" or "template", got "{key}".')
+        if max_sites < 1:
+            raise ValueError(f"Expected max_sites to be at least 1, got {max_sites}.")
+        self.rate = rate
+        self.burst = max(1.0, rate) if burst is None else burst
+        self.key = key
+        self.summary_interval = summary_interval
+        self.max_sites = max_sites
+        self.suppressed = 0
+        self._sites: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.key == "call_site":
+            key = (record.pathname, record.lineno)
+        else:
+            msg = record.msg
+            key = (record.name, msg.name if isinstance(msg, _EventMessage) else str(msg))
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                # [tokens, last refill, suppressed count, first suppression]
+                site = self._sites[key] = [self.burst, now, 0, 0.0]
+                if len(self._sites) > self.max_sites:
+                    self._sites.popitem(last=False)
+            else:
+                self._sites.move_to_end(key)
+                site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+                site[1] = now
+            if site[0] >= 1.0:
+                site[0] -= 1.0
+            else:
+                if site[2] == 0:
+                    site[3] = now
+                if now - site[3] < self.summary_interval:
+                    site[2] += 1
+                    self.suppressed += 1
+                    return False
+            suppressed = site[2]
+            site[2] = 0
+        if suppressed:
+            record.suppressed = suppressed
+            if isinstance(record.msg, _EventMessage):
+                record.msg._fields["suppressed"] = suppressed
+            else:
+                try:
+                    record.msg = f"{record.getMessage()} [suppressed {suppressed} similar messages]"
+                    record.args = None
+                except Exception:  # e.g. bad args, left to the handlers to report
+                    pass
         return True
 
 
+class _RequestLogCost:
+    """Start of a request, and the records handled and nanoseconds spent in handlers during it."""
+
+    __slots__ = ("start", "records", "log_ns", "last_record")
+
+    def __init__(self):
+        self.start = time.perf_counter_ns()
+        self.records = 0
+        self.log_ns = 0
+        self.last_record = None
+
+    def fields(self) -> dict:
+        return {
+            "duration_ms": round((time.perf_counter_ns() - self.start) / 1e6, 3),
+            "log_records": self.records,
+            "log_time_ms": round(self.log_ns / 1e6, 3),
+        }
+
+
+_request_log_cost: ContextVar[Optional[_RequestLogCost]] = ContextVar("_request_log_cost", default=None)
+_request_log_cost_handlers: weakref.WeakSet = weakref.WeakSet()
+_request_log_cost_tracking = False
+
+
+def _track_request_log_cost(handler: logging.Handler) -> None:
+    """Replaces on the handler instance its handle method by one that adds its cost to the current request."""
+    if handler in _request_log_cost_handlers:
+        return
+    handle = handler.handle
+    clock = time.perf_counter_ns
+
+    def tracked_handle(record):
+        cost = _request_log_cost.get()
+        if cost is None:
+            return handle(record)
+        start = clock()
+        try:
+            handled = handle(record)
+        finally:
+            cost.log_ns += clock() - start
+        if handled and cost.last_record is not record:  # count once records emitted by several handlers
+            cost.last_record = record
+            cost.records += 1
+        return handled
+
+    handler.handle = tracked_handle  # type: ignore[method-assign]
+    _request_log_cost_handlers.add(handler)
+
+
+def _track_request_log_costs() -> None:
+    """Tracks the cost within requests of the handlers of all loggers, and of those configured later."""
+    global _request_log_cost_tracking
+    _request_log_cost_tracking = True
+    for lg_obj in _all_loggers():
+        for handler in lg_obj.handlers:
+            _track_request_log_cost(handler)
+
+
+def _untrack_request_log_costs() -> None:
+    global _request_log_cost_tracking
+    _request_log_cost_tracking = False
+    for handler in list(_request_log_cost_handlers):
+        handler.__dict__.pop("handle", None)
+    _request_log_cost_handlers.clear()
+
+
+class _RequestLogBuffer:
+    __slots__ = ("records", "size", "flushed", "dropped", "__weakref__")
+
+    def __init__(self):
+        self.records: deque = deque()
+        self.size = 0
+        self.flushed = False
+        self.dropped = 0
+
+
+_request_log_buffer: ContextVar[Optional[_RequestLogBuffer]] = ContextVar("_request_log_buffer", default=None)
+
+
+class RequestLogBuffering(logging.Filter):
+    """Filter that holds the records of a request and emits them only if the request fails.
+
+    Between :meth:`start` and :meth:`end`, which the WSGI middleware calls for each request,
+    records below ``flush_level`` are held in a buffer of the request instead of being
+    emitted. A record of ``flush_level`` or higher, or a call to :meth:`flush`, which the
+    middleware does for 5xx responses and exceptions, emits the held records and lets the
+    following ones of the request pass. Otherwise the buffer is discarded when the request
+    ends. Outside of requests records always pass. Held records are frozen, i.e. their args
+    are interpolated into the message, and when flushed they go to the handlers through the
+    filters of the logger after this one, so the previous filters see each record once.
+
+    Each buffer holds at most ``max_records`` records and ``max_bytes`` estimated bytes, when
+    exceeded the oldest records are dropped. The current and total amounts are given by
+    :meth:`stats`.
+
+    Args:
+        max_records: Maximum number of records held per request.
+        max_bytes: Maximum estimated size in bytes of the records held per request.
+        flush_level: Records with this level or higher flush the buffer.
+    """
+
+    record_overhead = 512
+    """Estimated size in bytes of a record without its message."""
+
+    def __init__(self, max_records: int = 1000, max_bytes: int = 1048576, flush_level: Union[str, int] = "WARNING"):
+        super().__init__()
+        if flush_level not in logging_levels:
+            raise ValueError('Invalid logging level: "' + str(flush_level) + '".')
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.flush_level = logging_levels[flush_level]
+        self.flushed_records = 0
+        self.discarded_records = 0
+        self.dropped_records = 0
+        self._active: weakref.WeakSet = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        buffer = _request_log_buffer.get()
+        if buffer is None or buffer.flushed:
+            return True
+        if record.levelno >= self.flush_level:
+            self.flush()
+            return True
+        if record.args:
+            # The args could be modified before a flush, thus the message is frozen
+            try:
+                record.msg, record.args = record.getMessage(), None
+            except Exception:
+                pass  # reported by the handlers if the record is emitted
+        size = self.record_overhead + (len(record.msg) if isinstance(record.msg, str) else 0)
+        buffer.records.append((record, size))
+        buffer.size += size
+        while len(buffer.records) > self.max_records or buffer.size > self.max_bytes:
+            buffer.size -= buffer.records.popleft()[1]
+            buffer.dropped += 1
+        return False
+
+    def start(self):
+        """Starts buffering the records of the current request, returns a token for :meth:`end`."""
+        buffer = _RequestLogBuffer()
+        with self._lock:
+            self._active.add(buffer)
+        return _request_log_buffer.set(buffer)
+
+    def flush(self):
+        """Emits the held records of the current request and stops buffering for the rest of it."""
+        buffer = _request_log_buffer.get()
+        if buffer is None or buffer.flushed:
+            return
+        buffer.flushed = True
+        records = buffer.records
+        buffer.records = deque()
+        buffer.size = 0
+        for record, _ in records:
+            # The filters of the logger up to this one already passed the record
+            logger = logging.getLogger(record.name)
+            remaining = logging.Filterer()
+            if self in logger.filters:
+                remaining.filters = logger.filters[logger.filters.index(self) + 1 :]
+            result = remaining.filter(record)
+            if result:
+                logger.callHandlers(record if result is True else result)
+        with self._lock:
+            self.flushed_records += len(records)
+
+    def end(self, token):
+        """Ends the current request, discarding its held records unless flushed."""
+        buffer = _request_log_buffer.get()
+        _request_log_buffer.reset(token)
+        if buffer is None:
+            return
+        with self._lock:
+            self._active.discard(buffer)
+            self.discarded_records += len(buffer.records)
+            self.dropped_records += buffer.dropped
+
+    def stats(self) -> dict:
+        """Returns the records and estimated bytes held by active requests and the totals of ended ones."""
+        with self._lock:
+            active = list(self._active)
+            return {
+                "active_requests": len(active),
+                "buffered_records": sum(len(buffer.records) for buffer in active),
+                "buffered_bytes": sum(buffer.size for buffer in active),
+                "flushed_records": self.flushed_records,
+                "discarded_records": self.discarded_records,
+                "dropped_records": self.dropped_records + sum(buffer.dropped for buffer in active),
+            }
+
+
 _unset = object()
+_flask_accessors = None
+_flask_request_context = None  # ContextVar of the flask request context, flask>=2.2
+
+
+def _flask_correlation_id(default):
+    """Returns ``flask.g.correlation_id`` when inside a flask request context, otherwise the default.
+
+    Flask is looked up in ``sys.modules``, since without it being imported there can't be a
+    request context, and its accessors are resolved only once.
+    """
+    global _flask_accessors, _flask_request_context
+    if _flask_accessors is None:
+        flask = sys.modules.get("flask")
+        if flask is None:
+            return default
+        try:
+            _flask_accessors = (flask.g, flask.has_request_context)
+        except AttributeError:  # flask still being imported
+            return default
+        _flask_request_context = getattr(sys.modules.get("flask.globals"), "_cv_request", None)
+    if _flask_request_context is not None and _flask_request_context.get(None) is None:
+        return default
+    flask_g, has_request_context = _flask_accessors
+    try:
+        if has_request_context():
+            return getattr(flask_g, "correlation_id", default)
+    except Exception:
+        pass
+    return default
+
+
+class _CorrelationIdLoggingFilter(logging.Filter):
+    def filter(self, record):
+        correlation_id = current_correlation_id.get()
+        if correlation_id is None:
+            # outside of flask requests the cost is that of a ContextVar lookup, as in has_request_context()
+            if _flask_request_context is not None and _flask_request_context.get(None) is None:
+                return True
+            correlation_id = _flask_correlation_id(_unset)
+            if correlation_id is _unset:
+                return True
+        record.correlation_id = correlation_id
+        return True
 
 
 class RLoggerProperty:
@@ -591,9 +2863,444 @@ class RLoggerProperty:
             self._rlogger = logger
 
 
-class JsonFormatter(pythonjsonlogger.json.JsonFormatter):
+class _EventMessage:
+    """Message of a structured event whose callable field values are evaluated on first use.
+
+    Its string form, used as message by text formatters, is the event name followed by the
+    fields as ``key=value`` pairs. :class:`JsonFormatter` instead outputs the fields as
+    top level keys.
+    """
+
+    __slots__ = ("name", "_fields", "_resolved")
+
+    def __init__(self, name: str, fields: dict):
+        self.name = name
+        self._fields = fields
+        self._resolved = False
+
+    def fields(self) -> dict:
+        """Returns the fields, calling the callable values the first time."""
+        if not self._resolved:
+            for key, value in self._fields.items():
+                if callable(value):
+                    try:
+                        self._fields[key] = value()
+                    except Exception as ex:
+                        self._fields[key] = f"<evaluation failed: {ex!r}>"
+            self._resolved = True
+        return self._fields
+
+    def __str__(self):
+        return " ".join([self.name] + [f"{key}={value}" for key, value in self.fields().items()])
+
+
+def log_event(logger: logging.Logger, name: str, /, level: Union[str, int] = "INFO", **fields):
+    """Logs a structured event whose fields are evaluated only if the record is emitted.
+
+    Field values that are callables are called only after the record passes the level
+    and filters, thus they cost nothing when the level is disabled. In the output of
+    :class:`JsonFormatter` the fields are top level keys, next to ``event`` and ``message``
+    which are set to the name. Text formatters show ``name key=value ...``. Loggers returned
+    by :func:`logger_setup` and :data:`null_logger` have this function as an ``event``
+    method, e.g. ``logger.event("cache_miss", key=key, size=lambda: cache.size())``.
+
+    Args:
+        logger: Logger where to log the event.
+        name: Name of the event.
+        level: Logging level of the record.
+        **fields: Fields of the event, callables are evaluated lazily.
+    """
+    if level not in logging_levels:
+        raise ValueError('Invalid logging level: "' + str(level) + '".')
+    levelno = logging_levels[level]
+    if logger.isEnabledFor(levelno):
+        logger.log(levelno, _EventMessage(name, fields), stacklevel=2)
+
+
+def _add_event_method(logger: logging.Logger) -> None:
+    logger.event = functools.partial(log_event, logger)  # type: ignore[attr-defined]
+
+
+_add_event_method(null_logger)
+
+
+class _TimestampCache:
+    """Renders a time format, which has second resolution, only once per second.
+
+    The cached second and text are kept in a single tuple, so concurrent threads
+    at worst render the same second more than once.
+    """
+
+    def __init__(self, datefmt: str, converter):
+        self.datefmt = datefmt
+        self.converter = converter
+        self._cached = (None, "")
+
+    def __call__(self, created: float) -> str:
+        seconds = int(created)
+        cached = self._cached
+        if cached[0] != seconds:
+            cached = self._cached = (seconds, time.strftime(self.datefmt, self.converter(seconds)))
+        return cached[1]
+
+
+formatter_max_message_bytes: Optional[int] = None
+formatter_max_field_bytes: Optional[int] = None
+exception_cache_size = 256
+_exception_cache: OrderedDict = OrderedDict()
+_exception_cache_lock = threading.Lock()
+
+
+def _exception_fingerprint(value: BaseException, tb, seen: set) -> tuple:
+    """Identifies what a formatted exception depends on: types, messages and code locations of the chain."""
+    seen.add(id(value))
+    frames = []
+    while tb is not None:
+        frames.append((tb.tb_frame.f_code, tb.tb_lasti))  # the instruction, tracebacks show its position
+        tb = tb.tb_next
+    chained = []
+    for linked in [value.__cause__, None if value.__suppress_context__ else value.__context__]:
+        if linked is not None and id(linked) not in seen:
+            chained.append(_exception_fingerprint(linked, linked.__traceback__, seen))
+        else:
+            chained.append(None)
+    for grouped in getattr(value, "exceptions", None) or ():  # exception groups, python 3.11+
+        if isinstance(grouped, BaseException) and id(grouped) not in seen:
+            chained.append(_exception_fingerprint(grouped, grouped.__traceback__, seen))
+    return (type(value), str(value), tuple(getattr(value, "__notes__", ())), tuple(frames), tuple(chained))
+
+
+def _cached_exception(kind: tuple, ei, render):
+    """Returns the rendering of an exception, reusing a previous one of an exception with the same fingerprint."""
+    if ei[1] is None:
+        return render()
+    try:
+        key = (kind, _exception_fingerprint(ei[1], ei[2], set()))
+    except Exception:  # e.g. str() of the exception failed
+        return render()
+    with _exception_cache_lock:
+        rendered = _exception_cache.get(key)
+        if rendered is not None:
+            _exception_cache.move_to_end(key)
+            return rendered
+    rendered = render()
+    with _exception_cache_lock:
+        _exception_cache[key] = rendered
+        while len(_exception_cache) > exception_cache_size:
+            _exception_cache.popitem(last=False)
+    return rendered
+
+
+def _truncate_text(text: str, max_size: int) -> str:
+    return text if len(text) <= max_size else text[:max_size] + "..."
+
+
+def _cut_bytes(text: str, max_bytes: int) -> Optional[tuple]:
+    """Returns the kept part, its size and the original size of a text longer than max_bytes UTF-8 bytes."""
+    if len(text) <= max_bytes // 4:  # at most 4 bytes per character
+        return None
+    if text.isascii():
+        return None if len(text) <= max_bytes else (text[:max_bytes], max_bytes, len(text))
+    encoded = text.encode("utf-8", "replace")
+    if len(encoded) <= max_bytes:
+        return None
+    kept = encoded[:max_bytes].decode("utf-8", "ignore")  # drops a character cut in half
+    return kept, len(kept.encode("utf-8", "replace")), len(encoded)
+
+
+def _truncate_bytes(text: str, max_bytes: Optional[int]) -> str:
+    """Cuts a text to at most max_bytes UTF-8 bytes, marking it with its original size."""
+    cut = None if max_bytes is None else _cut_bytes(text, max_bytes)
+    return text if cut is None else f"{cut[0]}... [truncated, {cut[2]} bytes]"
+
+
+_small_arg_types = frozenset({int, float, bool, type(None)})
+
+
+def _bounded_message(record: logging.LogRecord, max_bytes: Optional[int]) -> Optional[str]:
+    """Returns the message of a record cut to max_bytes, or None if it is surely within the limit.
+
+    The msg and the str args are cut before interpolating them, so that a huge argument is
+    not first copied into an even larger message.
+    """
+    if max_bytes is None:
+        return None
+    msg = record.msg
+    args = record.args
+    if type(msg) is str:
+        # Fast check for the common case of a tuple of short args, other args take the slow path
+        size = len(msg)
+        if args:
+            if type(args) is tuple:
+                for value in args:
+                    value_type = type(value)
+                    if value_type is str:
+                        size += len(value)
+                    elif value_type in _small_arg_types:
+                        size += 32
+                    else:  # the size of other objects is only known after converting them
+                        size = -1
+                        break
+            else:
+                size = -1
+        if 0 <= size <= max_bytes >> 2:  # at most 4 bytes per character
+            return None
+    else:
+        msg = str(msg)
+    removed = 0
+
+    def cut_text(text):
+        nonlocal removed
+        cut = _cut_bytes(text, max_bytes) if isinstance(text, str) else None
+        if cut is None:
+            return text
+        removed += cut[2] - cut[1]
+        return cut[0]
+
+    message = cut_text(msg)
+    if args:
+        if isinstance(args, Mapping):
+            args = {key: cut_text(value) for key, value in args.items()}
+        else:
+            args = tuple(cut_text(value) for value in args)
+        try:
+            message = message % args
+        except (TypeError, ValueError, KeyError):
+            if not removed:
+                raise
+            # The cut left placeholders without args or args without placeholders
+    cut = _cut_bytes(message, max_bytes)
+    if cut is None:
+        if not removed:
+            return message
+        cut = (message, 0, len(message.encode("utf-8", "replace")))
+    return f"{cut[0]}... [truncated, {cut[2] + removed} bytes]"
+
+
+def _structured_exception(value: BaseException, tb, max_frames: int, max_size: int, seen: set) -> dict:
+    seen.add(id(value))
+    exc_type = type(value)
+    frames = traceback.extract_tb(tb)
+    omitted = max(0, len(frames) - max_frames)
+    structured: dict = {
+        "type": exc_type.__qualname__
+        if exc_type.__module__ == "builtins"
+        else f"{exc_type.__module__}.{exc_type.__qualname__}",
+        "message": _truncate_text(str(value), max_size),
+        "frames": [
+            {
+                "filename": frame.filename,
+                "lineno": frame.lineno,
+                "function": frame.name,
+                "line": _truncate_text(frame.line or "", max_size),
+            }
+            for frame in frames[omitted:]  # the innermost frames are kept
+        ],
+    }
+    if omitted:
+        structured["frames_omitted"] = omitted
+    if value.__cause__ is not None and id(value.__cause__) not in seen:
+        structured["cause"] = _structured_exception(
+            value.__cause__, value.__cause__.__traceback__, max_frames, max_size, seen
+        )
+    elif value.__context__ is not None and not value.__suppress_context__ and id(value.__context__) not in seen:
+        structured["context"] = _structured_exception(
+            value.__context__, value.__context__.__traceback__, max_frames, max_size, seen
+        )
+    return structured
+
+
+class _CachingFormatter(logging.Formatter):
+    """Formatter that renders the second resolution part of times once per second, and
+    reuses formatted tracebacks of exceptions with the same fingerprint.
+
+    The fingerprint of an exception is its type, message, and code and instruction of each frame,
+    including those of chained exceptions. The last ``exception_cache_size`` formatted
+    tracebacks are kept.
+    """
+
+    _time_cache: Optional[_TimestampCache] = None
+    max_message_bytes: Optional[int] = None
+    max_field_bytes: Optional[int] = None
+
+    def _byte_limits(self) -> tuple:
+        """Returns the message and field size limits, falling back to the module defaults."""
+        return (
+            formatter_max_message_bytes if self.max_message_bytes is None else self.max_message_bytes,
+            formatter_max_field_bytes if self.max_field_bytes is None else self.max_field_bytes,
+        )
+
+    def formatTime(self, record, datefmt=None):
+        cache = self._time_cache
+        if cache is None or cache.datefmt != (datefmt or self.default_time_format) or cache.converter != self.converter:
+            cache = self._time_cache = _TimestampCache(datefmt or self.default_time_format, self.converter)
+        text = cache(record.created)
+        if not datefmt and self.default_msec_format:
+            text = self.default_msec_format % (text, record.msecs)
+        return text
+
+    def formatException(self, ei):
+        return _cached_exception(("text",), ei, lambda: logging.Formatter.formatException(self, ei))
+
+
+_short_record_attributes = frozenset(
+    set(logging.makeLogRecord({}).__dict__) - {"msg", "args", "exc_text", "stack_info"}
+    | {"message", "asctime", "taskName"}
+)
+
+
+class PlainFormatter(_CachingFormatter):
+    """Plain text formatter used by the default configuration and by :func:`add_file_handler`.
+
+    With ``max_message_bytes`` the message, i.e. msg with its args, is cut to that many UTF-8
+    bytes, the msg and str args already before interpolating them, and with
+    ``max_field_bytes`` so are the other string attributes in the format and the exception
+    and stack texts. Cut texts end with a marker that includes their original size. When not
+    given, the limits are ``formatter_max_message_bytes`` and ``formatter_max_field_bytes``,
+    which apply to formatters created from a config ``class``.
+    """
+
+    def __init__(
+        self,
+        fmt=None,
+        datefmt=None,
+        style="%",
+        *args,
+        max_message_bytes: Optional[int] = None,
+        max_field_bytes: Optional[int] = None,
+        **kwargs,
+    ):
+        super().__init__(fmt, datefmt, style, *args, **kwargs)
+        self.max_message_bytes = max_message_bytes
+        self.max_field_bytes = max_field_bytes
+        fields = _format_attributes(self._fmt or "", self._style)
+        # Fields other than the standard ones, which are short, and the message, bounded apart
+        self._string_fields = None if fields is None else list(fields - _short_record_attributes)
+
+    def format(self, record):
+        message_limit, field_limit = self._byte_limits()
+        if message_limit is None and field_limit is None:
+            return super().format(record)
+        message = _bounded_message(record, message_limit)
+        # Only fields that may be long are checked, none for formats of just standard attributes
+        names = self._string_fields
+        if field_limit is None or (names == [] and not record.exc_info and not record.stack_info):
+            if message is None:
+                return super().format(record)
+            field_limit = None
+        changes = {} if message is None else {"msg": message, "args": None}
+        if field_limit is not None:
+            if record.exc_info and not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            short = field_limit // 4  # at most 4 bytes per character
+            values = record.__dict__
+            if names is None:
+                names = [name for name in values if name not in {"msg", "args", "message"}]
+            for name in [*names, "exc_text", "stack_info"]:
+                value = values.get(name)
+                if isinstance(value, str) and len(value) > short:
+                    changes[name] = _truncate_bytes(value, field_limit)
+        if not changes:
+            return super().format(record)
+        # The record is shared by all handlers, so a copy is formatted
+        bounded = copy.copy(record)
+        bounded.__dict__.update(changes)
+        return super().format(bounded)
+
+
+_utc_timestamp = _TimestampCache("%Y-%m-%dT%H:%M:%S", time.gmtime)
+
+
+def _builtin_json_serializer(formatter):
+    """Returns a serializer that reuses a single C encoder, giving the same output as ``json.dumps``."""
+    c_make_encoder = json.encoder.c_make_encoder
+    if c_make_encoder is None or formatter.json_indent is not None or formatter.json_serializer is not json.dumps:
+        return None
+    encoder = (formatter.json_encoder or json.JSONEncoder)(
+        default=formatter.json_default,
+        ensure_ascii=formatter.json_ensure_ascii,
+    )
+    if (
+        type(encoder).encode is not json.JSONEncoder.encode
+        or type(encoder).iterencode is not json.JSONEncoder.iterencode
+    ):
+        return None
+    iterencode = c_make_encoder(
+        None,  # markers: circular references are caught by the fallback to json.dumps
+        encoder.default,
+        json.encoder.encode_basestring_ascii if encoder.ensure_ascii else json.encoder.encode_basestring,
+        None,
+        encoder.key_separator,
+        encoder.item_separator,
+        encoder.sort_keys,
+        encoder.skipkeys,
+        encoder.allow_nan,
+    )
+    fallback = pythonjsonlogger.json.JsonFormatter.jsonify_log_record
+
+    def serialize(log_data):
+        try:
+            return "".join(iterencode(log_data, 0))
+        except (RecursionError, ValueError):
+            return fallback(formatter, log_data)
+
+    return serialize
+
+
+def _orjson_serializer(formatter):
+    import orjson
+    from pythonjsonlogger.orjson import orjson_default
+
+    def serialize(log_data):
+        return orjson.dumps(log_data, default=orjson_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    return serialize
+
+
+def _msgspec_serializer(formatter):
+    from msgspec.json import Encoder
+    from pythonjsonlogger.msgspec import msgspec_default
+
+    encode = Encoder(enc_hook=msgspec_default).encode
+
+    def serialize(log_data):
+        return encode(log_data).decode()
+
+    return serialize
+
+
+_json_serializers = {
+    "stdlib": lambda formatter: None,
+    "builtin": _builtin_json_serializer,
+    "orjson": _orjson_serializer,
+    "msgspec": _msgspec_serializer,
+}
+
+
+class JsonFormatter(_CachingFormatter, pythonjsonlogger.json.JsonFormatter):
     """JSON formatter from https://github.com/logmatic/logmatic-python/
 
+    The serializer can be selected with the ``serializer`` argument, which in a logging config
+    requires the ``()`` factory key instead of ``class``. The options are:
+
+    - ``"builtin"`` (default): same output as ``"stdlib"`` but faster. The fixed field set of
+      ``fmt`` is collected without the rename, default and static field handling when none
+      is configured, and a single C encoder is reused.
+    - ``"stdlib"``: ``json.dumps`` as done by python-json-logger.
+    - ``"orjson"`` and ``"msgspec"``: fastest, but require the respective package and their
+      output is compact and not ascii escaped, so it is not byte-compatible with the others.
+
+    With ``structured_exc_info`` the ``exc_info`` field is an object with the ``type``,
+    ``message`` and ``frames`` of the exception, and ``cause`` or ``context`` for chained
+    exceptions, instead of the formatted traceback. Only the innermost ``exc_max_frames``
+    frames are included, the number of omitted ones in ``frames_omitted``, and messages and
+    source lines are cut to ``exc_max_size`` characters.
+
+    The ``max_message_bytes`` and ``max_field_bytes`` size limits are as in
+    :class:`PlainFormatter`, the latter applying to every string field, including ``extra``
+    values and the exception text. They are applied before serializing, so the output is
+    always valid JSON.
+
     The MIT License (MIT)
     Copyright (c) 2017 Logmatic.io
     """
@@ -608,19 +3315,309 @@ class JsonFormatter(pythonjsonlogger.json.JsonFormatter):
         style="%",
         extra={},
         *args,
+        serializer: Optional[str] = None,
+        structured_exc_info: bool = False,
+        exc_max_frames: int = 30,
+        exc_max_size: int = 2000,
+        max_message_bytes: Optional[int] = None,
+        max_field_bytes: Optional[int] = None,
         **kwargs,
     ):
         self._extra = extra
+        self.max_message_bytes = max_message_bytes
+        self.max_field_bytes = max_field_bytes
+        self.structured_exc_info = structured_exc_info
+        self.exc_max_frames = exc_max_frames
+        self.exc_max_size = exc_max_size
         pythonjsonlogger.json.JsonFormatter.__init__(self, fmt=fmt, datefmt=datefmt, *args, **kwargs)
+        serializer = serializer or "builtin"
+        if serializer not in _json_serializers:
+            raise ValueError(f'Invalid serializer: "{serializer}". Expected one of {list(_json_serializers)}.')
+        if serializer in {"orjson", "msgspec"} and not find_spec(serializer):
+            raise ImportError(f'Serializer "{serializer}" requires the {serializer} package.')
+        self._serialize = _json_serializers[serializer](self)
+        self._fixed_fields = None
+        if serializer == "builtin" and not (
+            self.defaults
+            or self.static_fields
+            or self.rename_fields
+            or self.timestamp
+            or self.rename_fields_keep_missing
+        ):
+            self._fixed_fields = tuple(self._required_fields)
+
+    def formatException(self, ei):
+        if self.structured_exc_info and ei[1] is not None:
+            # The cached object is shared by records, serializers don't modify it
+            return _cached_exception(
+                ("structured", self.exc_max_frames, self.exc_max_size),
+                ei,
+                lambda: _structured_exception(ei[1], ei[2], self.exc_max_frames, self.exc_max_size, set()),
+            )
+        text = _CachingFormatter.formatException(self, ei)
+        if getattr(self, "exc_info_as_array", False):  # python-json-logger 4.0+
+            return _truncate_bytes(text, self._byte_limits()[1]).splitlines()
+        return text
+
+    def jsonify_log_record(self, log_data):
+        if self._serialize is not None:
+            return self._serialize(log_data)
+        return super().jsonify_log_record(log_data)
+
+    def format(self, record):
+        if isinstance(record.msg, (dict, _EventMessage)):
+            return super().format(record)
+        message = _bounded_message(record, self._byte_limits()[0])
+        if message is None:
+            return super().format(record)
+        # The record is shared by all handlers, so a copy is formatted
+        bounded = copy.copy(record)
+        bounded.msg, bounded.args = message, None
+        return super().format(bounded)
+
+    def add_fields(self, log_record, record, message_dict):
+        field_limit = self._byte_limits()[1]
+        fixed_fields = self._fixed_fields
+        if fixed_fields is None:
+            super().add_fields(log_record, record, message_dict)
+        else:  # as python-json-logger does without renames, defaults and static fields
+            attributes = record.__dict__
+            for field in fixed_fields:
+                log_record[field] = attributes.get(field)
+            log_record.update(message_dict)
+            skip_fields = self._skip_fields
+            for key, value in attributes.items():
+                if key not in skip_fields and not (hasattr(key, "startswith") and key.startswith("_")):
+                    log_record[key] = value
+        if isinstance(record.msg, _EventMessage):
+            log_record["message"] = record.msg.name
+            log_record["event"] = record.msg.name
+            log_record.update(record.msg.fields())
+        if field_limit is not None:
+            message_key = self._get_rename("message")
+            short = field_limit // 4  # surely within the limit, skips the call for most fields
+            for key, value in log_record.items():
+                if isinstance(value, str) and len(value) > short and key != message_key:
+                    log_record[key] = _truncate_bytes(value, field_limit)
+        # Enforce the presence of a timestamp
+        if "asctime" not in log_record:
+            created = record.created
+            microseconds = int((created - int(created)) * 1e6)
+            log_record["timestamp"] = f"{_utc_timestamp(created)}.{microseconds:06d}Z"
 
     def process_log_record(self, log_record):
-        # Enforce the presence of a timestamp
         if "asctime" in log_record:
             log_record["timestamp"] = log_record["asctime"]
-        else:
-            log_record["timestamp"] = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
         if self._extra is not None:
             for key, value in self._extra.items():
                 log_record[key] = value
         return super().process_log_record(log_record)
+
+
+# Record attributes always computed, since formatting and filtering of any record can use them
+_base_record_attributes = frozenset(
+    {"name", "msg", "args", "levelname", "levelno", "created", "msecs", "relativeCreated", "exc_info", "stack_info"}
+)
+_caller_record_attributes = frozenset({"pathname", "filename", "module", "lineno", "funcName"})
+_logging_flags = {
+    name: getattr(logging, name)
+    for name in ["logThreads", "logProcesses", "logMultiprocessing", "logAsyncioTasks", "_srcfile"]
+    if hasattr(logging, name)
+}
+_logging_start_time = logging._startTime / 1e9 if isinstance(logging._startTime, int) else logging._startTime  # type: ignore[attr-defined]
+_record_attributes: frozenset = frozenset()
+_slim_records_enabled = False
+
+
+class _SlimLogRecord(logging.LogRecord):
+    """Log record that only computes the attributes referenced by the active formatters and filters.
+
+    Thread and process attributes follow the flags of the logging module as in ``LogRecord``.
+    The file name and module, derived from the path, are computed when first accessed unless
+    referenced.
+    """
+
+    def __init__(self, name, level, pathname, lineno, msg, args, exc_info, func=None, sinfo=None, **kwargs):
+        created = time.time()
+        self.name = name
+        self.msg = msg
+        if args and len(args) == 1 and isinstance(args[0], Mapping) and args[0]:
+            args = args[0]
+        self.args = args
+        self.levelname = logging.getLevelName(level)
+        self.levelno = level
+        self.pathname = pathname
+        self.lineno = lineno
+        self.funcName = func
+        if "filename" in _record_attributes or "module" in _record_attributes:
+            self.filename = os.path.basename(pathname)
+            self.module = os.path.splitext(self.filename)[0]
+        self.exc_info = exc_info
+        self.exc_text = None
+        self.stack_info = sinfo
+        self.created = created
+        self.msecs = int((created - int(created)) * 1000) + 0.0
+        self.relativeCreated = (created - _logging_start_time) * 1000
+        if logging.logThreads:
+            self.thread = threading.get_ident()
+            self.threadName = threading.current_thread().name
+        else:
+            self.thread = None
+            self.threadName = None
+        self.processName = None
+        if logging.logMultiprocessing:
+            self.processName = "MainProcess"
+            multiprocessing = sys.modules.get("multiprocessing")
+            if multiprocessing is not None:
+                try:
+                    self.processName = multiprocessing.current_process().name
+                except Exception:
+                    pass
+        self.process = os.getpid() if logging.logProcesses else None
+        if "logAsyncioTasks" in _logging_flags:
+            self.taskName = None
+            asyncio = sys.modules.get("asyncio") if logging.logAsyncioTasks else None  # type: ignore[attr-defined]
+            if asyncio is not None:
+                try:
+                    self.taskName = asyncio.current_task().get_name()
+                except Exception:
+                    pass
+
+    @functools.cached_property
+    def filename(self):
+        return os.path.basename(self.pathname)
+
+    @functools.cached_property
+    def module(self):
+        return os.path.splitext(self.filename)[0]
+
+
+def _format_attributes(fmt: str, style) -> Optional[set]:
+    if type(style) is logging.PercentStyle:
+        return set(re.findall(r"%\((\w+)\)", fmt))
+    if type(style) is logging.StrFormatStyle:
+        return set(re.findall(r"{(\w+)", fmt))
+    if type(style) is logging.StringTemplateStyle:
+        return set(re.findall(r"\$\{?(\w+)", fmt))
+    return None
+
+
+def _handler_record_attributes(handler: logging.Handler) -> Optional[set]:
+    """Returns the record attributes used by a handler, or None if they can't be known."""
+    handler = _unwrap_handler(handler)
+    if isinstance(handler, logging.NullHandler):
+        return set()
+    # Only handlers known to use records just through their formatter
+    if not isinstance(handler, (logging.StreamHandler, FlightRecorderHandler)) or type(handler).__module__ not in {
+        "logging",
+        __name__,
+    }:
+        return None
+    formatter = handler.formatter or logging._defaultFormatter  # type: ignore[attr-defined]
+    if type(formatter) is _PreformattedFormatter:
+        attributes: Optional[set] = set()
+    elif type(formatter) is JsonFormatter:
+        attributes = set(formatter._required_fields)
+    elif type(formatter) in {logging.Formatter, PlainFormatter}:
+        attributes = _format_attributes(formatter._fmt, formatter._style)  # type: ignore[arg-type]
+    else:
+        attributes = None
+    for filter_ in handler.filters:
+        filter_attributes = _filter_record_attributes(filter_)
+        if attributes is None or filter_attributes is None:
+            return None
+        attributes |= filter_attributes
+    return attributes
+
+
+def _filter_record_attributes(filter_) -> Optional[set]:
+    if type(filter_) is RateLimitFilter:
+        return {"pathname", "lineno"} if filter_.key == "call_site" else set()
+    if type(filter_) in {logging.Filter, _CorrelationIdLoggingFilter, CorrelationIdSamplingFilter, RequestLogBuffering}:
+        return set()
+    return None
+
+
+def _referenced_record_attributes() -> Optional[set]:
+    """Returns the record attributes used by the handlers and filters of all loggers, or None if unknown."""
+    attributes = set(_base_record_attributes)
+    for lg_obj in _all_loggers():
+        for item in lg_obj.handlers + lg_obj.filters:
+            if isinstance(item, logging.Handler):
+                item_attributes = _handler_record_attributes(item)
+            else:
+                item_attributes = _filter_record_attributes(item)
+            if item_attributes is None:
+                return None
+            attributes |= item_attributes
+    return attributes
+
+
+def _restore_record_attributes() -> None:
+    for name, value in _logging_flags.items():
+        setattr(logging, name, value)
+    if logging.getLogRecordFactory() is _SlimLogRecord:
+        logging.setLogRecordFactory(logging.LogRecord)
+
+
+def _apply_record_attributes() -> Optional[frozenset]:
+    global _record_attributes
+    _restore_record_attributes()
+    attributes = _referenced_record_attributes()
+    if attributes is None or logging.getLogRecordFactory() is not logging.LogRecord:
+        return None
+    logging.logThreads = bool({"thread", "threadName"} & attributes)
+    logging.logProcesses = "process" in attributes
+    logging.logMultiprocessing = "processName" in attributes
+    if "logAsyncioTasks" in _logging_flags:
+        logging.logAsyncioTasks = "taskName" in attributes  # type: ignore[attr-defined]
+    if not _caller_record_attributes & attributes:
+        logging._srcfile = None  # type: ignore[attr-defined]
+    _record_attributes = frozenset(attributes)
+    logging.setLogRecordFactory(_SlimLogRecord)
+    return _record_attributes
+
+
+def optimize_record_attributes() -> Optional[frozenset]:
+    """Avoids computing record attributes that no formatter or filter of any logger uses.
+
+    The formats of the formatters of the handlers of all loggers, and their filters, are
+    analysed to know which record attributes they reference. Then the ``logThreads``,
+    ``logProcesses`` and ``logMultiprocessing`` flags of the logging module are set
+    accordingly, the caller lookup is disabled if no file name, line number or function name
+    is referenced, and a record factory is installed that only computes what is needed.
+    The analysis is repeated by :func:`load_config`, :func:`reload_config` and
+    :func:`add_file_handler`, but handlers added by other means require calling this
+    function again. Nothing is changed if there is a custom record factory, or a handler,
+    formatter or filter of a type whose use of records is not known, e.g. a custom
+    formatter class. Enabled by :func:`logger_setup` when the ``LOGGER_SLIM_RECORDS``
+    environment variable is set, and undone by :func:`reset_configs`.
+
+    Note that without the caller lookup ``stack_info=True`` has no effect.
+
+    Returns:
+        The referenced attributes, or None if nothing was changed.
+    """
+    global _slim_records_enabled
+    _slim_records_enabled = True
+    return _apply_record_attributes()
+
+
+def _disable_slim_records() -> None:
+    global _slim_records_enabled
+    _slim_records_enabled = False
+    _restore_record_attributes()
+
+
+if not _env_flag(ENV_LAZY_IMPORTS, False):
+    if find_spec("flask"):
+        _import_flask()
+    patch_requests()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m reconplogger FLIGHT_RECORDER_FILE")
+    for _record in read_flight_recorder(sys.argv[1]):
+        print(_record)
@@ -0,0 +1,633 @@
+#!/usr/bin/env python3
+"""Benchmarks for the hot paths of reconplogger.
+
+The benchmarks run offline. Results are metrics whose names end in ``_per_s``
+(higher is better) or in ``_ns``/``_us`` (lower is better). Usage::
+
+    python3 reconplogger_benchmarks.py                          # Run all and print results
+    python3 reconplogger_benchmarks.py --json results.json      # Also save results as json
+    python3 reconplogger_benchmarks.py --baseline results.json  # Compare against stored results
+    python3 reconplogger_benchmarks.py json_logger wsgi         # Run only the given benchmarks
+
+When comparing against a baseline, the exit code is 1 if any metric regressed
+more than the threshold.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import logging.config
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import uuid
+from io import StringIO
+from typing import Callable, Dict
+from unittest.mock import patch
+
+import yaml
+
+import reconplogger
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+
+benchmarks: Dict[str, Callable[[], dict]] = {}
+
+
+def benchmark(func):
+    """Registers a benchmark function under its name without the ``bench_`` prefix."""
+    benchmarks[func.__name__[len("bench_") :]] = func
+    return func
+
+
+class NullStream:
+    """Stream that discards everything written to it."""
+
+    def write(self, s):
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class SlowStream(StringIO):
+    """Stream that emulates a backed up log pipe by sleeping on every write."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, s):
+        time.sleep(self.delay)
+        return super().write(s)
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure(name: str, func: Callable, number: int, repeat: int = 3) -> dict:
+    """Best of repeat runs of func as calls per second and nanoseconds per call."""
+    seconds = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    return {f"{name}_per_s": 1 / seconds, f"{name}_ns": seconds * 1e9}
+
+
+def setup_logger(logger_name: str = "plain_logger", **kwargs) -> logging.Logger:
+    reconplogger.reset_configs()
+    with patch.dict(os.environ, {"LOGGER_LEVEL": "DEBUG"}):
+        return reconplogger.logger_setup(logger_name, **kwargs)
+
+
+@benchmark
+def bench_plain_logger(number: int = 20000) -> dict:
+    """Records through the plain_logger returned by logger_setup."""
+    logger = setup_logger("plain_logger")
+    with patch.object(logger.handlers[0], "stream", NullStream()):
+        results = measure("records", lambda: logger.info("message %s", "args"), number)
+    reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_json_logger(number: int = 20000) -> dict:
+    """Records through the json_logger returned by logger_setup."""
+    logger = setup_logger("json_logger")
+    with patch.object(logger.handlers[0], "stream", NullStream()):
+        results = measure("records", lambda: logger.info("message %s", "args"), number)
+        with reconplogger.correlation_id_context("correlation-id"):
+            results.update(measure("records_with_correlation_id", lambda: logger.info("message"), number))
+    reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_handler_metrics(number: int = 20000) -> dict:
+    """Records through the json_logger without and with handler metrics."""
+    results = {}
+    for name, env in [("records", {}), ("records_with_metrics", {"LOGGER_METRICS": "true"})]:
+        with patch.dict(os.environ, env):
+            logger = setup_logger("json_logger")
+        with patch.object(logger.handlers[0], "stream", NullStream()):
+            results.update(measure(name, lambda: logger.info("message %s", "args"), number))
+    reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_slim_records(number: int = 20000) -> dict:
+    """Records with all attributes computed and with only those referenced by the formatter."""
+    formatters = {
+        "message": reconplogger.PlainFormatter("%(levelname)s %(message)s"),
+        "reconplogger_format": reconplogger.PlainFormatter(reconplogger.reconplogger_format),
+        "json": reconplogger.JsonFormatter(),
+    }
+    results = {}
+    for name, formatter in formatters.items():
+        with patch.dict(logging.Logger.manager.loggerDict, clear=True), patch.object(logging.root, "handlers", []):
+            logger = logging.getLogger("bench_slim_records")
+            handler = logging.StreamHandler(NullStream())
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            results.update(measure(f"{name}_records", lambda: logger.info("message %s", "args"), number))
+            reconplogger.optimize_record_attributes()
+            results.update(measure(f"{name}_slim_records", lambda: logger.info("message %s", "args"), number))
+            reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_caller_caching(number: int = 50000) -> dict:
+    """Caller lookup and records with the reconplogger format for the stock Logger and CallerCachingLogger."""
+    results = {}
+    handler = logging.StreamHandler(NullStream())
+    handler.setFormatter(reconplogger.PlainFormatter(reconplogger.reconplogger_format))
+    for name, logger_class in [("stock", logging.Logger), ("caching", reconplogger.CallerCachingLogger)]:
+        logger = logger_class(f"bench_{name}")
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        results.update(measure(f"{name}_find_caller", logger.findCaller, number))
+        results.update(measure(f"{name}_records", lambda: logger.debug("message %s", "args"), number))
+    return results
+
+
+@benchmark
+def bench_exception_formatting(number: int = 20000) -> dict:
+    """Formatting of a repeated exception with the stock formatter, PlainFormatter and JsonFormatter."""
+
+    def fail(depth):
+        if depth:
+            fail(depth - 1)
+        raise RuntimeError("failure")
+
+    try:
+        fail(10)
+    except RuntimeError:
+        exc_info = sys.exc_info()
+    record = logging.makeLogRecord({"msg": "message", "exc_info": exc_info})
+    results = measure("stock_text", lambda: logging.Formatter().formatException(exc_info), number)
+    plain_formatter = reconplogger.PlainFormatter()
+    results.update(measure("cached_text", lambda: plain_formatter.formatException(exc_info), number))
+    for name, formatter in [
+        ("json_text", reconplogger.JsonFormatter()),
+        ("json_structured", reconplogger.JsonFormatter(structured_exc_info=True)),
+    ]:
+        results.update(measure(f"{name}_records", lambda: formatter.format(record), number))
+    return results
+
+
+@benchmark
+def bench_formatter_size_limits(number: int = 2000, size: int = 1000000) -> dict:
+    """Records with a large message and short records formatted without and with size limits."""
+    record = logging.makeLogRecord({"msg": "payload %s", "args": ("x" * size,), "levelno": logging.INFO})
+    short = logging.makeLogRecord({"msg": "payload %s", "args": ("x",), "levelno": logging.INFO})
+    formatters = [
+        ("plain", reconplogger.PlainFormatter, {}),
+        ("plain_reconplogger_format", reconplogger.PlainFormatter, {"fmt": reconplogger.reconplogger_format}),
+        ("json", reconplogger.JsonFormatter, {}),
+    ]
+    results = {}
+    for name, formatter_class, kwargs in formatters:
+        unlimited = formatter_class(**kwargs)
+        limited = formatter_class(max_message_bytes=10000, max_field_bytes=10000, **kwargs)
+        results.update(measure(f"{name}_large_records", lambda: unlimited.format(record), number))
+        results.update(measure(f"{name}_limited_large_records", lambda: limited.format(record), number))
+        results.update(measure(f"{name}_short_records", lambda: unlimited.format(short), 20 * number))
+        results.update(measure(f"{name}_limited_short_records", lambda: limited.format(short), 20 * number))
+    return results
+
+
+@benchmark
+def bench_log_event(number: int = 50000) -> dict:
+    """Disabled and enabled structured events compared to debug calls with an f-string message."""
+    logger = setup_logger("json_logger", level="INFO")
+    logger.setLevel(logging.INFO)
+    values = list(range(100))
+    with patch.object(logger.handlers[0], "stream", NullStream()):
+        results = measure("disabled_fstring_debug", lambda: logger.debug(f"cache miss size={sum(values)}"), number)
+        results.update(
+            measure(
+                "disabled_event", lambda: logger.event("cache_miss", level="DEBUG", size=lambda: sum(values)), number
+            )
+        )
+        results.update(measure("enabled_fstring_info", lambda: logger.info(f"cache miss size={sum(values)}"), number))
+        results.update(measure("enabled_event", lambda: logger.event("cache_miss", size=lambda: sum(values)), number))
+    reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_file_handler(number: int = 20000) -> dict:
+    """Records written to disk by a plain FileHandler and by a BufferedFileHandler."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="_reconplogger_bench_") as tmpdir:
+        for name, handler_class in [("file", logging.FileHandler), ("buffered_file", reconplogger.BufferedFileHandler)]:
+            handler = handler_class(os.path.join(tmpdir, f"{name}.log"))
+            handler.setFormatter(reconplogger.PlainFormatter(reconplogger.reconplogger_format))
+            record = logging.makeLogRecord({"msg": "message %s", "args": ("args",), "levelno": logging.INFO})
+            results.update(measure(f"{name}_records", lambda: handler.handle(record), number))
+            handler.close()
+    return results
+
+
+@benchmark
+def bench_flight_recorder(number: int = 50000) -> dict:
+    """Records kept by a FlightRecorderHandler compared to a BufferedFileHandler."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="_reconplogger_bench_") as tmpdir:
+        handlers = [
+            ("buffered_file", reconplogger.BufferedFileHandler(os.path.join(tmpdir, "buffered.log"))),
+            ("flight_recorder", reconplogger.FlightRecorderHandler(os.path.join(tmpdir, "flight.rec"))),
+        ]
+        for name, handler in handlers:
+            handler.setFormatter(reconplogger.PlainFormatter(reconplogger.reconplogger_format))
+            record = logging.makeLogRecord({"msg": "message %s", "args": ("args",), "levelno": logging.DEBUG})
+            results.update(measure(f"{name}_records", lambda: handler.handle(record), number))
+            handler.close()
+    return results
+
+
+@benchmark
+def bench_async_logging(requests: int = 500, records: int = 5, delay: float = 0.0002) -> dict:
+    """Per request latency with synchronous and with async logging when the stream is slow.
+
+    Each request emits a few log records.
+    """
+    results = {}
+    for async_logging in [False, True]:
+        logger = setup_logger(level="INFO", async_logging=async_logging)
+        stream_handler = getattr(logger.handlers[0], "handler", logger.handlers[0])
+        latencies = []
+        with patch.object(stream_handler, "stream", SlowStream(delay)):
+            for num in range(requests):
+                start = time.perf_counter()
+                for _ in range(records):
+                    logger.info("request %d handled", num)
+                latencies.append((time.perf_counter() - start) * 1e6)
+            reconplogger.reset_configs()
+        mode = "async" if async_logging else "sync"
+        results[f"{mode}_request_p50_us"] = percentile(latencies, 0.5)
+        results[f"{mode}_request_p99_us"] = percentile(latencies, 0.99)
+    return results
+
+
+@benchmark
+def bench_async_backpressure(requests: int = 300, delay: float = 0.0002) -> dict:
+    """Per request latency and dropped records of each backpressure policy when the stream is slow.
+
+    Each request emits four DEBUG records and one WARNING into a small queue.
+    """
+    results = {}
+    for policy in ["block", "drop_newest", "drop_oldest", "drop_below_level"]:
+        with patch.multiple(reconplogger, async_logging_queue_size=50, async_logging_backpressure=policy):
+            logger = setup_logger(level="DEBUG", async_logging=True)
+        async_handler = logger.handlers[0]
+        latencies = []
+        with patch.object(async_handler.handler, "stream", SlowStream(delay)):
+            for num in range(requests):
+                start = time.perf_counter()
+                for _ in range(4):
+                    logger.debug("request %d step", num)
+                logger.warning("request %d slow", num)
+                latencies.append((time.perf_counter() - start) * 1e6)
+            dropped = async_handler.dropped
+            reconplogger.reset_configs()
+        results[f"{policy}_request_p50_us"] = percentile(latencies, 0.5)
+        results[f"{policy}_request_p99_us"] = percentile(latencies, 0.99)
+        results[f"{policy}_dropped"] = dropped
+    return results
+
+
+@benchmark
+def bench_correlation_id_filter(number: int = 200000) -> dict:
+    """Per record cost of the correlation ID filter compared to a bare ContextVar.get()."""
+    correlation_filter = reconplogger._CorrelationIdLoggingFilter()
+    record = logging.makeLogRecord({"msg": "message"})
+    results = measure("contextvar_get", reconplogger.current_correlation_id.get, number)
+    results.update(measure("filter_without_id", lambda: correlation_filter.filter(record), number))
+    with reconplogger.correlation_id_context("correlation-id"):
+        results.update(measure("filter_with_id", lambda: correlation_filter.filter(record), number))
+    return results
+
+
+@benchmark
+def bench_correlation_id_generation(number: int = 200000, threads: int = 8) -> dict:
+    """Throughput of generate_correlation_id compared to uuid4, in one and in several threads."""
+    generators = {"uuid4": lambda: str(uuid.uuid4()), "generated": reconplogger.generate_correlation_id}
+    results = {}
+    for name, generate in generators.items():
+        results.update(measure(f"{name}_ids", generate, number))
+
+        def work():
+            for _ in range(number // threads):
+                generate()
+
+        workers = [threading.Thread(target=work) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        results[f"{name}_threaded_ids_per_s"] = threads * (number // threads) / (time.perf_counter() - start)
+    return results
+
+
+@benchmark
+def bench_rate_limit_filter(number: int = 200000) -> dict:
+    """Per record cost of the rate limit filter for a site within and a site over its limit."""
+    rate_limit = reconplogger.RateLimitFilter(rate=1e9, burst=1e9)
+    record = logging.makeLogRecord({"msg": "message", "pathname": __file__, "lineno": 10})
+    results = measure("passed_records", lambda: rate_limit.filter(record), number)
+    rate_limit = reconplogger.RateLimitFilter(rate=0.001, burst=1)
+    results.update(measure("suppressed_records", lambda: rate_limit.filter(record), number))
+    return results
+
+
+@benchmark
+def bench_json_formatter(number: int = 20000) -> dict:
+    """Records formatted by JsonFormatter with extra, for each of the available serializers."""
+    record = logging.getLogger("bench").makeRecord(
+        "bench", logging.INFO, __file__, 10, "message %s", ("args",), None, "func", extra={"uuid": "1234"}
+    )
+    results = {}
+    for serializer in reconplogger._json_serializers:
+        try:
+            formatter = reconplogger.JsonFormatter(extra={"app": "bench"}, serializer=serializer)
+        except ImportError:
+            continue
+        results.update(measure(f"{serializer}_records", lambda: formatter.format(record), number))
+    return results
+
+
+@benchmark
+def bench_wsgi_middleware(number: int = 50000) -> dict:
+    """Round trips through CorrelationIdWsgiMiddleware compared to the bare WSGI app."""
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b""]
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    middleware = reconplogger.CorrelationIdWsgiMiddleware(app)
+    environ = {"HTTP_CORRELATION_ID": "correlation-id"}
+    results = measure("bare_app_requests", lambda: app(environ, start_response), number)
+    results.update(measure("middleware_requests", lambda: middleware(environ, start_response), number))
+    results.update(measure("middleware_requests_without_id", lambda: middleware({}, start_response), number))
+    return results
+
+
+@benchmark
+def bench_request_log_buffering(number: int = 5000, records: int = 5) -> dict:
+    """Successful requests that log a few DEBUG records, emitted and with request log buffering."""
+    logger = setup_logger("json_logger", level="DEBUG")
+
+    def app(environ, start_response):
+        for num in range(records):
+            logger.debug("request step %d", num)
+        start_response("200 OK", [])
+        return [b""]
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    buffering = reconplogger.RequestLogBuffering()
+    logger.addFilter(buffering)
+    middleware = reconplogger.CorrelationIdWsgiMiddleware(app)
+    buffered_middleware = reconplogger.CorrelationIdWsgiMiddleware(app, buffering=buffering)
+    environ = {"HTTP_CORRELATION_ID": "correlation-id"}
+    with patch.object(logger.handlers[0], "stream", NullStream()):
+        results = measure("emitted_requests", lambda: middleware(environ, start_response), number)
+        results.update(measure("buffered_requests", lambda: buffered_middleware(environ, start_response), number))
+    logger.removeFilter(buffering)
+    reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_asgi_middleware(number: int = 50000) -> dict:
+    """Round trips through CorrelationIdAsgiMiddleware compared to the bare ASGI app.
+
+    The apps never suspend, so their coroutines are driven directly without an event loop.
+    """
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    def run(asgi_app, scope):
+        try:
+            asgi_app(scope, receive, send).send(None)
+        except StopIteration:
+            pass
+
+    middleware = reconplogger.CorrelationIdAsgiMiddleware(app)
+    scope = {"type": "http", "headers": [(b"host", b"localhost"), (b"correlation-id", b"correlation-id")]}
+    scope_without_id = {"type": "http", "headers": [(b"host", b"localhost")]}
+    results = measure("bare_app_requests", lambda: run(app, scope), number)
+    results.update(measure("middleware_requests", lambda: run(middleware, scope), number))
+    results.update(measure("middleware_requests_without_id", lambda: run(middleware, scope_without_id), number))
+    return results
+
+
+@benchmark
+def bench_requests_patch(number: int = 5000) -> dict:
+    """Overhead of the requests patch against a local stub adapter."""
+    if not requests or not reconplogger.patch_requests():
+        return {}
+
+    class StubAdapter(requests.adapters.BaseAdapter):
+        def send(self, request, **kwargs):
+            response = requests.models.Response()
+            response.status_code = 200
+            response.request = request
+            return response
+
+        def close(self):
+            pass
+
+    session = requests.Session()
+    session.mount("http://", StubAdapter())
+    url = "http://localhost/"
+    results = measure("unpatched_requests", lambda: session.request_orig("GET", url), number)
+    with reconplogger.correlation_id_context("correlation-id"):
+        results.update(measure("patched_requests", lambda: session.request("GET", url), number))
+    return results
+
+
+@benchmark
+def bench_log_writer(workers: int = 4, records: int = 20000) -> dict:
+    """Throughput of forked workers logging to one file, each with its own handler and through a log writer.
+
+    The time includes waiting for the writer to emit all the records.
+    """
+    import multiprocessing
+
+    fork = multiprocessing.get_context("fork")
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="_reconplogger_bench_") as tmpdir:
+        socket_path = os.path.join(tmpdir, "writer.sock")
+        for mode in ["local", "writer"]:
+            log_file = os.path.join(tmpdir, f"{mode}.log")
+            cfg = {
+                "version": 1,
+                "formatters": {
+                    "plain": {"()": "reconplogger.PlainFormatter", "format": reconplogger.reconplogger_format}
+                },
+                "handlers": {"file": {"class": "logging.FileHandler", "filename": log_file, "formatter": "plain"}},
+                "loggers": {"bench_workers": {"handlers": ["file"], "level": "INFO"}},
+            }
+            reconplogger.reset_configs()
+            writer = reconplogger.start_log_writer(socket_path, config=cfg) if mode == "writer" else None
+
+            def work():
+                reconplogger.reset_configs()
+                logger = reconplogger.logger_setup("bench_workers", config=cfg, log_writer=writer and socket_path)
+                for num in range(records):
+                    logger.info("record %d", num)
+                logging.shutdown()
+
+            start = time.perf_counter()
+            processes = [fork.Process(target=work) for _ in range(workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            if writer:
+                writer.terminate()
+                writer.join()
+            elapsed = time.perf_counter() - start
+            with open(log_file) as f:
+                assert sum(1 for _ in f) == workers * records
+            results[f"{mode}_records_per_s"] = workers * records / elapsed
+    reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_load_config(number: int = 500) -> dict:
+    """Cycles of reset_configs and logger_setup with the config in a yaml file, a json file and an env var."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="_reconplogger_bench_") as tmpdir:
+        for name in ["yaml", "json"]:
+            path = os.path.join(tmpdir, f"cfg.{name}")
+            with open(path, "w") as f:
+                if name == "yaml":
+                    yaml.safe_dump(reconplogger.reconplogger_default_cfg, f)
+                else:
+                    json.dump(reconplogger.reconplogger_default_cfg, f)
+            results.update(measure(f"{name}_file_setups", lambda: setup_logger(config=path), number))
+        with patch.dict(os.environ, {"BENCH_LOGGER_CFG": json.dumps(reconplogger.reconplogger_default_cfg)}):
+            results.update(measure("env_var_setups", lambda: setup_logger(config="BENCH_LOGGER_CFG"), number))
+    reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_reload_config(number: int = 500) -> dict:
+    """Changing a logger level with a full dictConfig pass compared to reload_config."""
+    cfg = copy.deepcopy(reconplogger.reconplogger_default_cfg)
+    levels = iter(["INFO", "DEBUG"] * (8 * number))
+
+    def changed_cfg():
+        cfg["loggers"]["plain_logger"]["level"] = next(levels)
+        return copy.deepcopy(cfg)
+
+    reconplogger.reset_configs()
+    results = measure("dictconfig", lambda: logging.config.dictConfig(changed_cfg()), number)
+    reconplogger.load_config(changed_cfg())
+    results.update(measure("reload_config", lambda: reconplogger.reload_config(changed_cfg()), number))
+    reconplogger.reset_configs()
+    return results
+
+
+@benchmark
+def bench_import_time(repeat: int = 5) -> dict:
+    """Cumulative import time of reconplogger as reported by ``python -X importtime``."""
+    results = {}
+    for lazy in ["false", "true"]:
+        times = []
+        for _ in range(repeat):
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", "import reconplogger"],
+                env=dict(os.environ, LOGGER_LAZY_IMPORTS=lazy),
+                cwd=os.path.dirname(os.path.abspath(reconplogger.__file__)),
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            line = next(line for line in result.stderr.splitlines() if line.endswith("| reconplogger"))
+            times.append(int(line.split("|")[1]))
+        results[f"{'lazy' if lazy == 'true' else 'eager'}_import_us"] = min(times)
+    return results
+
+
+def run_benchmarks(names=None) -> dict:
+    """Runs the given benchmarks, or all if None, and returns their results."""
+    results = {}
+    for name in names or benchmarks:
+        if name not in benchmarks:
+            raise ValueError(f'Unknown benchmark "{name}". Available: {list(benchmarks)}.')
+        results[name] = benchmarks[name]()
+    return results
+
+
+def compare_results(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns descriptions of the metrics that regressed more than threshold with respect to baseline."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(name, {}).get(metric)
+            if not reference:
+                continue
+            change = value / reference - 1
+            if metric.endswith("_per_s"):
+                change = -change
+            if change > threshold:
+                regressions.append(f"{name}.{metric}: {reference:.4g} -> {value:.4g} ({change:+.0%} worse)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the hot paths of reconplogger.")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run, by default all: {list(benchmarks)}.")
+    parser.add_argument("--json", help="Path where to save the results in json format.")
+    parser.add_argument("--baseline", help="Path to results in json format to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names)
+    for name, metrics in results.items():
+        print(f"{name}: " + ", ".join(f"{k}={v:.4g}" for k, v in metrics.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": platform.python_version(), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f)["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,31 @@
 #!/usr/bin/env python3
 
+import asyncio
+import copy
+import datetime
+import gc
+import gzip
+import json
 import logging
+import multiprocessing
 import os
 import random
 import shutil
+import signal
+import subprocess
 import sys
 import tempfile
 import threading
+import time
+import traceback
 import unittest
 import uuid
+import weakref
 from contextlib import ExitStack, contextmanager
+from importlib.util import find_spec
 from io import StringIO
 from typing import Iterator
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from testfixtures import Comparison, LogCapture, compare
 
@@ -48,6 +61,7 @@ class TestReconplogger(unittest.TestCase):
         reconplogger.reset_configs()
 
     def tearDown(self):
+        reconplogger.reset_configs()
         root = logging.getLogger()
         root.handlers = self._root_handlers
         root.setLevel(self._root_level)
@@ -87,6 +101,83 @@ class TestReconplogger(unittest.TestCase):
                 compare(Comparison(exception), log.records[-1].exc_info[1])
                 log.check(("json_logger", "ERROR", error_msg))
 
+    def test_json_formatter_serializers(self):
+        """The builtin serializer output is byte-compatible with json.dumps."""
+        record = logging.makeLogRecord(
+            {"msg": "message with unicode ü", "levelname": "INFO", "custom": {"values": [1, 2.5, None, True]}}
+        )
+        record.exc_info = None
+        stdlib = reconplogger.JsonFormatter(serializer="stdlib")
+        builtin = reconplogger.JsonFormatter(extra={"date": datetime.date(2020, 1, 2)})
+        self.assertIsNotNone(builtin._serialize)
+        log_data = {"message": "ü", "custom": {"values": [1, 2.5]}, "date": datetime.date(2020, 1, 2), "obj": object}
+        self.assertEqual(builtin.jsonify_log_record(log_data), stdlib.jsonify_log_record(log_data))
+        self.assertEqual(json.loads(builtin.format(record))["custom"], {"values": [1, 2.5, None, True]})
+        formatters = [
+            (reconplogger.JsonFormatter(**kwargs), reconplogger.JsonFormatter(serializer="stdlib", **kwargs))
+            for kwargs in [{}, {"fmt": "%(levelname)s %(message)s"}, {"rename_fields": {"levelname": "level"}}]
+        ]
+        self.assertIsNotNone(formatters[0][0]._fixed_fields)
+        self.assertIsNone(formatters[2][0]._fixed_fields)
+        try:
+            raise ValueError("failed")
+        except ValueError:
+            exc_info = sys.exc_info()
+        records = [
+            record,
+            logging.makeLogRecord({"msg": {"key": "value", "levelname": "dict"}, "_private": 1}),
+            logging.makeLogRecord({"msg": "error", "exc_info": exc_info, "stack_info": "stack"}),
+        ]
+        for builtin_formatter, stdlib_formatter in formatters:
+            for fmt_record in records:
+                self.assertEqual(builtin_formatter.format(fmt_record), stdlib_formatter.format(fmt_record))
+
+        circular = {}
+        circular["circular"] = circular
+        with self.assertRaises(ValueError):
+            builtin.jsonify_log_record(circular)
+        for serializer in ["orjson", "msgspec"]:
+            if find_spec(serializer):
+                formatter = reconplogger.JsonFormatter(serializer=serializer)
+                self.assertEqual(
+                    json.loads(formatter.jsonify_log_record(log_data)), json.loads(stdlib.jsonify_log_record(log_data))
+                )
+            else:
+                self.assertRaises(ImportError, lambda: reconplogger.JsonFormatter(serializer=serializer))
+        self.assertRaises(ValueError, lambda: reconplogger.JsonFormatter(serializer="invalid"))
+
+    def test_cached_timestamps(self):
+        """Cached timestamps are the same as the uncached ones, also when formatting from many threads."""
+        plain = reconplogger.PlainFormatter(reconplogger.reconplogger_format)
+        json_formatter = reconplogger.JsonFormatter(fmt="%(timestamp)s %(message)s")
+        json_asctime = reconplogger.JsonFormatter()
+        reference = logging.Formatter(reconplogger.reconplogger_format)
+        reference_asctime = logging.Formatter(datefmt=json_asctime.datefmt)
+        errors = []
+
+        def check(offset):
+            for num in range(200):
+                record = logging.makeLogRecord({"msg": "message"})
+                record.created = 1600000000 + offset + num * 0.37
+                record.msecs = (record.created - int(record.created)) * 1000
+                expected = datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                timestamp = json.loads(json_formatter.format(record))["timestamp"]
+                if (
+                    plain.formatTime(record) != reference.formatTime(record)
+                    or timestamp[:19] != expected.strftime("%Y-%m-%dT%H:%M:%S")
+                    or abs(float(timestamp[19:-1]) - expected.microsecond / 1e6) > 1e-5
+                    or json.loads(json_asctime.format(record))["timestamp"]
+                    != reference_asctime.formatTime(record, json_asctime.datefmt)
+                ):
+                    errors.append(record.created)
+
+        threads = [threading.Thread(target=check, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
     def test_plain_logger_setup(self):
         """Test logger_setup without specifying environment variable names."""
         logger = reconplogger.logger_setup()
@@ -198,6 +289,343 @@ class TestReconplogger(unittest.TestCase):
                 reconplogger.get_correlation_id()
             self.assertIn("used outside correlation_id_context", str(ctx.exception))
 
+    def test_correlation_id_filter_does_not_search_modules(self):
+        """The correlation ID filter does not call find_spec for every record."""
+        correlation_filter = reconplogger._CorrelationIdLoggingFilter()
+        with patch("reconplogger.find_spec", side_effect=AssertionError("find_spec called")):
+            record = logging.makeLogRecord({"msg": "without correlation id"})
+            self.assertTrue(correlation_filter.filter(record))
+            self.assertFalse(hasattr(record, "correlation_id"))
+            with reconplogger.correlation_id_context("cid"):
+                record = logging.makeLogRecord({"msg": "with correlation id"})
+                self.assertTrue(correlation_filter.filter(record))
+                self.assertEqual(record.correlation_id, "cid")
+            if Flask:
+                with Flask(__name__).test_request_context("/"):
+                    reconplogger.g.correlation_id = "flask-cid"
+                    record = logging.makeLogRecord({"msg": "with flask correlation id"})
+                    self.assertTrue(correlation_filter.filter(record))
+                    self.assertEqual(record.correlation_id, "flask-cid")
+
+    @unittest.skipIf(not Flask, "flask package is required")
+    def test_correlation_id_filter_outside_of_flask_request(self):
+        """Outside of flask requests the filter only looks up the request context variable."""
+        correlation_filter = reconplogger._CorrelationIdLoggingFilter()
+        self.assertIsNone(reconplogger._flask_correlation_id(None))
+        if reconplogger._flask_request_context is None:
+            self.skipTest("flask without a request context variable")
+        has_request_context = Mock(side_effect=AssertionError("has_request_context called"))
+        with patch("reconplogger._flask_accessors", (reconplogger.g, has_request_context)):
+            record = logging.makeLogRecord({"msg": "outside of request"})
+            self.assertTrue(correlation_filter.filter(record))
+            self.assertFalse(hasattr(record, "correlation_id"))
+            self.assertIsNone(reconplogger._flask_correlation_id(None))
+        has_request_context.assert_not_called()
+
+    def test_correlation_id_sampling(self):
+        """Sampling keeps or drops all records of a correlation ID and always keeps WARNING and above."""
+        logger = reconplogger.logger_setup(level="DEBUG", sample_rate=0.5)
+        sampling_filter = logger.filters[-1]
+        self.assertIsInstance(sampling_filter, reconplogger.CorrelationIdSamplingFilter)
+        kept = set()
+        with LogCapture(names="plain_logger", attributes=("correlation_id", "levelname")) as log:
+            for num in range(200):
+                with reconplogger.correlation_id_context(f"id-{num}"):
+                    logger.debug("first")
+                    logger.info("second")
+                    logger.warning("warning")
+            logger.info("without correlation id")
+            for correlation_id, levelname in log.actual():
+                if levelname == "DEBUG":
+                    kept.add(correlation_id)
+            counts = {cid: sum(1 for c, _ in log.actual() if c == cid) for cid in kept}
+        self.assertTrue(60 < len(kept) < 140)
+        self.assertEqual(set(counts.values()), {3})
+        self.assertEqual(sampling_filter.dropped, 2 * (200 - len(kept)))
+        self.assertEqual(len(log.actual()), 200 + 2 * len(kept) + 1)
+
+        same_filter = reconplogger.CorrelationIdSamplingFilter(rate=0.5)
+        for correlation_id in kept:
+            record = logging.makeLogRecord({"levelno": logging.DEBUG, "correlation_id": correlation_id})
+            self.assertTrue(same_filter.filter(record))
+        self.assertRaises(ValueError, lambda: reconplogger.CorrelationIdSamplingFilter(rate=2))
+
+        reconplogger.reset_configs()
+        with patch.dict(os.environ, {"LOGGER_SAMPLE_RATE": "invalid"}):
+            self.assertRaises(ValueError, lambda: reconplogger.logger_setup())
+
+    def test_log_event(self):
+        """Events are emitted with lazily evaluated fields as top level JSON keys."""
+        calls = []
+
+        def expensive():
+            calls.append(1)
+            return 123
+
+        logger = reconplogger.logger_setup(logger_name="json_logger", level="INFO")
+        with capture_logs(logger) as captured, patch.object(logger, "propagate", False):
+            logger.event("cache_miss", level="DEBUG", key="k", size=expensive)
+            self.assertEqual(calls, [])
+            logger.event("cache_miss", key="k", size=expensive)
+        self.assertEqual(calls, [1])
+        record = json.loads(captured.getvalue())
+        self.assertEqual(record["message"], "cache_miss")
+        self.assertEqual(record["event"], "cache_miss")
+        self.assertEqual((record["key"], record["size"]), ("k", 123))
+        self.assertEqual(record["filename"], os.path.basename(__file__))
+
+        plain_logger = logging.getLogger("plain_logger")
+        with capture_logs(plain_logger) as captured:
+            reconplogger.log_event(plain_logger, "failed", level="ERROR", name="n", error=lambda: 1 / 0)
+        self.assertIn("failed name=n error=<evaluation failed: ZeroDivisionError", captured.getvalue())
+        self.assertRaises(ValueError, lambda: logger.event("cache_miss", level="INVALID"))
+        reconplogger.null_logger.event("ignored", size=expensive)
+
+        records = []
+        with patch.object(logger, "handle", records.append), patch.object(plain_logger, "handle", records.append):
+            logger.event("call_site")
+            reconplogger.log_event(plain_logger, "call_site")
+        self.assertEqual([(r.funcName, r.filename) for r in records], [("test_log_event", "reconplogger_tests.py")] * 2)
+
+    def test_load_config_parse_cache(self):
+        """Parsed configs are cached by file path, modification time and size or by env var value."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cfg_file = os.path.join(tmpdir, "cfg.json")
+        cfg = copy.deepcopy(reconplogger.reconplogger_default_cfg)
+        with open(cfg_file, "w") as f:
+            json.dump(cfg, f)
+
+        with patch("yaml.safe_load", side_effect=AssertionError("json should not be parsed as yaml")):
+            first = reconplogger._parse_config(cfg_file)
+        first["loggers"]["plain_logger"]["level"] = "ERROR"
+        with patch("yaml.safe_load") as safe_load, patch("json.loads") as json_loads:
+            second = reconplogger._parse_config(cfg_file)
+            safe_load.assert_not_called()
+            json_loads.assert_not_called()
+        self.assertEqual(second["loggers"]["plain_logger"]["level"], "DEBUG")
+
+        cfg["loggers"]["plain_logger"]["level"] = "WARNING"
+        with open(cfg_file, "w") as f:
+            json.dump(cfg, f)
+        self.assertEqual(reconplogger._parse_config(cfg_file)["loggers"]["plain_logger"]["level"], "WARNING")
+
+        with patch.dict(os.environ, {"TEST_CFG": "version: 1\nroot: {level: INFO}"}):
+            self.assertEqual(reconplogger._parse_config("TEST_CFG")["root"], {"level": "INFO"})
+            os.environ["TEST_CFG"] = "version: 1\nroot: {level: ERROR}"
+            self.assertEqual(reconplogger._parse_config("TEST_CFG")["root"], {"level": "ERROR"})
+
+        reordered = dict(reversed(list(cfg.items())))
+        self.assertEqual(reconplogger._config_hash(cfg), reconplogger._config_hash(reordered))
+        reordered["root"] = {"level": "INFO"}
+        self.assertNotEqual(reconplogger._config_hash(cfg), reconplogger._config_hash(reordered))
+
+    def test_reload_config(self):
+        """Reloading a config only touches what changed and does not lose buffered records."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        self.addCleanup(shutil.rmtree, tmpdir)
+        log_file = os.path.join(tmpdir, "reload.log")
+        cfg = {
+            "version": 1,
+            "formatters": {"plain": {"format": "%(levelname)s %(message)s"}},
+            "handlers": {
+                "stream": {
+                    "class": "logging.handlers.BufferingHandler",
+                    "capacity": 100,
+                    "formatter": "plain",
+                    "level": "INFO",
+                },
+                "file": {
+                    "class": "reconplogger.BufferedFileHandler",
+                    "filename": log_file,
+                    "formatter": "plain",
+                    "flush_interval": None,
+                },
+            },
+            "loggers": {"reload_logger": {"handlers": ["stream", "file"], "level": "DEBUG"}},
+        }
+        reconplogger.load_config(copy.deepcopy(cfg))
+        logger = logging.getLogger("reload_logger")
+        stream_handler, file_handler = logger.handlers
+        logger.info("before reload")
+
+        cfg["loggers"]["reload_logger"]["level"] = "WARNING"
+        cfg["handlers"]["stream"]["level"] = "ERROR"
+        reconplogger.reload_config(copy.deepcopy(cfg))
+        self.assertEqual(logger.handlers, [stream_handler, file_handler])
+        self.assertEqual((logger.level, stream_handler.level), (logging.WARNING, logging.ERROR))
+        self.assertGreater(file_handler._buffered, 0)
+
+        old_formatter = file_handler.formatter
+        cfg["formatters"]["plain"]["format"] = "%(message)s"
+        reconplogger.reload_config(copy.deepcopy(cfg))
+        self.assertEqual(logger.handlers, [stream_handler, file_handler])
+        self.assertIsNot(file_handler.formatter, old_formatter)
+        self.assertIs(stream_handler.formatter, file_handler.formatter)
+
+        cfg["handlers"]["file"]["buffer_size"] = 1024
+        reconplogger.reload_config(copy.deepcopy(cfg))
+        new_file_handler = logging._handlers["file"]
+        self.assertIsNot(new_file_handler, file_handler)
+        self.assertEqual(new_file_handler.buffer_size, 1024)
+        self.assertEqual(logger.handlers, [stream_handler, new_file_handler])
+        logger.warning("after reload")
+        new_file_handler.flush()
+        with open(log_file) as f:
+            self.assertEqual(f.read(), "INFO before reload\nafter reload\n")
+
+        del cfg["handlers"]["stream"]
+        cfg["loggers"]["reload_logger"]["handlers"] = ["file"]
+        reconplogger.reload_config(copy.deepcopy(cfg))
+        self.assertEqual(logger.handlers, [new_file_handler])
+
+        # Reload on SIGHUP and on changes of the config file
+        cfg["loggers"]["reload_logger"]["level"] = "ERROR"
+        with patch.dict(os.environ, {"LOGGER_CFG": "RELOAD_TEST_CFG", "RELOAD_TEST_CFG": json.dumps(cfg)}):
+            reconplogger.watch_config(interval=60)
+            os.kill(os.getpid(), signal.SIGHUP)
+            for _ in range(200):
+                if logger.level == logging.ERROR:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(logger.level, logging.ERROR)
+            reconplogger.reset_configs()
+
+        cfg_file = os.path.join(tmpdir, "cfg.yaml")
+        with open(cfg_file, "w") as f:
+            json.dump(cfg, f)
+        with patch.dict(os.environ, {"LOGGER_CFG": cfg_file}):
+            reconplogger.reload_config()
+            reconplogger.watch_config(interval=0.01, sighup=False)
+            cfg["loggers"]["reload_logger"]["level"] = "CRITICAL"
+            with open(cfg_file, "w") as f:
+                json.dump(cfg, f)
+            for _ in range(200):
+                if logger.level == logging.CRITICAL:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(logger.level, logging.CRITICAL)
+
+    @patch.dict(os.environ, {"LOGGER_ASYNC": "true"})
+    def test_reload_config_async_level(self):
+        """With async logging, reloading a handler level also applies to its queue wrapper."""
+        cfg = {
+            "version": 1,
+            "handlers": {"buffer": {"class": "logging.handlers.BufferingHandler", "capacity": 100, "level": "DEBUG"}},
+            "loggers": {"reload_async": {"handlers": ["buffer"], "level": "DEBUG"}},
+        }
+        logger = reconplogger.logger_setup("reload_async", config=copy.deepcopy(cfg))
+        async_handler = logger.handlers[0]
+        self.assertIsInstance(async_handler, reconplogger._AsyncQueueHandler)
+
+        cfg["handlers"]["buffer"]["level"] = "ERROR"
+        reconplogger.reload_config(copy.deepcopy(cfg))
+        self.assertEqual((async_handler.level, async_handler.handler.level), (logging.ERROR, logging.ERROR))
+        logger.info("dropped")
+        logger.error("kept")
+
+        cfg["handlers"]["buffer"]["capacity"] = 50
+        cfg["handlers"]["buffer"]["level"] = "WARNING"
+        reconplogger.reload_config(copy.deepcopy(cfg))
+        self.assertEqual(async_handler.level, logging.WARNING)
+        logger.info("dropped")
+        logger.warning("kept")
+        reconplogger.reset_configs()
+        messages = [record.getMessage() for record in async_handler.handler.buffer]
+        self.assertEqual(messages, ["kept"])
+
+    @patch.dict(os.environ, {"LOGGER_ASYNC": "true", "LOGGER_ROOT_HANDLER": "buffer", "LOGGER_ROOT_LEVEL": "WARNING"})
+    def test_reload_config_async_root_handler(self):
+        """With async logging, reloads keep the queue wrapper of the root handler and stop replaced listeners."""
+        cfg = {
+            "version": 1,
+            "handlers": {"buffer": {"class": "logging.handlers.BufferingHandler", "capacity": 100, "level": "DEBUG"}},
+            "loggers": {"reload_async_root": {"handlers": ["buffer"], "level": "DEBUG"}},
+        }
+        reconplogger.logger_setup("reload_async_root", config=copy.deepcopy(cfg))
+        self.addCleanup(reconplogger.reset_configs)
+        root = logging.getLogger()
+        async_handler = root.handlers[0]
+        self.assertIsInstance(async_handler, reconplogger._AsyncQueueHandler)
+        self.assertEqual(async_handler.level, logging.WARNING)
+
+        cfg["handlers"]["buffer"]["level"] = "INFO"
+        reconplogger.reload_config(copy.deepcopy(cfg))
+        self.assertEqual(root.handlers, [async_handler])
+        self.assertEqual((async_handler.level, async_handler.handler.level), (logging.WARNING, logging.WARNING))
+
+        old_handler = async_handler.handler
+        cfg["handlers"]["buffer"]["capacity"] = 50
+        reconplogger.reload_config(copy.deepcopy(cfg))
+        self.assertIsInstance(root.handlers[0], reconplogger._AsyncQueueHandler)
+        self.assertIsNot(reconplogger._unwrap_handler(root.handlers[0]), old_handler)
+        self.assertNotIn(old_handler, reconplogger._async_handlers)
+        for listener in [h.listener for h in reconplogger._async_handlers.values()]:
+            self.assertIsNotNone(listener._thread)
+        self.assertEqual(len(reconplogger._async_handlers), 1)
+
+    def test_rate_limit_filter(self):
+        """Records of a call site are rate limited and the suppressed ones are reported."""
+        reconplogger.load_config(
+            {
+                "version": 1,
+                "filters": {"rate_limit": {"()": "reconplogger.RateLimitFilter", "rate": 0.001, "burst": 3}},
+                "handlers": {"null": {"class": "logging.NullHandler"}},
+                "loggers": {"rate_limited": {"handlers": ["null"], "filters": ["rate_limit"], "level": "DEBUG"}},
+            }
+        )
+        logger = logging.getLogger("rate_limited")
+        rate_limit = logger.filters[0]
+
+        def noisy(num):
+            logger.warning("noisy %d", num)
+
+        self.assertIsInstance(rate_limit, reconplogger.RateLimitFilter)
+        with LogCapture(names="rate_limited", attributes=("getMessage",)) as log:
+            for num in range(100):
+                noisy(num)
+            logger.warning("other call site")
+            self.assertEqual(log.actual(), ["noisy 0", "noisy 1", "noisy 2", "other call site"])
+        self.assertEqual(rate_limit.suppressed, 97)
+
+        rate_limit.summary_interval = 0
+        with LogCapture(names="rate_limited", attributes=("getMessage", "suppressed")) as log:
+            for num in range(2):
+                noisy(num)
+            log.check(("noisy 0 [suppressed 97 similar messages]", 97), ("noisy 1", None))
+
+        # Events keep their fields and bad args are left to the handlers
+        event = reconplogger._EventMessage("noisy_event", {"key": "k"})
+        for msg, args in [(event, None), ("bad %d", ("two", "args"))]:
+            rate_limit = reconplogger.RateLimitFilter(rate=0.001, burst=1)
+            records = [logging.makeLogRecord({"msg": msg, "args": args}) for _ in range(3)]
+            self.assertEqual([rate_limit.filter(record) for record in records[:2]], [True, False])
+            rate_limit.summary_interval = 0
+            self.assertTrue(rate_limit.filter(records[2]))
+            self.assertEqual((records[2].msg, records[2].args, records[2].suppressed), (msg, args, 1))
+        self.assertEqual(event.fields(), {"key": "k", "suppressed": 1})
+
+        rate_limit = reconplogger.RateLimitFilter(rate=0.001, burst=10, key="template", max_sites=2)
+
+        def log_records():
+            for num in range(250):
+                record = logging.makeLogRecord({"msg": "template %d", "args": (num,), "lineno": num})
+                passed.append(rate_limit.filter(record))
+
+        passed = []
+        threads = [threading.Thread(target=log_records) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(passed), 10)
+        self.assertEqual(rate_limit.suppressed, 990)
+
+        for msg in ["first", "second", "third"]:
+            rate_limit.filter(logging.makeLogRecord({"msg": msg}))
+        self.assertEqual([key[1] for key in rate_limit._sites], ["second", "third"])
+        self.assertRaises(ValueError, lambda: reconplogger.RateLimitFilter(key="invalid"))
+
     @unittest.skipIf(not Flask, "flask package is required")
     @patch.dict(
         os.environ,
@@ -222,6 +650,126 @@ class TestReconplogger(unittest.TestCase):
                 ("werkzeug", "WARNING", werkzeug_msg),
             )
 
+    @unittest.skipIf(not Flask, "flask package is required")
+    def test_request_log_buffering(self):
+        """Records of a request are only emitted when it fails, and the completed log always."""
+        app = Flask(__name__)
+        buffering = reconplogger.RequestLogBuffering(max_records=3)
+        logger = reconplogger.flask_app_logger_setup(flask_app=app, level="DEBUG", request_log_buffering=buffering)
+
+        @app.route("/<outcome>")
+        def handle(outcome):
+            for num in range(5):
+                app.logger.debug(f"{outcome} {num}")
+            logger.info(f"{outcome} info")
+            if outcome == "warning":
+                app.logger.warning("warning")
+                app.logger.debug("after warning")
+            elif outcome == "error":
+                return "error", 503
+            elif outcome == "raise":
+                raise RuntimeError("failure")
+            return "ok"
+
+        client = app.test_client()
+        with LogCapture(names=(app.logger.name, logger.name), attributes=("getMessage",)) as log:
+            client.get("/ok")
+            self.assertEqual(log.actual(), ["127.0.0.1 GET /ok HTTP/1.1 200"])
+            self.assertEqual(buffering.stats()["discarded_records"], 3)
+            log.clear()
+
+            client.get("/error")
+            self.assertEqual(log.actual(), ["error 3", "error 4", "error info", "127.0.0.1 GET /error HTTP/1.1 503"])
+            log.clear()
+
+            client.get("/warning")
+            self.assertEqual(log.actual()[2:-1], ["warning info", "warning", "after warning"])
+            log.clear()
+
+            client.get("/raise")
+            self.assertEqual(log.actual()[:3], ["raise 3", "raise 4", "raise info"])
+
+        self.assertEqual(
+            buffering.stats(),
+            {
+                "active_requests": 0,
+                "buffered_records": 0,
+                "buffered_bytes": 0,
+                "flushed_records": 9,
+                "discarded_records": 3,
+                "dropped_records": 12,
+            },
+        )
+        with LogCapture(names=logger.name, attributes=("getMessage",)) as log:
+            logger.debug("outside of requests")
+            log.check("outside of requests")
+
+        def failing_app(environ, start_response):
+            logger.debug("before exception")
+            raise ValueError("failure")
+
+        middleware = reconplogger.CorrelationIdWsgiMiddleware(failing_app, buffering=buffering)
+        with LogCapture(names=logger.name, attributes=("getMessage",)) as log:
+            self.assertRaises(ValueError, lambda: middleware({}, None))
+            log.check("before exception")
+        self.assertEqual(buffering.stats()["flushed_records"], 10)
+
+        # On flush the previous logger filters don't run again and the held messages are frozen
+        buffered_logger = logging.getLogger("buffered_logger")
+        buffered_logger.setLevel(logging.DEBUG)
+        filtered = []
+        buffered_logger.filters = [lambda record: not filtered.append(record), buffering]
+        self.addCleanup(setattr, buffered_logger, "filters", [])
+        items = ["first"]
+        token = buffering.start()
+        with LogCapture(names="buffered_logger", attributes=("getMessage",)) as log:
+            buffered_logger.debug("items %s", items)
+            items.append("second")
+            buffering.flush()
+            log.check("items ['first']")
+        buffering.end(token)
+        self.assertEqual(len(filtered), 1)
+
+    @unittest.skipIf(not Flask, "flask package is required")
+    def test_flask_request_log_cost(self):
+        """The request completed log has the duration, and the records and time spent logging in the request."""
+        app = Flask(__name__)
+        logger = reconplogger.flask_app_logger_setup(flask_app=app, logger_name="json_logger", level="DEBUG")
+
+        @app.route("/<int:records>")
+        def handle(records):
+            for num in range(records):
+                app.logger.debug(f"record {num}")
+            return "ok"
+
+        client = app.test_client()
+        with capture_logs(logger) as logs:
+            client.get("/3")
+            client.get("/0")
+        completed = [json.loads(line) for line in logs.getvalue().splitlines() if "GET" in line]
+        self.assertEqual([c["log_records"] for c in completed], [3, 0])
+        self.assertGreater(completed[0]["log_time_ms"], 0)
+        self.assertEqual(completed[1]["log_time_ms"], 0)
+        self.assertGreaterEqual(completed[0]["duration_ms"], completed[0]["log_time_ms"])
+
+        # Handlers recreated by a reload are also tracked, and untracked on reset
+        cfg = copy.deepcopy(reconplogger.reconplogger_default_cfg)
+        cfg["handlers"]["json_handler"].update({"stream": "ext://sys.stdout", "level": "DEBUG"})
+        reconplogger.reload_config(cfg)
+        with capture_logs(logger) as logs:
+            client.get("/2")
+        self.assertEqual(json.loads(logs.getvalue().splitlines()[-1])["log_records"], 2)
+        reconplogger.reset_configs()
+        self.assertNotIn("handle", vars(logger.handlers[0]))
+
+        # Without tracking the middleware doesn't keep costs
+        def wsgi_app(environ, start_response):
+            start_response("200 OK", [])
+            return [repr(reconplogger._request_log_cost.get()).encode()]
+
+        middleware = reconplogger.CorrelationIdWsgiMiddleware(wsgi_app)
+        self.assertEqual(middleware({}, Mock()), [b"None"])
+
     @unittest.skipIf(not Flask, "flask package is required")
     @patch.dict(
         os.environ,
@@ -352,6 +900,44 @@ class TestReconplogger(unittest.TestCase):
             expected_correlation_id,
         )
 
+    def test_lazy_imports(self):
+        """With LOGGER_LAZY_IMPORTS the import does not pull in flask and requests (import time regression guard)."""
+        code = "\n".join(
+            [
+                "import sys, reconplogger",
+                "assert 'requests' not in sys.modules and 'flask' not in sys.modules",
+                "with reconplogger.correlation_id_context('id'): pass",
+                "assert 'flask' not in sys.modules",
+                "assert reconplogger.flask_requests_patch == bool(reconplogger.find_spec('requests'))",
+            ]
+        )
+        env = dict(os.environ, LOGGER_LAZY_IMPORTS="true")
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            env=env,
+            cwd=os.path.dirname(os.path.abspath(reconplogger.__file__)),
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        imported = set()
+        for line in result.stderr.splitlines():
+            imported.add(line.split("|")[-1].strip())
+            if line.endswith("| reconplogger"):
+                break
+        self.assertIn("reconplogger", imported)
+        self.assertEqual(imported.intersection({"flask", "werkzeug", "requests", "urllib3"}), set())
+
+    @unittest.skipIf(not Flask, "flask package is required")
+    def test_lazy_imports_flask_symbols(self):
+        """In lazy mode the flask symbols are resolved on first access through the module."""
+        with patch.dict(reconplogger.__dict__):
+            del reconplogger.__dict__["g"]
+            del reconplogger.__dict__["request"]
+            self.assertIs(reconplogger.g, reconplogger.__dict__["g"])
+            with self.assertRaises(AttributeError):
+                reconplogger.undefined_attribute
+
     def test_add_file_handler(self):
         """Test the use of add_file_handler."""
         tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
@@ -390,6 +976,237 @@ class TestReconplogger(unittest.TestCase):
 
         shutil.rmtree(tmpdir)
 
+    def test_async_logging(self):
+        """With async_logging the configured handlers are emitted from listener threads."""
+        logger = reconplogger.logger_setup(level="INFO", async_logging=True)
+        async_handler = logger.handlers[0]
+        self.assertIsInstance(async_handler, reconplogger._AsyncQueueHandler)
+        self.assertEqual(async_handler.level, logging.INFO)
+        stream_handler = async_handler.handler
+        captured = StringIO()
+        with patch.object(stream_handler, "stream", captured):
+            logger.info("async message %s", "args")
+            async_handler.flush()
+            self.assertIn("async message args", captured.getvalue())
+
+            tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+            log_file = os.path.join(tmpdir, "async.log")
+            file_handler = reconplogger.add_file_handler(logger, file_path=log_file)
+            self.assertIsInstance(file_handler, reconplogger._AsyncQueueHandler)
+            logger.debug("async file message")
+            file_handler.close()
+            self.assertIn("async file message", open(log_file).read())
+            shutil.rmtree(tmpdir)
+
+            logger.info("flushed on reset")
+            reconplogger.reset_configs()
+            self.assertIn("flushed on reset", captured.getvalue())
+        self.assertIs(logger.handlers[0], stream_handler)
+
+    def test_async_logging_bounded_queue(self):
+        handler = logging.NullHandler()
+        async_handler = reconplogger._AsyncQueueHandler(handler, queue_size=2)
+        for num in range(5):
+            async_handler.handle(logging.makeLogRecord({"msg": f"message {num}"}))
+        self.assertEqual(async_handler.queue.qsize(), 2)
+        self.assertEqual(async_handler.dropped, 3)
+
+    def test_async_logging_backpressure(self):
+        """Full queues drop the newest, the oldest or low level records, or block, as configured."""
+
+        def record(level, msg):
+            return logging.makeLogRecord({"levelno": level, "levelname": logging.getLevelName(level), "msg": msg})
+
+        def queued(async_handler):
+            return [r.msg for r in async_handler.queue.queue]
+
+        drop_oldest = reconplogger._AsyncQueueHandler(logging.NullHandler(), 2, "drop_oldest")
+        for num in range(4):
+            drop_oldest.handle(record(logging.DEBUG, f"debug {num}"))
+        self.assertEqual(queued(drop_oldest), ["debug 2", "debug 3"])
+        self.assertEqual(drop_oldest.dropped, 2)
+
+        below = reconplogger._AsyncQueueHandler(logging.NullHandler(), 3, "drop_below_level", "WARNING")
+        below.handle(record(logging.DEBUG, "debug 0"))
+        below.handle(record(logging.WARNING, "warning 0"))
+        below.handle(record(logging.DEBUG, "debug 1"))
+        below.handle(record(logging.DEBUG, "debug 2"))
+        below.handle(record(logging.WARNING, "warning 1"))
+        below.handle(record(logging.ERROR, "error 0"))
+        self.assertEqual(queued(below), ["warning 0", "warning 1", "error 0"])
+        below.handle(record(logging.WARNING, "warning 2"))
+        self.assertEqual((below.dropped, below.blocked), (4, 0))
+
+        # Only logging.ERROR or higher waits for room
+        thread = threading.Thread(target=below.handle, args=(record(logging.ERROR, "error 1"),))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        below.queue.get()
+        below.queue.task_done()
+        thread.join()
+        self.assertEqual(queued(below), ["warning 1", "error 0", "error 1"])
+        self.assertEqual((below.dropped, below.blocked), (4, 1))
+
+        with self.assertRaises(ValueError):
+            reconplogger._AsyncQueueHandler(logging.NullHandler(), 2, "drop_everything")
+
+        # Policy per handler from the config, kept on reload
+        cfg = {
+            "version": 1,
+            "handlers": {
+                "slow_handler": {
+                    "class": "logging.StreamHandler",
+                    ".": {"queue_size": 5, "backpressure": "block"},
+                }
+            },
+            "loggers": {"backpressure_logger": {"handlers": ["slow_handler"], "level": "DEBUG", "propagate": False}},
+        }
+        logger = reconplogger.logger_setup("backpressure_logger", config=cfg, async_logging=True)
+        async_handler = logger.handlers[0]
+        self.assertEqual((async_handler.policy, async_handler.queue.maxsize), ("block", 5))
+        stats = reconplogger.async_logging_stats()["slow_handler"]
+        self.assertEqual(stats, {"policy": "block", "queue_size": 5, "queued": 0, "dropped": 0, "blocked": 0})
+        cfg["handlers"]["slow_handler"]["."] = {"backpressure": "drop_below_level", "backpressure_level": "ERROR"}
+        reconplogger.reload_config(cfg)
+        self.assertIs(logger.handlers[0], async_handler)
+        self.assertEqual(async_handler.policy, "drop_below_level")
+        self.assertEqual(async_handler.policy_level, logging.ERROR)
+        self.assertEqual(async_handler.queue.maxsize, reconplogger.async_logging_queue_size)
+
+    @patch.dict(os.environ, {"LOGGER_ROOT_HANDLER": "plain_handler", "LOGGER_ASYNC": "true"})
+    def test_async_logging_env_var(self):
+        reconplogger.logger_setup()
+        root = logging.getLogger()
+        self.assertIsInstance(root.handlers[0], reconplogger._AsyncQueueHandler)
+        with patch.dict(os.environ, {"LOGGER_ASYNC": "invalid"}):
+            reconplogger.reset_configs()
+            with self.assertRaises(ValueError):
+                reconplogger.logger_setup()
+
+    def test_buffered_file_handler(self):
+        """BufferedFileHandler writes on size and time thresholds, on ERROR and on close."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        log_file = os.path.join(tmpdir, "buffered.log")
+        logger = logging.getLogger("test_buffered_file_handler")
+        logger.setLevel(logging.DEBUG)
+        handler = reconplogger.add_file_handler(logger, file_path=log_file, format="%(message)s", buffered=True)
+        self.assertIsInstance(handler, reconplogger.BufferedFileHandler)
+        handler.buffer_size = 30
+        try:
+            logger.info("first")
+            self.assertEqual(open(log_file).read(), "")
+            logger.info("second message exceeds size")
+            self.assertEqual(open(log_file).read(), "first\nsecond message exceeds size\n")
+            logger.info("third")
+            logger.error("error")
+            self.assertEqual(open(log_file).read().splitlines()[-2:], ["third", "error"])
+            logger.debug("on close")
+            handler.close()
+            self.assertEqual(open(log_file).read().splitlines()[-1], "on close")
+        finally:
+            logger.removeHandler(handler)
+
+        handler = reconplogger.BufferedFileHandler(log_file, mode="w", flush_interval=0.01)
+        handler.handle(logging.makeLogRecord({"msg": "periodic", "levelno": logging.INFO}))
+        for _ in range(100):
+            if open(log_file).read():
+                break
+            time.sleep(0.01)
+        self.assertEqual(open(log_file).read(), "periodic\n")
+        handler.close()
+
+        # A handler dropped without close is collected and its flush thread ends
+        threads = set(threading.enumerate())
+        handler = reconplogger.BufferedFileHandler(log_file, flush_interval=0.01)
+        (flush_thread,) = set(threading.enumerate()) - threads
+        handler_ref = weakref.ref(handler)
+        del handler
+        gc.collect()
+        self.assertIsNone(handler_ref())
+        flush_thread.join(timeout=1)
+        self.assertFalse(flush_thread.is_alive())
+        self.assertRaises(ValueError, lambda: reconplogger.BufferedFileHandler(log_file, flush_level="INVALID"))
+        shutil.rmtree(tmpdir)
+
+    def test_rotating_file_handler(self):
+        """RotatingFileHandler rotates by size and time, compresses in the background and applies retention."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        log_file = os.path.join(tmpdir, "rotating.log")
+        logger = logging.getLogger("test_rotating_file_handler")
+        logger.setLevel(logging.DEBUG)
+        handler = reconplogger.add_file_handler(
+            logger, file_path=log_file, format="%(message)s", max_bytes=50, backup_count=2, compress="gzip"
+        )
+        self.assertIsInstance(handler, reconplogger.RotatingFileHandler)
+        try:
+            for num in range(10):
+                logger.info(f"message number {num}")
+            reconplogger._rotation_jobs.join()
+            rotated = handler.rotated_files()
+            self.assertEqual(len(rotated), 2)
+            self.assertTrue(all(path.endswith(".gz") for path in rotated))
+            with gzip.open(rotated[-1], "rt") as f:
+                self.assertEqual(f.read(), "message number 6\nmessage number 7\n")
+            self.assertEqual(open(log_file).read(), "message number 8\nmessage number 9\n")
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        # Sizes are counted in encoded bytes, e.g. 2 per "é" in UTF-8
+        handler = reconplogger.RotatingFileHandler(log_file, max_bytes=20, encoding="utf-8")
+        for _ in range(2):
+            handler.handle(logging.makeLogRecord({"msg": "é" * 6, "levelno": logging.INFO}))
+        self.assertEqual(open(log_file, encoding="utf-8").read(), "é" * 6 + "\n")
+        handler.close()
+        reconplogger._rotation_jobs.join()
+        for path in handler.rotated_files():
+            os.remove(path)
+
+        handler = reconplogger.RotatingFileHandler(log_file, interval=0.05, max_age=0.05)
+        handler.handle(logging.makeLogRecord({"msg": "before", "levelno": logging.INFO}))
+        time.sleep(0.1)
+        handler.handle(logging.makeLogRecord({"msg": "after", "levelno": logging.INFO}))
+        reconplogger._rotation_jobs.join()
+        self.assertEqual(open(log_file).read(), "after\n")
+        self.assertEqual(handler.rotated_files(), [])
+        handler.close()
+
+        self.assertRaises(ValueError, lambda: reconplogger.RotatingFileHandler(log_file, compress="invalid"))
+        shutil.rmtree(tmpdir)
+
+    @unittest.skipIf(sys.version_info < (3, 14) and not find_spec("zstandard"), "zstandard package is required")
+    def test_rotating_file_handler_config(self):
+        """RotatingFileHandler configured from a logging config is kept when using a root handler."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        log_file = os.path.join(tmpdir, "rotating.log")
+        config = {
+            "version": 1,
+            "formatters": {"plain": {"format": "%(message)s"}},
+            "handlers": {
+                "plain_handler": {"class": "logging.StreamHandler", "formatter": "plain"},
+                "file_handler": {
+                    "class": "reconplogger.RotatingFileHandler",
+                    "formatter": "plain",
+                    "filename": log_file,
+                    "max_bytes": 10,
+                    "compress": "zstd",
+                },
+            },
+            "loggers": {"plain_logger": {"level": "DEBUG", "handlers": ["plain_handler", "file_handler"]}},
+        }
+        with patch.dict(os.environ, {"LOGGER_ROOT_HANDLER": "plain_handler"}):
+            logger = reconplogger.logger_setup(config=config)
+        self.assertEqual(len(logger.handlers), 1)
+        handler = logger.handlers[0]
+        with capture_logs(logging.getLogger()):
+            logger.warning("first message")
+            logger.warning("second message")
+        reconplogger._rotation_jobs.join()
+        self.assertEqual([os.path.splitext(path)[1] for path in handler.rotated_files()], [".zst"])
+        handler.close()
+        shutil.rmtree(tmpdir)
+
     def test_logger_property(self):
         class MyClass(reconplogger.RLoggerProperty):
             pass
@@ -554,6 +1371,590 @@ class TestReconplogger(unittest.TestCase):
         # After request, ContextVar is reset
         self.assertIsNone(reconplogger.current_correlation_id.get())
 
+    def test_asgi_middleware(self):
+        """CorrelationIdAsgiMiddleware sets/clears current_correlation_id per request task."""
+
+        async def app(scope, receive, send):
+            if scope["type"] == "lifespan":
+                return "lifespan"
+            await receive()
+            cid = reconplogger.current_correlation_id.get()
+            await asyncio.sleep(0)
+            self.assertEqual(reconplogger.current_correlation_id.get(), cid)
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+            await send({"type": "http.response.body", "body": (cid or "").encode()})
+
+        middleware = reconplogger.CorrelationIdAsgiMiddleware(app)
+
+        async def client_get(headers):
+            scope = {"type": "http", "method": "GET", "path": "/id", "headers": headers}
+            messages = []
+
+            async def receive():
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def send(message):
+                messages.append(message)
+
+            await middleware(scope, receive, send)
+            return dict(messages[0]["headers"]), messages[1]["body"].decode()
+
+        async def run_requests():
+            ids = [str(uuid.uuid4()) for _ in range(5)]
+            responses = await asyncio.gather(*[client_get([(b"correlation-id", i.encode())]) for i in ids])
+            responses.append(await client_get([]))
+            return ids, responses
+
+        ids, responses = asyncio.run(run_requests())
+        for correlation_id, (headers, body) in zip(ids, responses):
+            self.assertEqual(body, correlation_id)
+            self.assertEqual(headers[b"correlation-id"], correlation_id.encode())
+
+        # Without header, empty body returned and no Correlation-ID in response
+        headers, body = responses[-1]
+        self.assertEqual(body, "")
+        self.assertEqual(list(headers), [b"content-type"])
+
+        # Headers reused by the app across responses are not modified
+        shared_headers = [(b"content-type", b"text/plain")]
+
+        async def shared_headers_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": shared_headers})
+
+        shared_middleware = reconplogger.CorrelationIdAsgiMiddleware(shared_headers_app)
+        for correlation_id in [b"first", b"second"]:
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            scope = {"type": "http", "headers": [(b"correlation-id", correlation_id)]}
+            asyncio.run(shared_middleware(scope, None, send))
+            self.assertEqual(messages[0]["headers"], [*shared_headers, (b"correlation-id", correlation_id)])
+        self.assertEqual(shared_headers, [(b"content-type", b"text/plain")])
+
+        # Other scope types pass through, and the ContextVar is not left set
+        self.assertEqual(asyncio.run(middleware({"type": "lifespan"}, None, None)), "lifespan")
+        self.assertIsNone(reconplogger.current_correlation_id.get())
+
+    def test_generate_correlation_id(self):
+        """Generated correlation IDs are unique across threads and forked processes, and used by the middlewares."""
+        ids: list = []
+        threads = [
+            threading.Thread(target=lambda: ids.extend(reconplogger.generate_correlation_id() for _ in range(1000)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 4000)
+        self.assertRegex(ids[0], r"^[0-9a-f]{16}-[0-9a-f]{12}$")
+
+        fork = multiprocessing.get_context("fork")
+        parent_end, child_end = fork.Pipe()
+        process = fork.Process(target=lambda: child_end.send(reconplogger.generate_correlation_id()))
+        process.start()
+        child_id = parent_end.recv()
+        process.join()
+        self.assertNotEqual(child_id.split("-")[0], ids[0].split("-")[0])
+
+        def wsgi_app(environ, start_response):
+            start_response("200 OK", [])
+            return [reconplogger.current_correlation_id.get().encode()]
+
+        middleware = reconplogger.CorrelationIdWsgiMiddleware(wsgi_app, generate_ids=True)
+        start_response = Mock()
+        body = middleware({}, start_response)[0].decode()
+        self.assertRegex(body, r"^[0-9a-f]{16}-[0-9a-f]{12}$")
+        self.assertEqual(start_response.call_args.args[1], [("Correlation-ID", body)])
+        self.assertEqual(middleware({"HTTP_CORRELATION_ID": "given"}, start_response), [b"given"])
+
+        async def asgi_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": reconplogger.current_correlation_id.get().encode()})
+
+        messages: list = []
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = reconplogger.CorrelationIdAsgiMiddleware(asgi_app, generate_ids=True)
+        asyncio.run(middleware({"type": "http", "headers": []}, None, send))
+        self.assertEqual(messages[0]["headers"], [(b"correlation-id", messages[1]["body"])])
+        self.assertNotEqual(messages[1]["body"].decode(), body)
+
+    @unittest.skipIf(not Flask, "flask package is required")
+    @unittest.skipIf(not requests, "requests package is required")
+    def test_flask_generated_correlation_id(self):
+        """Requests without Correlation-ID get a generated one, returned and propagated by the requests patch."""
+        app = Flask(__name__)
+        reconplogger.flask_app_logger_setup(app, generate_correlation_ids=True)
+
+        @app.route("/call")
+        def call():
+            with patch.object(requests.sessions.Session, "request_orig", autospec=True) as request_orig:
+                requests.sessions.Session().request("GET", "http://example.com")
+            return request_orig.call_args.kwargs["headers"]["Correlation-ID"]
+
+        with capture_logs(logging.getLogger("plain_logger")):
+            response = app.test_client().get("/call")
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.text, r"^[0-9a-f]{16}-[0-9a-f]{12}$")
+        self.assertEqual(response.headers["Correlation-ID"], response.text)
+
+    def test_log_writer(self):
+        """Records of several processes are emitted by the log writer, with local fallback when it is lost."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        self.addCleanup(shutil.rmtree, tmpdir)
+        socket_path = os.path.join(tmpdir, "writer.sock")
+        log_file = os.path.join(tmpdir, "app.log")
+        extra_file = os.path.join(tmpdir, "extra.log")
+        cfg = {
+            "version": 1,
+            "formatters": {"plain": {"()": "reconplogger.PlainFormatter", "format": "%(levelname)s %(message)s"}},
+            "handlers": {
+                "file": {"class": "logging.FileHandler", "filename": log_file, "formatter": "plain", "delay": True}
+            },
+            "loggers": {"writer_logger": {"handlers": ["file"], "level": "DEBUG"}},
+        }
+        writer = reconplogger.start_log_writer(socket_path, config=copy.deepcopy(cfg))
+        self.addCleanup(writer.terminate)
+
+        logger = reconplogger.logger_setup("writer_logger", config=cfg, log_writer=socket_path)
+        writer_handler = logger.handlers[0]
+        self.assertIsInstance(writer_handler, reconplogger._LogWriterHandler)
+        file_handler = reconplogger.add_file_handler(logger, extra_file, format="%(message)s", level="WARNING")
+        logger.info("from parent")
+
+        def child():
+            logger.warning("from child")
+
+        process = multiprocessing.get_context("fork").Process(target=child)
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+        writer.terminate()
+        writer.join()
+        with open(log_file) as f:
+            self.assertEqual(sorted(f.read().splitlines()), ["INFO from parent", "WARNING from child"])
+        with open(extra_file) as f:
+            self.assertEqual(f.read(), "from child\n")
+        self.assertIsNone(writer_handler.handler.stream)
+        self.assertIsNone(file_handler.handler.stream)
+
+        # Writer lost, records are emitted locally
+        logger.error("writer lost")
+        writer_handler.flush()
+        with open(log_file) as f:
+            self.assertEqual(f.read().splitlines()[-1], "ERROR writer lost")
+
+        reconplogger.reset_configs()
+        self.assertIs(logger.handlers[0], writer_handler.handler)
+
+    def test_flight_recorder(self):
+        """Records are readable after the process is killed, in order after wrapping around the ring."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "flight-{pid}.rec")
+        code = (
+            "import logging, os, signal, reconplogger\n"
+            f"handler = reconplogger.FlightRecorderHandler({path!r}, size=1024)\n"
+            "handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))\n"
+            "logger = logging.getLogger('killed')\n"
+            "logger.addHandler(handler)\n"
+            "logger.setLevel(logging.DEBUG)\n"
+            "for num in range(100):\n"
+            "    logger.debug('record %d', num)\n"
+            "print(os.getpid(), flush=True)\n"
+            "os.kill(os.getpid(), signal.SIGKILL)\n"
+        )
+        process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(process.returncode, -signal.SIGKILL)
+        recorded = reconplogger.read_flight_recorder(path.format(pid=process.stdout.strip()))
+        self.assertGreater(len(recorded), 10)
+        self.assertEqual(recorded, [f"DEBUG record {num}" for num in range(100 - len(recorded), 100)])
+
+        cli = subprocess.run(
+            [sys.executable, "-m", "reconplogger", path.format(pid=process.stdout.strip())],
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(cli.stdout.splitlines(), recorded)
+
+        # A forked child without {pid} in the filename writes its own file
+        shared_path = os.path.join(tmpdir, "shared.rec")
+        handler = reconplogger.FlightRecorderHandler(shared_path, size=1024)
+        self.addCleanup(handler.close)
+        handler.handle(logging.makeLogRecord({"msg": "from parent"}))
+
+        def child():
+            handler.handle(logging.makeLogRecord({"msg": f"from child {os.getpid()}"}))
+
+        process = multiprocessing.get_context("fork").Process(target=child)
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        handler.handle(logging.makeLogRecord({"msg": "from parent again"}))
+        handler.close()
+        self.assertEqual(reconplogger.read_flight_recorder(shared_path), ["from parent", "from parent again"])
+        child_path = f"{shared_path}.{process.pid}"
+        self.assertEqual(reconplogger.read_flight_recorder(child_path), [f"from child {process.pid}"])
+
+        # A forked child that can't create its file disables the recorder instead of failing
+        missing_dir = os.path.join(tmpdir, "missing")
+        os.mkdir(missing_dir)
+        handler = reconplogger.FlightRecorderHandler(os.path.join(missing_dir, "parent.rec"), size=1024)
+        self.addCleanup(handler.close)
+        os.remove(handler.path)
+        os.rmdir(missing_dir)
+
+        def disabled_child():
+            assert handler._mmap is None
+            with patch.object(handler, "handleError", side_effect=AssertionError("handleError called")):
+                handler.handle(logging.makeLogRecord({"msg": "not recorded"}))
+
+        with patch("sys.stderr", StringIO()):  # the child reports the failure once
+            process = multiprocessing.get_context("fork").Process(target=disabled_child)
+            process.start()
+            process.join()
+        self.assertEqual(process.exitcode, 0)
+        handler.close()
+
+        with self.assertRaises(ValueError):
+            reconplogger.FlightRecorderHandler(path, size=100)
+        not_recorder = os.path.join(tmpdir, "not_recorder")
+        with open(not_recorder, "w") as f:
+            f.write("not a flight recorder")
+        with self.assertRaises(ValueError):
+            reconplogger.read_flight_recorder(not_recorder)
+
+        # Recorder at DEBUG on the root next to the stdout handler at WARNING
+        cfg = {
+            "version": 1,
+            "formatters": {"plain": {"()": "reconplogger.PlainFormatter", "format": "%(levelname)s %(message)s"}},
+            "handlers": {
+                "plain_handler": {"class": "logging.StreamHandler", "formatter": "plain", "level": "WARNING"},
+                "flight_recorder": {
+                    "class": "reconplogger.FlightRecorderHandler",
+                    "formatter": "plain",
+                    "level": "DEBUG",
+                    "filename": path,
+                },
+            },
+            "loggers": {"recorded_logger": {"handlers": ["plain_handler"], "level": "DEBUG"}},
+        }
+        env = {"LOGGER_ROOT_HANDLER": "plain_handler, flight_recorder", "LOGGER_ROOT_LEVEL": "WARNING"}
+        with patch.dict(os.environ, env):
+            logger = reconplogger.logger_setup("recorded_logger", config=cfg, level="WARNING")
+        root = logging.getLogger()
+        recorder = root.handlers[1]
+        self.assertIsInstance(recorder, reconplogger.FlightRecorderHandler)
+        self.addCleanup(recorder.close)
+        self.assertEqual(root.level, logging.DEBUG)
+        with capture_logs(root) as logs:
+            logger.debug("only recorded")
+            logger.warning("both")
+        self.assertEqual(logs.getvalue(), "WARNING both\n")
+        self.assertEqual(reconplogger.read_flight_recorder(recorder.path), ["DEBUG only recorded", "WARNING both"])
+        reconplogger.reset_configs()
+
+    def test_counters_in_threads(self):
+        """The counters of the sampling filter and of handler metrics don't lose updates across threads."""
+        sampling = reconplogger.CorrelationIdSamplingFilter(rate=0.0)
+        handler = logging.StreamHandler(StringIO())
+        reconplogger._instrument_handler(handler, "threads")
+        self.addCleanup(reconplogger._disable_handler_metrics)
+        record = logging.makeLogRecord(
+            {"msg": "message", "levelno": logging.INFO, "levelname": "INFO", "correlation_id": "dropped"}
+        )
+
+        def work():
+            for _ in range(2000):
+                sampling.filter(record)
+                handler.handle(record)
+
+        torn = []
+
+        def snapshots():
+            while any(thread.is_alive() for thread in threads[:-1]):
+                metrics = reconplogger.handler_metrics()["threads"]
+                emit = metrics["emit"]
+                if not sum(metrics["records"].values()) == emit["count"] == emit["buckets"][float("inf")]:
+                    torn.append(metrics)
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=work) for _ in range(8)]
+            threads.append(threading.Thread(target=snapshots))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(sampling.dropped, 16000)
+        self.assertEqual(torn, [])
+        metrics = reconplogger.handler_metrics()["threads"]
+        self.assertEqual((metrics["records"], metrics["emit"]["count"]), ({"INFO": 16000}, 16000))
+
+    def test_handler_metrics(self):
+        """Instrumented handlers report counts by level, filtered records, errors and stage histograms."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cfg = {
+            "version": 1,
+            "formatters": {"plain": {"()": "reconplogger.PlainFormatter", "format": "%(levelname)s %(message)s"}},
+            "filters": {"no_secrets": {"()": "logging.Filter", "name": "metrics_logger.public"}},
+            "handlers": {
+                "plain_handler": {"class": "logging.StreamHandler", "formatter": "plain", "filters": ["no_secrets"]}
+            },
+            "loggers": {"metrics_logger": {"handlers": ["plain_handler"], "level": "DEBUG", "propagate": False}},
+        }
+        handler = reconplogger.logger_setup("metrics_logger", config=cfg).handlers[0]
+        self.assertEqual(reconplogger.handler_metrics(), {})
+        self.assertNotIn("emit", vars(handler))
+
+        with patch.dict(os.environ, {"LOGGER_METRICS": "true"}):
+            reconplogger.reset_configs()
+            logger = reconplogger.logger_setup("metrics_logger", config=cfg)
+        handler = logger.handlers[0]
+        file_path = os.path.join(tmpdir, "metrics.log")
+        reconplogger.add_file_handler(logger, file_path, level="WARNING")
+        public = logging.getLogger("metrics_logger.public")
+        with capture_logs(logger) as logs:
+            public.info("one")
+            public.info("two")
+            public.warning("three")
+            logger.warning("secret")
+        self.assertEqual(logs.getvalue(), "INFO one\nINFO two\nWARNING three\n")
+        with patch.object(handler, "stream", None):
+            with patch("sys.stderr", StringIO()):
+                public.error("broken stream")
+
+        metrics = reconplogger.handler_metrics()
+        self.assertEqual(set(metrics), {"plain_handler", "file:" + file_path})
+        plain = metrics["plain_handler"]
+        self.assertEqual(plain["class"], "StreamHandler")
+        self.assertEqual(plain["records"], {"INFO": 2, "WARNING": 1, "ERROR": 1})
+        self.assertEqual((plain["filtered"], plain["errors"], plain["dropped"]), (1, 1, 0))
+        self.assertEqual(plain["filter"]["count"], 5)
+        self.assertEqual(plain["format"]["count"], 4)
+        self.assertEqual(plain["emit"]["count"], 4)
+        self.assertEqual(plain["emit"]["buckets"][float("inf")], 4)
+        self.assertGreater(plain["emit"]["sum_ns"], 0)
+        self.assertEqual(metrics["file:" + file_path]["records"], {"WARNING": 2, "ERROR": 1})
+
+        text = reconplogger.handler_metrics_prometheus()
+        self.assertIn('reconplogger_handler_records_total{handler="plain_handler",level="INFO"} 2\n', text)
+        self.assertIn('reconplogger_handler_filtered_total{handler="plain_handler"} 1\n', text)
+        self.assertIn(
+            'reconplogger_handler_stage_seconds_bucket{handler="plain_handler",stage="emit",le="+Inf"} 4', text
+        )
+        self.assertIn('reconplogger_handler_stage_seconds_count{handler="plain_handler",stage="format"} 4\n', text)
+
+        # A handler recreated by a reload is instrumented, the closed one is no longer reported
+        cfg["handlers"]["plain_handler"]["stream"] = "ext://sys.stderr"
+        reconplogger.reload_config(cfg)
+        self.assertIsNot(logger.handlers[0], handler)
+        self.assertEqual(reconplogger.handler_metrics()["plain_handler"]["records"], {})
+
+        reconplogger.reset_configs()
+        self.assertEqual(reconplogger.handler_metrics(), {})
+        self.assertNotIn("emit", vars(logger.handlers[0]))
+
+    def test_optimize_record_attributes(self):
+        """Only the record attributes referenced by formatters and filters are computed."""
+        tmpdir = tempfile.mkdtemp(prefix="_reconplogger_test_")
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cfg = {
+            "version": 1,
+            "formatters": {"plain": {"()": "reconplogger.PlainFormatter", "format": "%(levelname)s %(message)s"}},
+            "handlers": {"plain_handler": {"class": "logging.StreamHandler", "formatter": "plain"}},
+            "loggers": {"slim_logger": {"handlers": ["plain_handler"], "level": "DEBUG", "propagate": False}},
+        }
+        with ExitStack() as stack:
+            # Only the loggers of this test, and not the capture handler of pytest
+            stack.enter_context(patch.dict(logging.Logger.manager.loggerDict, clear=True))
+            stack.enter_context(patch.object(logging.getLogger(), "handlers", []))
+            stack.enter_context(patch.dict(os.environ, {"LOGGER_SLIM_RECORDS": "true"}))
+            logger = reconplogger.logger_setup("slim_logger", config=cfg)
+            self.assertIs(logging.getLogRecordFactory(), reconplogger._SlimLogRecord)
+            self.assertIsNone(logging._srcfile)
+            self.assertFalse(logging.logThreads or logging.logProcesses or logging.logMultiprocessing)
+            records = []
+            with patch.object(logger.handlers[0], "handle", records.append):
+                logger.info("slim %s", "record")
+            record = records[0]
+            self.assertEqual(record.getMessage(), "slim record")
+            self.assertEqual((record.thread, record.process, record.funcName), (None, None, "(unknown function)"))
+            self.assertNotIn("filename", vars(record))
+            self.assertEqual(record.filename, "(unknown file)")
+            with capture_logs(logger) as logs:
+                logger.info("slim message")
+            self.assertEqual(logs.getvalue(), "INFO slim message\n")
+
+            # A file handler with the reconplogger format requires the caller
+            log_file = os.path.join(tmpdir, "slim.log")
+            reconplogger.add_file_handler(logger, log_file, format="%(filename)s:%(lineno)s %(threadName)s %(message)s")
+            self.assertIsNotNone(logging._srcfile)
+            self.assertTrue(logging.logThreads)
+            self.assertFalse(logging.logProcesses)
+            with capture_logs(logger):
+                logger.info("with caller")
+            with open(log_file) as f:
+                self.assertRegex(f.read(), r"^reconplogger_tests.py:\d+ MainThread with caller\n$")
+
+            # Unknown handler types disable the optimization
+            logger.addHandler(logging.handlers.BufferingHandler(10))
+            self.assertIsNone(reconplogger.optimize_record_attributes())
+            self.assertIs(logging.getLogRecordFactory(), logging.LogRecord)
+
+            reconplogger.reset_configs()
+        self.assertIs(logging.getLogRecordFactory(), logging.LogRecord)
+        self.assertTrue(logging.logThreads and logging.logProcesses)
+        self.assertIsNotNone(logging._srcfile)
+
+    @patch.dict(os.environ, {"LOGGER_CACHE_CALLERS": "true"})
+    def test_caller_caching_logger(self):
+        """Caller information is cached by call site and equal to that of the stock Logger."""
+        logger = reconplogger.logger_setup("plain_logger", level="DEBUG")
+        self.assertIs(type(logger), reconplogger.CallerCachingLogger)
+        self.assertIs(type(logging.getLogger("test_caller_caching_logger.new")), reconplogger.CallerCachingLogger)
+        stock = logging.Logger("stock")
+
+        def callers(lg, **kwargs):
+            records = []
+            with patch.object(lg, "handle", records.append):
+                for _ in range(2):
+                    lg.info("first site", **kwargs)
+                    lg.info("second site", **kwargs)
+                reconplogger.log_event(lg, "event site")
+                logging.LoggerAdapter(lg, {}).info("adapter site", **kwargs)
+            return [(r.pathname, r.lineno, r.funcName) for r in records]
+
+        cached = callers(logger)
+        self.assertEqual(cached, callers(stock))
+        self.assertEqual(cached[0], cached[2])
+        self.assertNotEqual(cached[0][1], cached[1][1])
+        self.assertEqual(cached[0][2], "callers")
+
+        def wrapper(lg):
+            return callers(lg, stacklevel=2)
+
+        self.assertEqual(wrapper(logger), wrapper(stock))
+        self.assertEqual(wrapper(logger)[0][2], "wrapper")
+
+        records = []
+        with patch.object(logger, "handle", records.append):
+            logger.info("with stack", stack_info=True)
+        self.assertEqual(records[0].funcName, "test_caller_caching_logger")
+        self.assertIn("test_caller_caching_logger", records[0].stack_info.splitlines()[-2])
+
+        reconplogger.reset_configs()
+        self.assertIs(type(logger), logging.Logger)
+        self.assertIs(logging.getLoggerClass(), logging.Logger)
+
+    def test_exception_formatting_cache(self):
+        """Tracebacks are formatted once per fingerprint, and can be structured in JSON."""
+
+        def fail(value):
+            try:
+                {}["key"]
+            except KeyError as ex:
+                raise RuntimeError(f"failed {len(value)}") from ex
+
+        def exc_info(value):
+            try:
+                fail(value)
+            except RuntimeError:
+                return sys.exc_info()
+
+        reconplogger._exception_cache.clear()
+        formatter = reconplogger.PlainFormatter()
+        with patch("traceback.print_exception", wraps=traceback.print_exception) as print_exception:
+            texts = [formatter.formatException(exc_info(key)) for key in ["a", "b", "cc"]]
+        self.assertEqual(print_exception.call_count, 2)  # "a" and "b" give the same message
+        self.assertEqual(texts[0], texts[1])
+        self.assertEqual(texts[0], logging.Formatter().formatException(exc_info("a")))
+        self.assertIn("RuntimeError: failed 2", texts[2])
+
+        # Failures of different expressions in the same line are told apart
+        def add_first(a, b):
+            return a[0] + b[0]
+
+        for args in [(None, [1]), ([1], None)]:
+            try:
+                add_first(*args)
+            except TypeError:
+                same_line = sys.exc_info()
+            self.assertEqual(formatter.formatException(same_line), logging.Formatter().formatException(same_line))
+
+        with patch.object(reconplogger, "exception_cache_size", 1):
+            formatter.formatException(exc_info("ddd"))
+            self.assertEqual(len(reconplogger._exception_cache), 1)
+
+        json_formatter = reconplogger.JsonFormatter(structured_exc_info=True, exc_max_frames=1, exc_max_size=8)
+        record = logging.makeLogRecord({"msg": "failure", "exc_info": exc_info("x" * 20)})
+        structured = json.loads(json_formatter.format(record))["exc_info"]
+        self.assertEqual(structured["type"], "RuntimeError")
+        self.assertEqual(structured["message"], "failed 2...")
+        self.assertEqual(structured["frames_omitted"], 1)
+        self.assertEqual([f["function"] for f in structured["frames"]], ["fail"])
+        self.assertEqual(structured["frames"][0]["line"], "raise Ru...")
+        self.assertEqual(structured["cause"]["type"], "KeyError")
+        self.assertEqual(structured["cause"]["message"], "'key'")
+
+        if hasattr(reconplogger.JsonFormatter(), "exc_info_as_array"):  # python-json-logger 4.0+
+            array_formatter = reconplogger.JsonFormatter(exc_info_as_array=True)
+            lines = json.loads(array_formatter.format(record))["exc_info"]
+            self.assertEqual(lines[-1], "RuntimeError: failed 20")
+
+    def test_formatter_size_limits(self):
+        """Long messages, fields and exception texts are cut before formatting, keeping their size."""
+        try:
+            raise ValueError("v" * 100)
+        except ValueError:
+            exc_info = sys.exc_info()
+        record = logging.getLogger("limits").makeRecord(
+            "limits", logging.ERROR, __file__, 10, "%s", ("m" * 100,), exc_info, extra={"payload": "é" * 50}
+        )
+
+        plain = reconplogger.PlainFormatter("%(message)s|%(payload)s", max_message_bytes=10, max_field_bytes=21)
+        message, _, exc_text = plain.format(record).partition("\n")
+        self.assertEqual(message, "mmmmmmmmmm... [truncated, 100 bytes]|éééééééééé... [truncated, 100 bytes]")
+        self.assertTrue(exc_text.startswith("Traceback (most"))
+        self.assertTrue(exc_text.endswith(" bytes]"))
+        self.assertEqual(record.payload, "é" * 50)
+        self.assertIn("v" * 100, record.exc_text)
+
+        json_formatter = reconplogger.JsonFormatter(max_message_bytes=10, max_field_bytes=21)
+        data = json.loads(json_formatter.format(record))
+        self.assertEqual(data["message"], "mmmmmmmmmm... [truncated, 100 bytes]")
+        self.assertEqual(data["payload"], "éééééééééé... [truncated, 100 bytes]")
+        self.assertRegex(data["exc_info"], r"^Traceback \(most recen\.\.\. \[truncated, \d+ bytes\]$")
+
+        # The msg and str args are cut before interpolating them, other args after
+        plain = reconplogger.PlainFormatter(max_message_bytes=10)
+        record = logging.makeLogRecord({"msg": "%(key)s!", "args": {"key": "k" * 100}})
+        self.assertEqual(plain.format(record), "kkkkkkkkkk... [truncated, 101 bytes]")
+        record = logging.makeLogRecord({"msg": "x" * 100 + " %s", "args": ("arg",)})
+        self.assertEqual(plain.format(record), "xxxxxxxxxx... [truncated, 103 bytes]")
+        record = logging.makeLogRecord({"msg": "%s", "args": (list(range(100)),)})
+        self.assertEqual(plain.format(record), "[0, 1, 2, ... [truncated, 390 bytes]")
+        self.assertEqual(record.args, (list(range(100)),))
+
+        short = logging.makeLogRecord({"msg": "short", "payload": "short"})
+        plain = reconplogger.PlainFormatter("%(message)s|%(payload)s", max_message_bytes=10, max_field_bytes=21)
+        self.assertEqual(plain.format(short), "short|short")
+        with patch.object(reconplogger, "formatter_max_message_bytes", 3):
+            self.assertEqual(reconplogger.PlainFormatter().format(short), "sho... [truncated, 5 bytes]")
+            self.assertEqual(
+                json.loads(reconplogger.JsonFormatter().format(short))["message"], "sho... [truncated, 5 bytes]"
+            )
+
 
 def run_tests():
     tests = unittest.defaultTestLoader.loadTestsFromTestCase(TestReconplogger)